@@ -3,182 +3,166 @@ import math
 import logging
 import numpy as np
 import pandas as pd
-import holidays
 import jv
 from datetime import datetime, date, timedelta
-from dateutil.relativedelta import relativedelta
 from typing import Optional, List
 from xlsxwriter.utility import xl_col_to_name
 from Sandbox.horizon.PFE_Calculator.models.common import (
     CURVE_MAPPING_LIST,
-    MONTH_CODE_MAP,
     querys,
     prd_db,
 )
+from Done.Pculator.columnar import (
+    deliver_month_to_date,
+    time_to_expiry,
+    pfe_vectorized,
+)
+from Done.Pculator.vol_store import VolStore
+from Done.Pculator.vol_cache import VolCache, JvVolLoader
+from Done.Pculator.tenor import (
+    NAT_ORDINAL,
+    TenorIndex,
+    date_to_ordinal,
+    label_to_ordinal,
+    month_end,
+    ordinal_to_label,
+)
+from Done.Pculator.business_calendar import get_calendar
+from Done.Pculator.curve_registry import CurveRegistry
+from Done.Pculator.covariance import CovarianceEngine
+from Done.Pculator.correlation import CorrelationMatrix, cov_to_corr
+from Done.Pculator import diversification
+from Done.Pculator.monte_carlo import DEFAULT_BLOCK_BYTES, build_model, simulate_profile
+from Done.Pculator.streaming import DEFAULT_CHUNK_SIZE, OUTPUT_FORMATS, ChunkWriter, iter_chunks, write_frame
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Hash lookups over CURVE_MAPPING_LIST, built once per process
+CURVE_REGISTRY = CurveRegistry(CURVE_MAPPING_LIST)
+
+# Columns summed into the running totals of a streaming run
+STREAM_SUM_COLS = ['Existing_MTM', 'position', 'PFE_Value', 'PFE_Output', 'Total_Exposure']
+
+# Excel column widths are estimated from a bounded sample instead of every cell
+WIDTH_SAMPLE_ROWS = 1000
+MAX_COL_WIDTH = 60
+
 
 class PFEEngine:
     """
     Engine to process Potential Future Exposure (PFE) calculations and template management.
     """
 
-    def __init__(self, template_path: str = 'PFE_template.xlsx'):
+    def __init__(self, template_path: str = 'PFE_template.xlsx', columnar: bool = True,
+                 vol_data: Optional[pd.DataFrame] = None, vol_cache_dir: Optional[str] = None,
+                 netting_cols: Optional[List[str]] = None, workers: int = 0):
         self.template_path = template_path
-        # Preload volatility data
-        self.vol_data = jv.download_data_db(querys.viya_vol, connection_type=prd_db)
-        # Initialize empty holidays - will be dynamically updated
-        self.us_holidays = holidays.US(years=[])
+        # Diversification groups: as_of_date plus optional counterparty / netting-set columns
+        self.netting_cols = list(netting_cols or [])
+        # Process-pool size for Monte Carlo path blocks (0/1 = serial)
+        self.workers = workers
+        # Columnar (whole-array) pricing by default; row-wise path kept for reference/benchmarks
+        self.columnar = columnar
+        # Preload volatility data (local Parquet cache + incremental refresh when a cache dir is given)
+        if vol_data is None and vol_cache_dir:
+            vol_data = VolCache(vol_cache_dir, JvVolLoader(querys.viya_vol, prd_db)).load()
+        elif vol_data is None:
+            vol_data = jv.download_data_db(querys.viya_vol, connection_type=prd_db)
+        self.vol_data = vol_data
+        self.vol_store = VolStore(vol_data)
+        self.tenor_index = TenorIndex.from_vol_data(vol_data)
+        # EWMA covariance state, only new pricing days are loaded on later as-of dates
+        self.cov_engine = CovarianceEngine(self.load_prices)
 
     @staticmethod
     def get_prod_list() -> list[str]:
         """
         Return sorted unique list of products (commodities).
         """
-        return sorted({row['commodity'] for _, row in CURVE_MAPPING_LIST.iterrows()})
+        return CURVE_REGISTRY.commodities
 
     @staticmethod
     def convert_deliver_month_to_date(date_str: str) -> date | None:
         """
         Convert 'MMM-YY' string to last day of that month.
         """
-        try:
-            month_str, year_short = date_str.split('-')
-            # Handle two-digit year conversion
-            full_year = 2000 + int(year_short) if int(year_short) < 100 else int(year_short)
-            first = datetime.strptime(f"{month_str}-{full_year}", "%b-%Y")
-            last = (first.replace(day=1) + relativedelta(months=1) - relativedelta(days=1)).date()
-            return last
-        except Exception as e:
-            logger.warning(f"Invalid deliver_month '{date_str}': {str(e)}")
+        ordinal = label_to_ordinal([date_str])[0]
+        if ordinal == NAT_ORDINAL:
+            logger.warning(f"Invalid deliver_month '{date_str}'")
             return None
+        return month_end(ordinal).item()
 
     @staticmethod
     def deliver_month_list(years: int = 5) -> list[str]:
         """
         Generate future 'MMM-YY' labels for next N years.
         """
-        today = datetime.today().replace(day=1)
-        end = today + relativedelta(years=years, day=31)
-        months = pd.date_range(start=today, end=end, freq='M')
-        return [d.strftime('%b-%y') for d in months]
+        this_month = date_to_ordinal([datetime.today()])[0]
+        return list(ordinal_to_label(np.arange(this_month, this_month + 12 * years + 1)))
 
     def get_aod_list(self, days: int = 31) -> list[str]:
         """
         Recent workdays (YYYY-MM-DD), excluding weekends and US holidays.
         """
-        today = datetime.today().date()
-        start_date = today - timedelta(days=days)
-
-        # Update holidays to cover the required date range
-        years = range(start_date.year, today.year + 1)
-        if years:
-            self.us_holidays = holidays.US(years=years)
-
-        workdays = []
-        current = today
-        while len(workdays) < days:
-            current -= timedelta(days=1)
-            if current.weekday() < 5 and current not in self.us_holidays:
-                workdays.append(current.strftime('%Y-%m-%d'))
-        return workdays
+        aods = get_calendar().last_n_business_days(datetime.today().date(), days)
+        return list(np.datetime_as_string(aods, unit='D'))
 
     @staticmethod
     def risk_cr(commodity: str, origin: str) -> str:
         """
         Lookup curve root by commodity and destination.
         """
-        df = CURVE_MAPPING_LIST
-        sel = df[(df['commodity'] == commodity) & (df['destination'] == origin)]['Curve_Root']
-        if sel.empty:
+        root = CURVE_REGISTRY.curve_root(commodity, origin)
+        if root is None:
             logger.error(f"No curve root found for commodity '{commodity}' and origin '{origin}'")
             return "UNKNOWN"
-        return sel.item()
+        return root
 
     def get_date_list(self, risk_curve_root: str) -> list[date]:
         """
         Available factor dates (first of month) for a given curve root.
         """
-        pattern = fr'^{risk_curve_root}_[A-Z][0-9]{{2}}$'
-        mask = self.vol_data['RISK_FACTOR'].str.contains(pattern, regex=True, na=False)
-        if not mask.any():
+        dates = self.tenor_index.months(risk_curve_root)
+        if not dates:
             logger.warning(f"No volatility data found for curve root: {risk_curve_root}")
-            return []
-        code_to_mon = {v: k for k, v in MONTH_CODE_MAP.items()}
-        dates = set()
-        for factor in self.vol_data.loc[mask, 'RISK_FACTOR']:
-            code = factor.split('_')[-1]
-            mon_code, yr = code[0], code[1:]
-            mon = code_to_mon.get(mon_code)
-            if mon:
-                try:
-                    dt = datetime.strptime(f"{mon}-{yr}", "%b-%y").date().replace(day=1)
-                    dates.add(dt)
-                except ValueError:
-                    logger.warning(f"Invalid date code in factor: {factor}")
-        return sorted(dates, reverse=True)
+        return dates
 
-    def match_curve(self, risk_curve_root: str, deliver_month: str) -> str | None:
+    def match_curve(self, risk_curve_root: str, deliver_month: str, clamp: bool = True) -> str | None:
         """
         Find nearest RISK_FACTOR code for given deliver_month.
         """
-        try:
-            target = datetime.strptime(deliver_month, "%b-%y").date().replace(day=1)
-        except ValueError:
+        if label_to_ordinal([deliver_month])[0] == NAT_ORDINAL:
             logger.error(f"Invalid deliver_month format: {deliver_month}")
             return None
 
-        dates = self.get_date_list(risk_curve_root)
-        if not dates:
+        factor = self.tenor_index.match(risk_curve_root, deliver_month, clamp=clamp)
+        if factor is None:
             logger.warning(f"No available dates for curve root: {risk_curve_root}")
-            return None
-
-        # Find the nearest date
-        nearest = min(dates, key=lambda d: abs((d - target).days))
-        mon_code = next((k for k, v in MONTH_CODE_MAP.items() if v == nearest.strftime('%b')), None)
-        if not mon_code:
-            logger.error(f"Month code not found for date: {nearest}")
-            return None
+        return factor
 
-        yr = str(nearest.year)[-2:]
-        return f"{risk_curve_root}_{mon_code}{yr}"
+    def match_curves(self, roots: pd.Series, deliver_months: pd.Series, clamp: bool = True) -> np.ndarray:
+        """
+        Vectorized match_curve over whole columns (binary search in the tenor index).
+        """
+        factors = self.tenor_index.match_many(roots, deliver_months, clamp=clamp)
+        if (missing := pd.isna(factors)).any():
+            logger.warning(f"No matching risk factor for {int(missing.sum())} contracts")
+        return factors
 
     def get_vol(self, risk_curve: str, as_of: date) -> float | None:
         """
-        Fetch annualized volatility (sqrt(252)) from vol_data.
+        Fetch annualized volatility (sqrt(252)) from the vol store.
         """
         if not risk_curve:
             return None
 
-        # Try to get volatility from the exact date
-        sel = self.vol_data[
-            (self.vol_data['RISK_FACTOR'] == risk_curve) &
-            (self.vol_data['AS_OF_DATE'] == pd.to_datetime(as_of))
-            ]
-
-        # If not found, try recent dates
-        if sel.empty:
-            for days_back in [1, 2, 3, 7]:
-                target_date = as_of - timedelta(days=days_back)
-                sel = self.vol_data[
-                    (self.vol_data['RISK_FACTOR'] == risk_curve) &
-                    (self.vol_data['AS_OF_DATE'] == pd.to_datetime(target_date))
-                    ]
-                if not sel.empty:
-                    break
-
-        if sel.empty:
+        # Latest vol on or before as_of, up to a week old
+        vol = self.vol_store.get(risk_curve, as_of, max_days_back=7)
+        if vol is None:
             logger.warning(f"No volatility found for {risk_curve} as of {as_of} (and recent days)")
             return None
-
-        try:
-            val = sel['VOLATILITY'].iloc[0]
-            return float(val * math.sqrt(252))  # Annualize daily volatility
-        except Exception as e:
-            logger.error(f"Error processing volatility for {risk_curve}: {str(e)}")
-            return None
+        return float(vol * math.sqrt(252))  # Annualize daily volatility
 
     @staticmethod
     def calculate_time_to_expiry(as_of: date, delivery: date) -> float:
@@ -216,78 +200,50 @@ class PFEEngine:
 
     @staticmethod
     def cov_to_corr(cov_matrix: np.ndarray) -> np.ndarray:
-        """Convert covariance matrix to correlation matrix"""
-        std_dev = np.sqrt(np.diag(cov_matrix))
-        denom = np.outer(std_dev, std_dev)
-        corr_matrix = cov_matrix / denom
-        return corr_matrix
-
-    def get_cov_matrix(self, risk_curve_list: list, as_of_d: date, history_length: int = 121) -> np.ndarray:
-        """Compute covariance matrix for risk curves"""
-
-        # Get initial date
-        def get_ini_date(as_of_date: date, his_len: int) -> date:
-            us_holidays = holidays.US()
-            end_date = as_of_date
-            start_date = end_date - timedelta(days=300)
-            all_days = pd.date_range(start=start_date, end=end_date)
-            biz_days = [d for d in all_days if d.weekday() < 5 and d not in us_holidays]
-            target_date = biz_days[-(his_len + 2)]
-            return target_date.date()
-
-        # Compute EWMA volatility
-        def compute_vol_ewma(price_df: pd.DataFrame, lambda_: float = 0.94) -> np.ndarray:
-            log_returns = np.log(price_df / price_df.shift(1)).dropna()
-            n = len(log_returns)
-            weights = np.array([lambda_ ** (n - 1 - i) for i in range(n)], dtype=float)
-            weights /= weights.sum()
-            weighted_returns = log_returns * np.sqrt(weights)[:, np.newaxis]
-            cov_matrix = weighted_returns.T @ weighted_returns
-            return cov_matrix.values if isinstance(cov_matrix, pd.DataFrame) else cov_matrix
+        """Convert covariance matrix to correlation matrix (flat curves -> uncorrelated)"""
+        return cov_to_corr(cov_matrix)
 
+    def load_prices(self, risk_curve_list: list, start: date, end: date) -> pd.DataFrame:
+        """Close prices (pricing date x curve) for risk curves between start and end"""
         cursor_download, con_download = jv.get_cursor_con(prd_db)
-        first_pricing_date = get_ini_date(as_of_d, history_length)
         query_price_curve = "', '".join(risk_curve_list)
         query_price_curve = jv.convert_in_to_or(f"SHORT_PRICE_CURVE in ('{query_price_curve}')")
 
         query_prices = f"""
             SELECT PRICING_DATE, SHORT_PRICE_CURVE, CLOSE_PRICE 
             FROM {jv.DataTable.PRICE.value}
-            WHERE PRICING_DATE <= date'{as_of_d.strftime('%Y-%m-%d')}'
-              AND PRICING_DATE >= date'{first_pricing_date.strftime('%Y-%m-%d')}'
+            WHERE PRICING_DATE <= date'{end.strftime('%Y-%m-%d')}'
+              AND PRICING_DATE >= date'{start.strftime('%Y-%m-%d')}'
               AND ({query_price_curve})
         """
 
         price_db = jv.download_data_db(query_prices, cursor_download)
-        price_df = jv.format_price_by_col(
+        return jv.format_price_by_col(
             price_db,
             pricing_date_col="PRICING_DATE",
             curve_name="SHORT_PRICE_CURVE",
             close_price="CLOSE_PRICE"
         )
-        return compute_vol_ewma(price_df)
 
-    def process_dataframe(self, df: pd.DataFrame) -> pd.DataFrame:
+    def get_cov_matrix(self, risk_curve_list: list, as_of_d: date, history_length: int = 121) -> np.ndarray:
+        """Compute covariance matrix for risk curves (EWMA, memoized and rolled forward day by day)"""
+        return self.cov_engine.get(risk_curve_list, as_of_d, history_length=history_length)
+
+    def get_corr_matrix(self, risk_curve_list: list, as_of_d: date, history_length: int = 121) -> CorrelationMatrix:
         """
-        Full PFE pipeline: date conversion, curve matching, vol fetch, PFE & exposure.
+        Validated (PSD-repaired) correlation for risk curves, memoized with its factor. Only a
+        missing price history falls back to the identity; loader errors propagate.
         """
-        req = ['as_of_date', 'product', 'origin', 'deliver_month', 'direction', 'contract_price', 'Existing_MTM']
-        if missing := set(req) - set(df.columns):
-            logger.error(f"Missing required columns: {missing}")
-            return df
-
-        # Data validation
-        if df['contract_price'].lt(0).any():
-            logger.warning("Negative contract prices found. Check data validity.")
-
-        # Ensure position column exists and validate
-        if 'position' not in df.columns:
-            df['position'] = 1
-        elif df['position'].eq(0).any():
-            logger.warning("Zero positions found. May affect exposure calculations.")
+        try:
+            return self.cov_engine.get_corr(risk_curve_list, as_of_d, history_length=history_length)
+        except ValueError as e:
+            logger.error(f"无价格历史, 使用单位矩阵: {str(e)}")
+            return CorrelationMatrix.identity(len(risk_curve_list), risk_curve_list)
 
-        # Convert dates
-        df['as_of_date'] = pd.to_datetime(df['as_of_date']).dt.date
+    def _price_rows(self, df: pd.DataFrame) -> None:
+        """
+        Row-wise pricing (one df.apply pass per step).
+        """
         df['delivery_date'] = df['deliver_month'].apply(self.convert_deliver_month_to_date)
 
         # Calculate time to expiry
@@ -322,10 +278,113 @@ class PFEEngine:
             axis=1
         )
 
+    def _price_columnar(self, df: pd.DataFrame) -> None:
+        """
+        Columnar pricing: same columns as _price_rows, computed as whole-array operations.
+        """
+        delivery = deliver_month_to_date(df['deliver_month'])
+        df['delivery_date'] = delivery.dt.date
+        df['time_to_exp'] = time_to_expiry(df['as_of_date'], delivery)
+
+        # Curve root via one hash lookup on (commodity, destination)
+        df['Risk_Curve'] = CURVE_REGISTRY.map_roots(df['product'], df['origin'])
+
+        # Match curve only for live contracts, then join volatility on (factor, as_of)
+        live = df['time_to_exp'].to_numpy() > 0
+        factors = np.full(len(df), None, dtype=object)
+        if live.any():
+            factors[live] = self.match_curves(df.loc[live, 'Risk_Curve'], df.loc[live, 'deliver_month'])
+        df['contract_vol'] = self.vol_store.get_many(factors, df['as_of_date'], max_days_back=7) * math.sqrt(252)
+
+        df['PFE_Value'] = pfe_vectorized(
+            df['direction'],
+            df['contract_price'].to_numpy(dtype=float),
+            df['contract_vol'].to_numpy(),
+            df['time_to_exp'].to_numpy()
+        )
+
+    def process_dataframe(self, df: pd.DataFrame, diversified: bool = True) -> pd.DataFrame:
+        """
+        Full PFE pipeline: date conversion, curve matching, vol fetch, PFE & exposure.
+        """
+        req = ['as_of_date', 'product', 'origin', 'deliver_month', 'direction', 'contract_price', 'Existing_MTM']
+        if missing := set(req) - set(df.columns):
+            logger.error(f"Missing required columns: {missing}")
+            return df
+
+        # Data validation
+        if df['contract_price'].lt(0).any():
+            logger.warning("Negative contract prices found. Check data validity.")
+
+        # Ensure position column exists and validate
+        if 'position' not in df.columns:
+            df['position'] = 1
+        elif df['position'].eq(0).any():
+            logger.warning("Zero positions found. May affect exposure calculations.")
+
+        # Convert dates
+        df['as_of_date'] = pd.to_datetime(df['as_of_date']).dt.date
+        if self.columnar:
+            self._price_columnar(df)
+        else:
+            self._price_rows(df)
+
         # Calculate outputs
         df['PFE_Output'] = df['PFE_Value'] * df['position']
         df['Total_Exposure'] = df['PFE_Output'] + df['Existing_MTM']
 
+        if diversified:
+            self.add_diversified_pfe(df)
+
+        return df
+
+    def diversified_pfe(self, s: np.ndarray, curves: list, as_of_date: date) -> tuple[float, np.ndarray]:
+        """
+        95% diversified PFE of factor exposure vector s (one entry per distinct risk curve)
+        and the per-unit marginal contribution of each factor: contribution = s * marginal.
+        """
+        # 相关系数矩阵 (k×k, k = 风险因子个数), 校验/分解结果缓存复用
+        return diversification.diversify(s, self.get_corr_matrix(curves, as_of_date))
+
+    def diversify_groups(self, factor_exp: pd.Series, history_length: int = 121) -> tuple[pd.Series, pd.Series]:
+        """
+        Diversify each group of factor exposures independently.
+
+        factor_exp is PFE_Output summed by (as_of_date, [netting cols...], Risk_Curve). Returns the
+        per-unit marginal of every entry (same index) and the diversified total per group. Each
+        as_of_date fetches one correlation for the union of its groups' curves (memoized and rolled
+        by the CovarianceEngine); every group then takes its own rows/columns of it.
+        """
+        keys = list(factor_exp.index.names[:-1])
+        marginals, totals = [], {}
+        for as_of_date, day in factor_exp.groupby(level=0, sort=False):
+            corr = self.get_corr_matrix(list(day.index.get_level_values(-1).unique()), as_of_date, history_length)
+            for gkey, grp in day.groupby(level=keys, sort=False):
+                sub = corr.subset(grp.index.get_level_values(-1))
+                total, marginal = diversification.diversify(grp.to_numpy(), sub)
+                marginals.append(pd.Series(marginal, index=grp.index))
+                totals[gkey if isinstance(gkey, tuple) else (gkey,)] = total
+
+        marginal = pd.concat(marginals).reindex(factor_exp.index)
+        totals = pd.Series(list(totals.values()), index=pd.MultiIndex.from_tuples(list(totals), names=keys))
+        return marginal, totals
+
+    def group_keys(self, df: pd.DataFrame) -> list[str]:
+        """
+        Diversification group columns present in df.
+        """
+        return ['as_of_date'] + [c for c in self.netting_cols if c in df.columns]
+
+    def _fill_netting_cols(self, df: pd.DataFrame) -> pd.DataFrame:
+        cols = [c for c in self.netting_cols if c in df.columns]
+        return df.assign(**{c: df[c].fillna('UNASSIGNED') for c in cols}) if cols else df
+
+    def add_diversified_pfe(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Portfolio diversification over priced contracts: adds diversified_pfe / percentage.
+        Contracts are diversified per (as_of_date, *netting_cols) group; within a group exposures
+        are netted per risk curve first, so each matrix is k×k in that group's distinct curves.
+        """
         # ===== 优化后的多样化PFE计算 =====
         # 初始化新列
         df['diversified_pfe'] = 0.0
@@ -336,59 +395,85 @@ class PFEEngine:
         valid_df = df[valid_mask]
 
         if not valid_df.empty:
-            # 获取所有有效合约的风险曲线（每个都是唯一的）
-            unique_curves = valid_df['Risk_Curve'].tolist()
-            as_of_date = valid_df['as_of_date'].iloc[0]
-
-            # 计算相关系数矩阵
-            try:
-                cov_matrix = self.get_cov_matrix(unique_curves, as_of_date)
-                corr_matrix = self.cov_to_corr(cov_matrix)
-            except Exception as e:
-                logger.error(f"计算相关系数矩阵失败: {str(e)}")
-                # 使用单位矩阵作为回退
-                corr_matrix = np.eye(len(unique_curves))
-
-            # 直接使用每个合约的PFE_Output作为向量s
-            s = valid_df['PFE_Output'].values
-
-            # 计算组合方差
-            port_variance = s.T @ corr_matrix @ s
-
-            # 检查方差非负
-            if port_variance < 0:
-                logger.warning("负的资产组合方差，使用未分散PFE")
-                total_pfe = np.sum(np.abs(s)) * 1.645
-            else:
-                total_pfe = 1.645 * np.sqrt(port_variance)  # z = 1.645 (95% confidence)
-
-            # 计算风险贡献
-            if port_variance > 0:
-                # 计算边际贡献
-                marginal_contrib = corr_matrix @ s / np.sqrt(port_variance)
-                # 计算每个合约的风险贡献
-                risk_contrib = s * marginal_contrib
-            else:
-                # 如果方差为0，则直接使用原始PFE值
-                risk_contrib = s
-
-            # 归一化风险贡献，使其总和等于总PFE
-            if (contrib_sum := risk_contrib.sum()) != 0:
-                risk_contrib *= total_pfe / contrib_sum
-
-            # 直接赋值给多样化PFE列
+            keys = self.group_keys(valid_df)
+            valid_df = self._fill_netting_cols(valid_df)
+            s = valid_df['PFE_Output'].to_numpy(dtype=float)
+
+            # 每组 (as_of_date[, 对手方/净额结算集]) 按风险因子汇总敞口, 各组独立分散
+            factor_exp = valid_df.groupby(keys + ['Risk_Curve'], sort=False)['PFE_Output'].sum()
+            marginal, totals = self.diversify_groups(factor_exp)
+
+            # 分摊回合约: 合约贡献 = 合约敞口 × 所属组内风险因子的边际贡献
+            contract_marginal = marginal.reindex(pd.MultiIndex.from_frame(valid_df[keys + ['Risk_Curve']]))
+            risk_contrib = s * contract_marginal.to_numpy()
             df.loc[valid_mask, 'diversified_pfe'] = risk_contrib
 
-            # 计算百分比
-            if total_pfe != 0:
-                df.loc[valid_mask, 'percentage'] = risk_contrib / total_pfe
+            # 计算百分比 (占所在组的分散后总PFE)
+            group_total = totals.reindex(pd.MultiIndex.from_frame(valid_df[keys])).to_numpy()
+            df.loc[valid_mask, 'percentage'] = np.divide(
+                risk_contrib, group_total, out=np.zeros_like(risk_contrib), where=group_total != 0
+            )
 
         return df
 
+    def mc_pfe_profile(self, df: pd.DataFrame, n_paths: int = 10_000, seed: int = 0, alpha: float = 0.95,
+                       block_bytes: int = DEFAULT_BLOCK_BYTES) -> pd.DataFrame:
+        """
+        Monte Carlo PFE profile of a priced book (process_dataframe output).
+
+        Correlated GBM paths are drawn for every risk curve at once (Cholesky factor of the
+        get_cov_matrix correlation), valued at each delivery date bucket and netted per
+        (as_of_date, *netting_cols) set. Paths are generated in blocks of at most block_bytes,
+        seeded from `seed`, across self.workers processes, and reduced to PFE/EPE as they finish.
+        """
+        book = self._fill_netting_cols(df)
+        # 逐行定价路径的列是 object (缺失波动率为 None), 先转数值
+        book = book.assign(**{c: pd.to_numeric(book[c], errors='coerce') for c in ['time_to_exp', 'contract_vol']})
+        book = book[(book['time_to_exp'] > 0) & (book['contract_vol'] > 0)]
+        set_keys = [c for c in self.netting_cols if c in book.columns]
+
+        profiles = []
+        for as_of_date, grp in book.groupby('as_of_date', sort=True):
+            curves = sorted(grp['Risk_Curve'].unique())
+            model, sets = build_model(grp, self.get_corr_matrix(curves, as_of_date), curves, set_keys)
+            pfe, epe = simulate_profile(model, n_paths, seed, self.workers, alpha, block_bytes)
+            logger.info(f"MC PFE {as_of_date}: {n_paths} paths x {len(model.times)} buckets x {len(curves)} curves")
+
+            # 长表: 每个 (净额结算集, 时间桶) 一行
+            n_buckets = len(model.times)
+            profile = sets.loc[sets.index.repeat(n_buckets)].reset_index(drop=True)
+            profile.insert(0, 'as_of_date', as_of_date)
+            profile['time'] = np.tile(model.times, len(sets))
+            profile['bucket_date'] = [
+                as_of_date + timedelta(days=int(round(t * 365))) for t in profile['time']
+            ]
+            profile['PFE'] = pfe.T.ravel()
+            profile['EPE'] = epe.T.ravel()
+            profiles.append(profile)
+
+        if not profiles:
+            return pd.DataFrame(columns=['as_of_date', *set_keys, 'time', 'bucket_date', 'PFE', 'EPE'])
+        return pd.concat(profiles, ignore_index=True)
+
+    @staticmethod
+    def column_width(col: pd.Series, col_name: str) -> int:
+        """
+        Excel column width from the first/last rows only, capped at MAX_COL_WIDTH.
+        """
+        sample = pd.concat([col.head(WIDTH_SAMPLE_ROWS), col.tail(1)])
+        width = max(int(sample.astype(str).str.len().max()) if sample.notna().any() else 0, len(col_name)) + 2
+        return min(width, MAX_COL_WIDTH)
+
     def write_results(self, df: pd.DataFrame, path: str) -> None:
         """
         Export DataFrame to Excel with clean formatting and summary row.
+        Non-Excel paths (.parquet/.feather/.csv) are written as plain columnar data.
         """
+        if not path.lower().endswith(('.xlsx', '.xlsm')):
+            write_frame(df, path)
+            logger.info(f"Results saved successfully: {path}")
+            return
+
         try:
             # 创建汇总行
             summary_data = {
@@ -433,7 +518,7 @@ class PFEEngine:
                 # 应用列格式
                 for col_idx, col_name in enumerate(result_df.columns):
                     # 设置列宽
-                    width = max(result_df[col_name].astype(str).map(len).max(), len(col_name)) + 2
+                    width = self.column_width(result_df[col_name], col_name)
                     ws.set_column(col_idx, col_idx, width)
 
                     # 根据列类型应用格式
@@ -489,7 +574,7 @@ class PFEEngine:
         """
         try:
             products = self.get_prod_list()
-            origins = sorted({row['destination'] for _, row in CURVE_MAPPING_LIST.iterrows()})
+            origins = CURVE_REGISTRY.destinations
             months = self.deliver_month_list()
             aods = self.get_aod_list()
             dirs = ['Buy', 'Sell']
@@ -557,7 +642,7 @@ class PFEEngine:
             logger.error(f"Failed to create template: {str(e)}")
             raise
 
-    def run(self) -> None:
+    def run(self, output_format: str = 'xlsx') -> None:
         try:
             if not os.path.exists(self.template_path):
                 logger.info(f"Template not found. Creating {self.template_path}...")
@@ -577,11 +662,59 @@ class PFEEngine:
 
             # Generate output filename
             stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            fname = f"PFE_result_{stamp}.xlsx"
+            fname = f"PFE_result_{stamp}{OUTPUT_FORMATS[output_format]}"
 
             logger.info(f"Saving results to {fname}")
             self.write_results(out, fname)
             logger.info(f"Processing complete. Results saved to {fname}")
         except Exception as e:
             logger.error(f"An error occurred during processing: {str(e)}")
-            logger.exception("Stack trace:")
\ No newline at end of file
+            logger.exception("Stack trace:")
+
+    def run_streaming(self, input_path: str, output_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> dict:
+        """
+        Chunked pipeline for large inputs (xlsx/csv/parquet): each chunk is priced and appended
+        to output_path (csv/parquet/feather), so peak memory is bounded by chunk_size.
+        """
+        totals = pd.Series(0.0, index=STREAM_SUM_COLS)
+        factor_exp = None
+
+        with ChunkWriter(output_path) as writer:
+            for i, chunk in enumerate(iter_chunks(input_path, chunk_size)):
+                out = self.process_dataframe(chunk, diversified=False)
+                if 'PFE_Output' not in out.columns:
+                    raise ValueError(f"Chunk {i + 1} could not be priced (missing required columns)")
+                writer.write(out)
+                totals += out[STREAM_SUM_COLS].sum()
+
+                # Running exposure per (group, risk curve) for the portfolio-level diversification
+                valid = self._fill_netting_cols(out[out['PFE_Output'] != 0])
+                if not valid.empty:
+                    by = self.group_keys(valid) + ['Risk_Curve']
+                    part = valid.groupby(by)['PFE_Output'].sum()
+                    factor_exp = part if factor_exp is None else factor_exp.add(part, fill_value=0)
+                logger.info(f"Chunk {i + 1}: {writer.rows} rows written to {output_path}")
+
+        result = {'rows': writer.rows, 'totals': totals.to_dict()}
+
+        # Diversified PFE per group from the aggregated exposure vectors (one entry per risk curve)
+        if factor_exp is None:
+            factor_exp = pd.Series(dtype=float, name='PFE_Output', index=pd.Index([], name='Risk_Curve'))
+        summary = factor_exp.rename('PFE_Output').reset_index()
+        summary['diversified_pfe'] = 0.0
+        summary['percentage'] = 0.0
+        if not summary.empty:
+            marginal, group_totals = self.diversify_groups(factor_exp)
+            contrib = factor_exp.to_numpy() * marginal.to_numpy()
+            keys = list(group_totals.index.names)
+            group_total = group_totals.reindex(pd.MultiIndex.from_frame(summary[keys])).to_numpy()
+            summary['diversified_pfe'] = contrib
+            summary['percentage'] = np.divide(contrib, group_total, out=np.zeros_like(contrib), where=group_total != 0)
+            # Groups are diversified independently, so their totals are reported side by side
+            result['diversified_pfe'] = group_totals.rename('diversified_pfe').reset_index().to_dict('records')
+            result['groups'] = len(group_totals)
+
+        stem, ext = os.path.splitext(output_path)
+        write_frame(summary, f"{stem}_diversified{ext}")
+        logger.info(f"Streaming run complete: {result}")
+        return result
@@ -1,65 +1,96 @@
 
-from flask import Flask, jsonify, request,render_template,Response
+from flask import Flask, jsonify, request,render_template,Response,send_file,url_for
 from Practice.FE import *
+import os
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from Done.Pculator.tenor import date_to_ordinal, month_end, ordinal_to_code
+from Done.Pculator.correlation import CorrelationMatrix
+from Done.Pculator.what_if import WHAT_IF_DIR, WhatIfBook
+from Done.Pculator.serving import MarketStateHolder, MonthLabelCache, default_loader, month_labels_by_root
+from Done.Pculator.jobs import JobQueue, write_status
+from Done.Pculator.streaming import ChunkWriter
+
+logger = logging.getLogger(__name__)
 app = Flask(__name__)
 
+# 批量接口: 有界线程池 + 排队上限, 并发请求不会占满 Flask worker
+BATCH_WORKERS = 4
+BATCH_CHUNK_SIZE = 5000
+_batch_pool = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix="pfe-batch")
+_batch_slots = threading.BoundedSemaphore(BATCH_WORKERS * 2)
+
+TRADE_FIELDS = ["commodity", "destination", "direction", "deliver_date", "position", "price"]
+
+# 行情快照 (viya_vol + 曲线映射) 进程内只加载一次, 请求只读; 定时重载时整体替换引用
+market = MarketStateHolder(default_loader())
+# 交割月下拉列表: 快照加载时按曲线根预计算, 响应体按 (快照, 曲线根) LRU 缓存
+month_cache = MonthLabelCache()
+
+# What-if: 每个对手方常驻 s, R·s, sᵀRs, 增删改单笔交易只做 O(k) 秩一更新
+# 风险因子与引擎一致取曲线根 (Risk_Curve), 同一曲线根的各合约月份计入同一因子
+def what_if_corr(factors: list) -> CorrelationMatrix:
+    # agg_cal 依赖 jarvis 价格库; 未安装时明确退化为单位矩阵 (不相关), 而不是让请求 500
+    try:
+        from Done.Pculator.agg_cal import cov_engine
+    except ImportError as e:
+        logger.warning(f"Price history unavailable ({e}), using identity for what-if factors")
+        return CorrelationMatrix.identity(len(factors), factors)
+    try:
+        return cov_engine.get_corr(factors, market.get().as_of)
+    except ValueError as e:
+        logger.warning(f"No price history for what-if factors, using identity: {e}")
+        return CorrelationMatrix.identity(len(factors), factors)
+
+# 组合落盘 (WHAT_IF_DIR), 同一主机上的各 gunicorn worker 共用; 多主机部署需共享该目录
+what_if_book = WhatIfBook(what_if_corr, store_dir=WHAT_IF_DIR)
+# 新快照 (新的 as_of) 下相关系数已变: 丢弃内存中的组合, 下次使用时按新相关系数从磁盘重建
+market.on_reload(lambda state: what_if_book.reset())
+
+# 后台任务: 大文件上传/批量计算提交后立即返回 job id, 在进程池中执行, 状态和结果落盘
+job_queue = JobQueue()
+EXPOSURE_CUBE_FILE = "exposure_cube.parquet"
+
 def index():
-    all_commodities = sorted(set(row["commodity"] for row in curve_mapping_source))
-    all_destinations = sorted(set(row["destination"] for row in curve_mapping_source))
-    return render_template("PFE_front.html", commodities=all_commodities, destinations=all_destinations)
+    registry = market.get().curve_registry
+    return render_template("PFE_front.html", commodities=registry.commodities,
+                           destinations=registry.destinations)
 
 def get_destinations():
     commodity = request.json.get("commodity")
-    destinations = sorted(set(
-        row["destination"] for row in curve_mapping_source if row["commodity"] == commodity
-    ))
-    return jsonify(destinations)
+    return jsonify(market.get().curve_registry.destinations_for(commodity))
 
 def get_commodities():
     destination = request.json.get("destination")
-    commodities = sorted(set(
-        row["commodity"] for row in curve_mapping_source if row["destination"] == destination
-    ))
-    return jsonify(commodities)
+    return jsonify(market.get().curve_registry.commodities_for(destination))
 
 def get_curve_root():
     data = request.json
-    commodity = data["commodity"]
-    destination = data["destination"]
-    for row in curve_mapping_source:
-        if row["commodity"] == commodity and row["destination"] == destination:
-            return jsonify({"curve_root": row["curve_root"]})
-    return jsonify({"curve_root": "Not Found"})
+    curve_root = market.get().curve_registry.curve_root(data["commodity"], data["destination"], default="Not Found")
+    return jsonify({"curve_root": curve_root})
 
 def get_available_months():
-    data = request.get_json()  # POST JSON
-    print(data)
-    comm = data.get("commodity")
-    dest = data.get("destination")
-    curve_root = risk_curve_mapping(comm,dest)
-    months = get_available_months_backend(viya_vol, curve_root)
-    return jsonify(months)
-
-def get_available_months_backend(data_source: pd.DataFrame, risk_factor: str):
-    factor_set = data_source[data_source['RISK_FACTOR'].str.startswith(risk_factor)]
-    if factor_set.empty:
-        print(f"The factor {risk_factor} doesn't exist!")
-        return []
-
-    copy_set = factor_set.copy()
-    copy_set['Month_Code'] = copy_set['RISK_FACTOR'].str[-3:]
-    copy_set['Month'] = copy_set['Month_Code'].str[0]
-    copy_set['year'] = 2000 + copy_set['Month_Code'].str[1:].astype(int)
-    copy_set['Month_NUM'] = copy_set['Month'].map(trading_code_to_month ).astype(int)
+    # GET (query string) 可走浏览器条件请求; POST JSON 保持兼容
+    data = (request.get_json(silent=True) if request.method == "POST" else request.args) or {}
+    state = market.get()
+    curve_root = state.curve_registry.curve_root(data.get("commodity"), data.get("destination"))
+    if curve_root not in state.month_labels:
+        print(f"The factor {curve_root} doesn't exist!")
 
-    sort_data = copy_set.sort_values(by=['year', 'Month_NUM'], ascending=[False, False])
+    body, etag = month_cache.get(state, curve_root)
+    resp = Response(body, mimetype="application/json")
+    resp.set_etag(etag)
+    resp.last_modified = state.loaded_at
+    resp.cache_control.no_cache = True  # 每次向服务端校验, 快照重载后立即生效
+    return resp.make_conditional(request)
 
-    formatted_dates = sort_data.apply(
-        lambda row: f"{datetime(1900, row['Month_NUM'], 1).strftime('%b')}-{str(row['year'])[-2:]}",
-        axis=1
-    ).tolist()
-
-    return jsonify(formatted_dates)
+def get_available_months_backend(data_source: pd.DataFrame, risk_factor: str) -> list:
+    labels = month_labels_by_root(data_source).get(risk_factor, ())
+    if not labels:
+        print(f"The factor {risk_factor} doesn't exist!")
+    return list(labels)
 
 # get_available_months(viya_vol,"Prncpl_CNSTNZ_SBMPS_CIF")
 
@@ -70,8 +101,9 @@ def calculate_pfe():
     dirc = data["direction"]
     position = float(data["position"])
     price = float(data["price"])
+    state = market.get()
     # 1) 获取曲线根
-    curve_root = risk_curve_mapping(comm, dest)
+    curve_root = state.curve_registry.curve_root(comm, dest)
     if not curve_root:
         return jsonify({"error": "Mapping not found"}), 404
 
@@ -83,12 +115,11 @@ def calculate_pfe():
     except ValueError:
         return jsonify({"error": "Invalid date format"}), 400
 
-    # 3) 获取波动率
-    vol_row = viya_vol[viya_vol['RISK_FACTOR'] == risk_curve]
-    if vol_row.empty:
+    # 3) 获取波动率 (首条记录, 哈希查找)
+    vol = state.first_vol.get(risk_curve)
+    if vol is None:
         return jsonify({"error": "Volatility data not found"}), 404
-
-    vol = vol_row.iloc[0]['VOLATILITY']
+    vol = float(vol)
     # 4) 计算剩余年化时间
     eom = (tgt.replace(day=1) + relativedelta(months=1) - relativedelta(days=1))
     eom_date = eom.date()
@@ -123,90 +154,187 @@ def export_csv():
         mimetype="text/csv",
         headers={"Content-disposition": "attachment; filename=exposure_results.csv"})
 
+def price_trades(trades: pd.DataFrame, state=None) -> pd.DataFrame:
+    """
+    Vectorized calculate_pfe over a batch. Bad rows get an error code instead of aborting the batch.
+    state pins the MarketState (default: the currently published one).
+    """
+    state = state or market.get()
+    trades = trades.reindex(columns=TRADE_FIELDS)
+    position = pd.to_numeric(trades["position"], errors="coerce")
+    price = pd.to_numeric(trades["price"], errors="coerce")
+    tgt = pd.to_datetime(trades["deliver_date"].astype(str) + "-01", format="%Y-%m-%d", errors="coerce")
+
+    # 1) 曲线根 + 风险因子
+    curve_root = pd.Series(
+        state.curve_registry.map_roots(trades["commodity"], trades["destination"], unknown=None), index=trades.index
+    )
+    month = date_to_ordinal(tgt)
+    month_code = pd.Series(ordinal_to_code(month), index=trades.index, dtype="string")
+    risk_curve = (curve_root + "_" + month_code).where(curve_root.notna() & tgt.notna())
+
+    # 2) 波动率
+    vol = state.first_vol.reindex(risk_curve.to_numpy()).to_numpy(dtype=float)
+
+    error = np.select(
+        [
+            trades.isna().any(axis=1).to_numpy(),
+            (position.isna() | price.isna()).to_numpy(),
+            curve_root.isna().to_numpy(),
+            tgt.isna().to_numpy(),
+            np.isnan(vol),
+        ],
+        ["MISSING_FIELD", "INVALID_NUMBER", "MAPPING_NOT_FOUND", "INVALID_DATE", "VOL_NOT_FOUND"],
+        default="",
+    )
+    ok = error == ""
+
+    # 3) 剩余年化时间 + 单位风险敞口
+    days = (month_end(month) - np.datetime64(date.today(), "D")) / np.timedelta64(1, "D")
+    tte = np.maximum(days / 365.25, 0)
+    buy_term = 1.645 * vol * np.sqrt(tte) - 0.5 * vol ** 2 * tte
+    sell_term = -1.645 * vol * np.sqrt(tte) - 0.5 * vol ** 2 * tte
+    is_buy = (trades["direction"] == "Buy").to_numpy()
+    unit_exposure = np.where(is_buy, price * np.expm1(buy_term), price * (1 - np.exp(sell_term)))
+
+    result = pd.DataFrame({
+        "commodity": trades["commodity"],
+        "destination": trades["destination"],
+        "direction": trades["direction"],
+        "deliver_date": trades["deliver_date"],
+        "risk_curve": risk_curve,
+        "vol": np.where(ok, vol, np.nan),
+        "time_to_exp": np.where(ok, np.round(tte, 6), np.nan),
+        "exposure": np.where(ok, np.round(unit_exposure, 6), np.nan),
+        "total_exposure": np.where(ok, np.round(unit_exposure * position, 6), np.nan),
+        "error": np.where(ok, None, error),
+    }, index=trades.index)
+    return result
+
 def calc_pfe_core(input_list):
     print(f"new cal culate process {input_list}")
-    results = []
-    for data in input_list:
-        comm = data["commodity"]
-        dest = data["destination"]
-        dirc = data["direction"]
-        position = float(data["position"])
-        price = float(data["price"])
-        # ... 你的所有核心逻辑 ... #
-        # 1) 获取曲线根
-        curve_root = risk_curve_mapping(comm, dest)
-        try:
-            tgt = datetime.strptime(data["deliver_date"] + "-01", "%Y-%m-%d")
-            mon = tgt.strftime('%b')
-            short_m = MONTH_CODE_MAP.get(mon, mon[0]) + tgt.strftime('%y')
-            risk_curve = f"{curve_root}_{short_m}"
-        except ValueError:
-            return jsonify({"error": "Invalid date format"}), 400
-
-        # 3) 获取波动率
-        vol_row = viya_vol[viya_vol['RISK_FACTOR'] == risk_curve]
-        if vol_row.empty:
-            return jsonify({"error": "Volatility data not found"}), 404
-
-        vol = vol_row.iloc[0]['VOLATILITY']
-        # 4) 计算剩余年化时间
-        eom = (tgt.replace(day=1) + relativedelta(months=1) - relativedelta(days=1))
-        eom_date = eom.date()
-        tte = max((eom_date - date.today()).days / 365.25, 0)
-
-        # 5) 计算单位风险敞口
-        buy_term = 1.645 * vol * math.sqrt(tte) - 0.5 * vol ** 2 * tte
-        sell_term = -1.645 * vol * math.sqrt(tte) - 0.5 * vol ** 2 * tte
-
-        if dirc == "Buy":
-            unit_exposure = price * (-1 + math.exp(buy_term))
-        else:  # Sell
-            unit_exposure = price * (1 - math.exp(sell_term))
-
-        # 6) 计算总风险敞口 (单位敞口 * 头寸)
-        total_exposure = unit_exposure * position
-        result = {
-            "commodity": comm,
-            "destination": dest,
-            "direction": dirc,
-            "deliver_date": data["deliver_date"],
-            "risk_curve": risk_curve,
-            "vol": vol,
-            "time_to_exp": round(tte, 6),
-            "exposure": round(unit_exposure, 6),
-            "total_exposure": round(total_exposure, 6)
-        }
-        results.append(result)
-    return pd.DataFrame(results)
+    return price_trades(pd.DataFrame.from_records(input_list, columns=TRADE_FIELDS))
+
+def calculate_pfe_batch():
+    payload = request.get_json(silent=True)
+    trades = payload.get("trades") if isinstance(payload, dict) else payload
+    if not isinstance(trades, list) or not all(isinstance(t, dict) for t in trades):
+        return jsonify({"error": "Expected a JSON array of trade objects"}), 400
+    if not trades:
+        return jsonify({"count": 0, "errors": 0, "results": []})
+
+    if not _batch_slots.acquire(blocking=False):
+        return jsonify({"error": "Too many batch requests in flight, retry later"}), 503
+    try:
+        df = pd.DataFrame.from_records(trades, columns=TRADE_FIELDS)
+        chunks = [df.iloc[i:i + BATCH_CHUNK_SIZE] for i in range(0, len(df), BATCH_CHUNK_SIZE)]
+        result = pd.concat(list(_batch_pool.map(price_trades, chunks)))
+    finally:
+        _batch_slots.release()
+
+    rows = result.astype(object).where(result.notna(), None).to_dict(orient="records")
+    return jsonify({
+        "count": len(rows),
+        "errors": int(result["error"].notna().sum()),
+        "results": rows
+    })
+
+def what_if_factors(trades: pd.DataFrame, state) -> np.ndarray:
+    return state.curve_registry.map_roots(trades["commodity"], trades["destination"], unknown=None)
+
+def _what_if_counterparty(data):
+    counterparty = data.get("counterparty") if isinstance(data, dict) else None
+    if not counterparty:
+        return None, (jsonify({"error": "counterparty is required"}), 400)
+    return str(counterparty), None
+
+def what_if_load():
+    """
+    Load (replace) a counterparty's book: {"counterparty", "trades": [{"trade_id", ...TRADE_FIELDS}]}
+    """
+    data = request.get_json(silent=True)
+    counterparty, err = _what_if_counterparty(data)
+    if err:
+        return err
+    trades = data.get("trades") or []
+    if not isinstance(trades, list) or not all(isinstance(t, dict) and t.get("trade_id") is not None for t in trades):
+        return jsonify({"error": "Expected trades with a trade_id each"}), 400
+
+    state = market.get()
+    df = pd.DataFrame.from_records(trades, columns=TRADE_FIELDS)
+    priced = price_trades(df, state)
+    factors = what_if_factors(df, state)
+    bad = priced["error"].notna().to_numpy()
+    ids = [str(t["trade_id"]) for t in trades]
+    book = {
+        trade_id: (factor, exposure)
+        for trade_id, factor, exposure, is_bad in zip(ids, factors, priced["total_exposure"], bad) if not is_bad
+    }
+    summary = what_if_book.load(counterparty, book)
+    summary["rejected"] = [{"trade_id": i, "error": e} for i, e, b in zip(ids, priced["error"], bad) if b]
+    return jsonify(summary)
+
+def what_if():
+    """
+    {"counterparty", "action": add|remove|amend, "trade_id", "trade": {...TRADE_FIELDS}, "commit": bool}
+    Returns the new diversified PFE, its change and per-factor contributions.
+    """
+    data = request.get_json(silent=True)
+    counterparty, err = _what_if_counterparty(data)
+    if err:
+        return err
+    action = data.get("action", "add")
+    trade_id = data.get("trade_id")
+    if trade_id is None:
+        return jsonify({"error": "trade_id is required"}), 400
+
+    factor, exposure, priced = None, 0.0, None
+    if action in ("add", "amend"):
+        state = market.get()
+        df = pd.DataFrame.from_records([data.get("trade") or {}], columns=TRADE_FIELDS)
+        priced = price_trades(df, state).iloc[0]
+        if priced["error"]:
+            return jsonify({"error": priced["error"]}), 400
+        factor, exposure = what_if_factors(df, state)[0], float(priced["total_exposure"])
+
+    try:
+        result = what_if_book.apply(counterparty, [(action, str(trade_id), factor, exposure)],
+                                    commit=bool(data.get("commit", True)))
+    except (KeyError, ValueError) as e:
+        return jsonify({"error": str(e).strip("'")}), 400
+
+    if priced is not None:
+        result["trade"] = priced.astype(object).where(priced.notna(), None).to_dict()
+    return jsonify(result)
+
+def _form_trades(form) -> list:
+    # Hrosation 的 request.form 是 MultiDict
+    # 提取所有字段的列表
+    commodities = form.getlist("commodity[]")
+    destinations = form.getlist("destination[]")
+    # radio 按钮每行不同 name
+    directions = [form.get("direction_%d" % i) for i in range(len(commodities))]
+    deliver_dates = form.getlist("deliver_date[]")
+    positions = form.getlist("position[]")
+    prices = form.getlist("price[]")
+
+    # 拼成 list of dict
+    input_list = []
+    for i in range(len(commodities)):
+        # 可加空值校验
+        input_list.append({
+            "commodity": commodities[i],
+            "destination": destinations[i],
+            "direction": directions[i],
+            "deliver_date": deliver_dates[i],
+            "position": positions[i],
+            "price": prices[i]
+        })
+    return input_list
 
 def credit_pfe_result():
     if request.method == "POST":
-        input_list = []
-        # Hrosation 的 request.form 是 MultiDict
-        form = request.form
-        # 提取所有字段的列表
-        commodities = form.getlist("commodity[]")
-        destinations = form.getlist("destination[]")
-        directions = []
-        # radio 按钮每行不同 name
-        for i in range(len(commodities)):
-            directions.append(form.get("direction_%d" % i))
-        deliver_dates = form.getlist("deliver_date[]")
-        positions = form.getlist("position[]")
-        prices = form.getlist("price[]")
-
-        # 拼成 list of dict
-        for i in range(len(commodities)):
-            # 可加空值校验
-            item = {
-                "commodity": commodities[i],
-                "destination": destinations[i],
-                "direction": directions[i],
-                "deliver_date": deliver_dates[i],
-                "position": positions[i],
-                "price": prices[i]
-            }
-            input_list.append(item)
+        input_list = _form_trades(request.form)
 
         df = calc_pfe_core(input_list)
         print(f"{df} -> df")
@@ -225,3 +353,133 @@ def credit_pfe_result():
     else:
         # GET 时只渲染模板，前端 JS 会再去抓 POST 返回的 JSON
         return render_template("credit_pfe_result.html", table=None)
+
+# ---- 后台任务 (在 job_queue 的进程池中执行, 必须是模块级函数) ----
+
+def current_market_state(snapshot_id):
+    """
+    The MarketState a background job should price against. Pool processes are forked once and
+    never run the reload scheduler, so reload when the submitting worker had a newer snapshot.
+    """
+    state = market.get()
+    if state.snapshot_id != snapshot_id:
+        market.reload()
+        state = market.get()
+        if state.snapshot_id != snapshot_id:
+            logger.warning(f"Job submitted on snapshot {snapshot_id}, pricing on {state.snapshot_id}")
+    return state
+
+def credit_pfe_job(trades_file, snapshot_id, job_dir, progress):
+    state = current_market_state(snapshot_id)
+    write_status(job_dir, snapshot_id=state.snapshot_id)
+    trades = pd.read_csv(trades_file, dtype=str, keep_default_na=False)
+    total = len(trades)
+    result_file = "credit_pfe_result.csv"
+    errors = 0
+    with ChunkWriter(os.path.join(job_dir, result_file)) as writer:
+        for i in range(0, total, BATCH_CHUNK_SIZE):
+            priced = price_trades(trades.iloc[i:i + BATCH_CHUNK_SIZE].replace("", None), state)
+            errors += int(priced["error"].notna().sum())
+            writer.write(priced)
+            progress.update("pricing", min(i + BATCH_CHUNK_SIZE, total), total)
+    return {"rows": total, "errors": errors, "result_file": result_file, "snapshot_id": state.snapshot_id}
+
+def combine_exposure_job(viterra_path, bunge_path, output_format, job_dir, progress):
+    from Practice.exposure_ingest import combine_exposure_files
+    result_file = f"credit_combine_exposure_result.{output_format}"
+    meta = combine_exposure_files(viterra_path, bunge_path, os.path.join(job_dir, result_file),
+                                  progress=lambda source, rows: progress.update(source, rows),
+                                  cube_path=os.path.join(job_dir, EXPOSURE_CUBE_FILE))
+    meta.pop("output_path")
+    meta["result_file"] = result_file
+    meta["cube_file"] = EXPOSURE_CUBE_FILE
+    return meta
+
+def _job_accepted(job_id):
+    status = job_queue.status(job_id)
+    status["status_url"] = url_for("job_status", job_id=job_id)
+    status["result_url"] = url_for("job_result", job_id=job_id)
+    return jsonify(status), 202, {"Location": status["status_url"]}
+
+def submit_credit_pfe_job():
+    """
+    Queue a credit PFE run: JSON {"trades": [...]} / JSON array, a 'trades_file' CSV upload,
+    or the credit_pfe_result form fields.
+    """
+    payload = request.get_json(silent=True)
+    upload = request.files.get("trades_file")
+    if payload is not None:
+        trades = payload.get("trades") if isinstance(payload, dict) else payload
+        if not isinstance(trades, list) or not all(isinstance(t, dict) for t in trades):
+            return jsonify({"error": "Expected a JSON array of trade objects"}), 400
+    elif upload is None:
+        trades = _form_trades(request.form)
+    if upload is None and not trades:
+        return jsonify({"error": "No trades submitted"}), 400
+
+    job_id, job_dir = job_queue.new_job("credit_pfe")
+    trades_file = os.path.join(job_dir, "trades.csv")
+    if upload is not None:
+        upload.save(trades_file)
+    else:
+        pd.DataFrame.from_records(trades, columns=TRADE_FIELDS).to_csv(trades_file, index=False)
+    job_queue.submit(job_id, credit_pfe_job, trades_file, market.get().snapshot_id)
+    return _job_accepted(job_id)
+
+def submit_combine_exposure_job():
+    """
+    Queue the Viterra/Bunge combine: 'viterra_file' and 'bunge_file' uploads, optional
+    output_format csv (default) / parquet.
+    """
+    viterra, bunge = request.files.get("viterra_file"), request.files.get("bunge_file")
+    if not viterra or not viterra.filename or not bunge or not bunge.filename:
+        return jsonify({"error": "viterra_file and bunge_file are required"}), 400
+    output_format = request.form.get("output_format", "csv")
+    if output_format not in ("csv", "parquet"):
+        return jsonify({"error": "output_format must be csv or parquet"}), 400
+
+    job_id, job_dir = job_queue.new_job("combine_exposure")
+    # 上传文件直接落到任务目录, 请求线程只做保存
+    viterra_path = os.path.join(job_dir, "viterra.csv")
+    bunge_path = os.path.join(job_dir, "bunge" + (os.path.splitext(bunge.filename)[1].lower() or ".xlsx"))
+    viterra.save(viterra_path)
+    bunge.save(bunge_path)
+    job_queue.submit(job_id, combine_exposure_job, viterra_path, bunge_path, output_format)
+    return _job_accepted(job_id)
+
+def job_status(job_id):
+    try:
+        return jsonify(job_queue.status(job_id))
+    except KeyError as e:
+        return jsonify({"error": str(e).strip("'")}), 404
+
+def job_result(job_id):
+    try:
+        path = job_queue.result_path(job_id)
+    except KeyError as e:
+        return jsonify({"error": str(e).strip("'")}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 409
+    # send_file 按块流式返回, 支持 Range / 条件请求
+    return send_file(path, as_attachment=True, download_name=os.path.basename(path), conditional=True)
+
+def exposure_cube_query(job_id):
+    """
+    Drill-down on a finished combine job's cube: ?by=<dimension>&by=...&<dimension>=<value>...
+    """
+    from Practice.exposure_cube import ExposureCube
+    try:
+        status = job_queue.status(job_id)
+    except KeyError as e:
+        return jsonify({"error": str(e).strip("'")}), 404
+    if status["state"] != "done" or not (status.get("result") or {}).get("cube_file"):
+        return jsonify({"error": f"Job {job_id} has no exposure cube ({status['state']})"}), 409
+
+    cube = ExposureCube.load(os.path.join(job_queue.job_dir(job_id), status["result"]["cube_file"]))
+    by = request.args.getlist("by")
+    filters = {k: request.args.getlist(k) for k in request.args if k != "by"}
+    try:
+        result = cube.query(by, **filters)
+    except KeyError as e:
+        return jsonify({"error": str(e).strip("'")}), 400
+    return jsonify(result.astype(object).where(result.notna(), None).to_dict(orient="records"))
@@ -11,10 +11,18 @@ app.add_url_rule('/', view_func=controller.index)
 app.add_url_rule('/get_destinations', view_func=controller.get_destinations, methods=['POST'])
 app.add_url_rule('/get_commodities', view_func=controller.get_commodities, methods=['POST'])
 app.add_url_rule('/get_curve_root', view_func=controller.get_curve_root, methods=['POST'])
-app.add_url_rule('/get_available_months', view_func=controller.get_available_months, methods=['POST'])
+app.add_url_rule('/get_available_months', view_func=controller.get_available_months, methods=['GET', 'POST'])
 app.add_url_rule('/calculate_pfe', view_func=controller.calculate_pfe, methods=['POST'])
+app.add_url_rule('/calculate_pfe_batch', view_func=controller.calculate_pfe_batch, methods=['POST'])
+app.add_url_rule('/what_if_load', view_func=controller.what_if_load, methods=['POST'])
+app.add_url_rule('/what_if', view_func=controller.what_if, methods=['POST'])
 app.add_url_rule('/export_csv',    view_func=controller.export_csv,    methods=['POST'])
 app.add_url_rule('/credit_pfe_result',    view_func=controller.credit_pfe_result,methods=['POST'])
+app.add_url_rule('/jobs/credit_pfe', view_func=controller.submit_credit_pfe_job, methods=['POST'])
+app.add_url_rule('/jobs/combine_exposure', view_func=controller.submit_combine_exposure_job, methods=['POST'])
+app.add_url_rule('/jobs/<job_id>', view_func=controller.job_status, methods=['GET'])
+app.add_url_rule('/jobs/<job_id>/result', view_func=controller.job_result, methods=['GET'])
+app.add_url_rule('/jobs/<job_id>/cube', view_func=controller.exposure_cube_query, methods=['GET'])
 
 
 @app.errorhandler(500)
@@ -22,6 +30,7 @@ def internal_error(error):
     return render_template("500.html", error_msg=str(error)), 500
 
 if __name__ == "__main__":
+    # 开发服务器; 生产: gunicorn -c Done/Pculator/gunicorn.conf.py 或 uvicorn Done.Pculator.asgi:asgi_app
     app.run(debug=True)
     print("Available routes:")
     print(app.url_map)
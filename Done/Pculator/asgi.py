@@ -0,0 +1,32 @@
+"""
+ASGI entry point for the PFE controller:
+
+    uvicorn Done.Pculator.asgi:asgi_app --workers 4
+
+The Flask app is wrapped with asgiref's WsgiToAsgi (sync views run on its thread pool).
+The market snapshot is loaded at import; the reload timer starts with the ASGI lifespan.
+With several workers run it under gunicorn instead, so the master owns reloads and every
+worker serves the same snapshot:
+
+    gunicorn -c Done/Pculator/gunicorn.conf.py -k uvicorn.workers.UvicornWorker Done.Pculator.asgi:asgi_app
+"""
+from asgiref.wsgi import WsgiToAsgi
+
+from Done.Pculator.app import app
+from Done.Pculator.Controller.pfe_controller import market
+
+_wsgi = WsgiToAsgi(app)
+
+
+async def asgi_app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                market.start_scheduler()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                market.stop_scheduler()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    await _wsgi(scope, receive, send)
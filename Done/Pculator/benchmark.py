@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the PFE engine: row-wise vs columnar paths on synthetic books,
+and the Monte Carlo path engine on a synthetic factor set.
+
+    python -m Done.Pculator.benchmark --trades 200000
+    python -m Done.Pculator.benchmark --mc-paths 100000 --mc-factors 500 --workers 4
+    python -m Done.Pculator.benchmark --tenor-rows 1000000
+"""
+import time
+import argparse
+from datetime import date, datetime, timedelta
+
+from dateutil.relativedelta import relativedelta
+
+import numpy as np
+import pandas as pd
+
+from Sandbox.horizon.PFE_Calculator.models.common import MONTH_CODE_MAP
+from Done.Pculator.ini_engine import PFEEngine, CURVE_MAPPING_LIST
+from Done.Pculator.correlation import CorrelationMatrix
+from Done.Pculator.monte_carlo import PathModel, simulate_profile
+from Done.Pculator.tenor import excel_serial, label_to_ordinal, month_end, ordinal_to_code
+
+
+def synthetic_vol(as_of: date, days: int = 10, months: int = 36, seed: int = 7) -> pd.DataFrame:
+    """
+    viya_vol-shaped frame: every curve root x contract month x recent as-of day.
+    """
+    rng = np.random.default_rng(seed)
+    codes = list(MONTH_CODE_MAP.values())
+    tenors = pd.date_range(as_of.replace(day=1), periods=months, freq='MS')
+    factors = [
+        f"{root}_{codes[t.month - 1]}{t.strftime('%y')}"
+        for root in CURVE_MAPPING_LIST['Curve_Root'].unique()
+        for t in tenors
+    ]
+    as_ofs = [pd.Timestamp(as_of - timedelta(days=i)) for i in range(days) if (as_of - timedelta(days=i)).weekday() < 5]
+    frame = pd.DataFrame(
+        [(d, f) for d in as_ofs for f in factors],
+        columns=['AS_OF_DATE', 'RISK_FACTOR']
+    )
+    frame['VOLATILITY'] = rng.uniform(0.005, 0.02, len(frame))
+    return frame
+
+
+def synthetic_book(n_trades: int, as_of: date, seed: int = 11) -> pd.DataFrame:
+    """
+    'PFE Data Input'-shaped trade book drawn from the curve mapping.
+    """
+    rng = np.random.default_rng(seed)
+    mapping = CURVE_MAPPING_LIST.iloc[rng.integers(0, len(CURVE_MAPPING_LIST), n_trades)]
+    months = pd.date_range(as_of.replace(day=1), periods=24, freq='MS').strftime('%b-%y')
+    return pd.DataFrame({
+        'as_of_date': as_of.strftime('%Y-%m-%d'),
+        'product': mapping['commodity'].to_numpy(),
+        'origin': mapping['destination'].to_numpy(),
+        'deliver_month': rng.choice(months, n_trades),
+        'direction': rng.choice(['Buy', 'Sell'], n_trades),
+        'contract_price': rng.uniform(100, 600, n_trades).round(2),
+        'Existing_MTM': rng.normal(0, 5000, n_trades).round(2),
+        'position': rng.integers(1, 5000, n_trades),
+    })
+
+
+def bench_process_dataframe(n_trades: int) -> dict:
+    """
+    Time process_dataframe in both modes on the same book and check the outputs agree.
+    """
+    as_of = date.today() - timedelta(days=1)
+    vol = synthetic_vol(as_of)
+    book = synthetic_book(n_trades, as_of)
+
+    timings = {}
+    results = {}
+    for columnar in (False, True):
+        engine = PFEEngine(columnar=columnar, vol_data=vol)
+        start = time.perf_counter()
+        results[columnar] = engine.process_dataframe(book.copy())
+        timings['columnar' if columnar else 'row'] = time.perf_counter() - start
+
+    cols = ['time_to_exp', 'contract_vol', 'PFE_Value', 'PFE_Output', 'Total_Exposure']
+    for col in cols:
+        np.testing.assert_allclose(
+            results[False][col].to_numpy(dtype=float), results[True][col].to_numpy(dtype=float),
+            rtol=1e-9, atol=1e-9, equal_nan=True, err_msg=col
+        )
+    assert (results[False]['Risk_Curve'].to_numpy() == results[True]['Risk_Curve'].to_numpy()).all()
+
+    timings['speedup'] = timings['row'] / timings['columnar']
+    return timings
+
+
+def bench_monte_carlo(n_paths: int, n_factors: int, n_buckets: int = 12, n_sets: int = 10,
+                      workers: int = 0, seed: int = 3) -> dict:
+    """
+    Time simulate_profile on a random one-factor-correlated curve set with one position per
+    (curve, monthly bucket) spread over n_sets netting sets, and check a lone position
+    against the closed-form quantile.
+    """
+    rng = np.random.default_rng(seed)
+    loading = rng.uniform(0.3, 0.9, n_factors)
+    corr = np.outer(loading, loading)
+    np.fill_diagonal(corr, 1.0)
+
+    times = np.arange(1, n_buckets + 1) / 12
+    curve, bucket = (a.ravel() for a in np.meshgrid(np.arange(n_factors), np.arange(n_buckets), indexing='ij'))
+    nset = rng.integers(0, n_sets, len(curve))
+    order = np.argsort(nset, kind='stable')
+    model = PathModel(
+        factor=CorrelationMatrix(corr).factor, times=times, curve=curve[order],
+        vol=rng.uniform(0.1, 0.4, len(order)), expiry=times[bucket[order]],
+        notional=rng.normal(0, 1e5, len(order)), netting_set=nset[order], n_sets=n_sets,
+    )
+
+    start = time.perf_counter()
+    pfe, _ = simulate_profile(model, n_paths, seed, workers)
+    elapsed = time.perf_counter() - start
+
+    # 单一买入头寸: 与解析公式 price*(exp(1.645σ√t - σ²t/2) - 1) 比较
+    lone = PathModel(factor=np.eye(1), times=np.array([1.0]), curve=np.array([0]), vol=np.array([0.3]),
+                     expiry=np.array([1.0]), notional=np.array([100.0]), netting_set=np.array([0]), n_sets=1)
+    mc, _ = simulate_profile(lone, n_paths, seed)
+    closed = 100.0 * np.expm1(1.645 * 0.3 - 0.5 * 0.3 ** 2)
+
+    return {
+        'seconds': elapsed,
+        'positions': len(order),
+        'block_paths': model.block_paths(),
+        'peak_pfe': float(pfe.max()),
+        'closed_form_error': float(mc[0, 0] / closed - 1),
+    }
+
+
+def bench_tenor(n_rows: int, seed: int = 5) -> dict:
+    """
+    'MMM-YY' column -> month end, futures code and Excel serial: the per-element
+    strptime/relativedelta/strftime helpers vs the month-ordinal functions in tenor.py.
+    """
+    rng = np.random.default_rng(seed)
+    months = pd.date_range('2020-01-01', periods=120, freq='MS').strftime('%b-%y')
+    labels = pd.Series(rng.choice(months, n_rows), dtype=object)
+    epoch = datetime(1899, 12, 30).date()
+
+    start = time.perf_counter()
+    ends, codes, serials = [], [], []
+    for label in labels:
+        first = datetime.strptime(label, '%b-%y')
+        end = (first + relativedelta(months=1) - relativedelta(days=1)).date()
+        ends.append(end)
+        codes.append(MONTH_CODE_MAP[first.strftime('%b')] + first.strftime('%y'))
+        serials.append((end - epoch).days)
+    scalar = time.perf_counter() - start
+
+    start = time.perf_counter()
+    ordinals = label_to_ordinal(labels)
+    v_ends = month_end(ordinals)
+    v_codes = ordinal_to_code(ordinals)
+    v_serials = excel_serial(v_ends)
+    vectorized = time.perf_counter() - start
+
+    assert (v_ends == np.array(ends, dtype='datetime64[D]')).all()
+    assert (v_codes == np.array(codes, dtype=object)).all()
+    np.testing.assert_array_equal(v_serials, np.array(serials, dtype=float))
+    return {'scalar': scalar, 'vectorized': vectorized, 'speedup': scalar / vectorized}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark PFE engine pricing paths.')
+    parser.add_argument('--trades', '-n', type=int, default=20000, help='Number of synthetic trades')
+    parser.add_argument('--mc-paths', type=int, default=0, help='Benchmark Monte Carlo PFE with this many paths')
+    parser.add_argument('--mc-factors', type=int, default=500, help='Risk curves in the Monte Carlo benchmark')
+    parser.add_argument('--workers', type=int, default=0, help='Processes for the Monte Carlo benchmark')
+    parser.add_argument('--tenor-rows', type=int, default=0, help='Benchmark contract-month conversions on this many rows')
+    args = parser.parse_args()
+
+    if args.tenor_rows:
+        res = bench_tenor(args.tenor_rows)
+        print(f"contract months ({args.tenor_rows} rows): scalar {res['scalar']:.2f}s, "
+              f"vectorized {res['vectorized']:.3f}s, speedup x{res['speedup']:.0f}")
+    elif args.mc_paths:
+        res = bench_monte_carlo(args.mc_paths, args.mc_factors, workers=args.workers)
+        print(f"monte carlo ({args.mc_paths} paths x {args.mc_factors} curves, {res['positions']} positions): "
+              f"{res['seconds']:.2f}s, {res['block_paths']} paths/block, "
+              f"closed-form error {res['closed_form_error']:+.2%}")
+    else:
+        res = bench_process_dataframe(args.trades)
+        print(f"process_dataframe ({args.trades} trades): row {res['row']:.2f}s, "
+              f"columnar {res['columnar']:.3f}s, speedup x{res['speedup']:.0f}")
@@ -0,0 +1,97 @@
+import os
+import logging
+import threading
+from datetime import date
+from typing import Iterable
+
+import holidays
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Years covered by the cached calendars; dates outside the range are rejected rather than
+# silently treated as holiday-free
+CALENDAR_START_YEAR = int(os.environ.get('PFE_CALENDAR_START_YEAR', '1990'))
+CALENDAR_END_YEAR = int(os.environ.get('PFE_CALENDAR_END_YEAR', '2060'))
+WEEKMASK = '1111100'
+
+
+class BusinessCalendar:
+    """
+    Weekends plus a fixed holiday set, precomputed once as a np.busdaycalendar so offsets,
+    counts and trailing windows are single vectorized NumPy calls.
+    """
+
+    def __init__(self, holiday_dates: Iterable = (), start_year: int = CALENDAR_START_YEAR,
+                 end_year: int = CALENDAR_END_YEAR, weekmask: str = WEEKMASK):
+        self.start_year = start_year
+        self.end_year = end_year
+        self.holidays = np.unique(np.array(list(holiday_dates), dtype='datetime64[D]'))
+        self.busdaycal = np.busdaycalendar(weekmask=weekmask, holidays=self.holidays)
+        self._lo = np.datetime64(f'{start_year}-01-01', 'D')
+        self._hi = np.datetime64(f'{end_year}-12-31', 'D')
+
+    @classmethod
+    def from_country(cls, country: str = 'US', start_year: int = CALENDAR_START_YEAR,
+                     end_year: int = CALENDAR_END_YEAR, extra_holidays: Iterable = ()) -> 'BusinessCalendar':
+        """
+        Public holidays of a country (python-holidays, observed dates included) plus any extra dates.
+        """
+        observed = holidays.country_holidays(country, years=range(start_year, end_year + 1))
+        return cls(list(observed.keys()) + list(extra_holidays), start_year, end_year)
+
+    def _days(self, dates) -> np.ndarray:
+        days = np.asarray(dates, dtype='datetime64[D]')
+        if np.any((days < self._lo) | (days > self._hi)):
+            raise ValueError(f"Date outside business calendar range {self.start_year}-{self.end_year}")
+        return days
+
+    def is_business_day(self, dates) -> np.ndarray:
+        return np.is_busday(self._days(dates), busdaycal=self.busdaycal)
+
+    def offset(self, dates, n, roll: str = 'backward') -> np.ndarray:
+        """
+        Move dates by n business days; non-business dates are first rolled ('backward' = to the
+        previous business day, as for an as-of date falling on a weekend).
+        """
+        result = np.busday_offset(self._days(dates), n, roll=roll, busdaycal=self.busdaycal)
+        self._days(result)
+        return result
+
+    def count(self, start, end) -> np.ndarray:
+        """
+        Business days in [start, end).
+        """
+        return np.busday_count(self._days(start), self._days(end), busdaycal=self.busdaycal)
+
+    def last_n_business_days(self, as_of, n: int, include_as_of: bool = False) -> np.ndarray:
+        """
+        The n business days up to as_of (before it unless include_as_of), most recent first.
+        """
+        # roll='forward' then -1 lands on the last business day strictly before as_of
+        last = self.offset(as_of, 0, roll='backward') if include_as_of else self.offset(as_of, -1, roll='forward')
+        return self.offset(last, -np.arange(n))
+
+
+_CALENDARS: dict = {}
+_LOCK = threading.Lock()
+
+
+def get_calendar(country: str = 'US', start_year: int = CALENDAR_START_YEAR,
+                 end_year: int = CALENDAR_END_YEAR) -> BusinessCalendar:
+    """
+    Process-wide calendar for a country and year range, built on first use.
+    """
+    key = (country, start_year, end_year)
+    with _LOCK:
+        calendar = _CALENDARS.get(key)
+        if calendar is None:
+            calendar = BusinessCalendar.from_country(country, start_year, end_year)
+            _CALENDARS[key] = calendar
+            logger.info(f"Built {country} business calendar {start_year}-{end_year} "
+                        f"({len(calendar.holidays)} holidays)")
+        return calendar
+
+
+def to_date(day: np.datetime64) -> date:
+    return day.astype('datetime64[D]').astype(date)
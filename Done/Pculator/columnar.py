@@ -0,0 +1,51 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+from Done.Pculator.tenor import NAT_ORDINAL, label_to_ordinal, month_end
+
+logger = logging.getLogger(__name__)
+
+
+def deliver_month_to_date(deliver_month: pd.Series) -> pd.Series:
+    """
+    Vectorized 'MMM-YY' (or 'MMM-YYYY') -> month-end Timestamp. Unparseable labels become NaT.
+    """
+    ordinals = label_to_ordinal(deliver_month)
+    bad = (ordinals == NAT_ORDINAL) & deliver_month.notna().to_numpy()
+    if bad.any():
+        logger.warning(f"{int(bad.sum())} invalid deliver_month values, e.g. '{deliver_month[bad].iloc[0]}'")
+    return pd.Series(month_end(ordinals).astype('datetime64[ns]'), index=deliver_month.index)
+
+
+def time_to_expiry(as_of: pd.Series, delivery: pd.Series) -> np.ndarray:
+    """
+    Year fraction (ACT/365) between two datetime columns, floored at 0. Missing dates give 0.
+    """
+    days = (pd.to_datetime(delivery) - pd.to_datetime(as_of)).dt.days.to_numpy(dtype=float)
+    days = np.nan_to_num(days, nan=0.0)
+    return np.where(days > 0, days / 365.0, 0.0)
+
+
+def pfe_vectorized(direction: pd.Series, price: np.ndarray, vol: np.ndarray, t: np.ndarray) -> np.ndarray:
+    """
+    Columnar version of PFEEngine.pfe_calculator; rows with non-positive price/vol/t give 0.
+    """
+    price = np.asarray(price, dtype=float)
+    vol = np.nan_to_num(np.asarray(vol, dtype=float), nan=0.0)
+    t = np.asarray(t, dtype=float)
+
+    direction = direction.astype(str).str.lower()
+    invalid = ~direction.isin(['buy', 'sell'])
+    if invalid.any():
+        logger.warning(f"{int(invalid.sum())} rows with invalid direction. Using 'buy' as default.")
+    is_sell = (direction == 'sell').to_numpy()
+
+    valid = (price > 0) & (vol > 0) & (t > 0)
+    sqrt_t = np.sqrt(np.where(valid, t, 0.0))
+    vol_sq_t = vol ** 2 * t
+    up = 1.645 * vol * sqrt_t - 0.5 * vol_sq_t
+    down = -1.645 * vol * sqrt_t - 0.5 * vol_sq_t
+    pfe = np.where(is_sell, price * (1 - np.exp(down)), price * np.expm1(up))
+    return np.where(valid, pfe, 0.0)
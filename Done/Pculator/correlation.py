@@ -0,0 +1,152 @@
+import logging
+from collections.abc import Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Eigenvalues above -PSD_TOL count as non-negative (rounding noise from EWMA estimates)
+PSD_TOL = 1e-10
+
+
+def cov_to_corr(cov_matrix: np.ndarray) -> np.ndarray:
+    """
+    Covariance to correlation. Flat or missing curves (zero/NaN variance) get a unit diagonal
+    and zero correlation instead of dividing by zero.
+    """
+    cov_matrix = np.asarray(cov_matrix, dtype=float)
+    std_dev = np.sqrt(np.clip(np.diag(cov_matrix), 0.0, None))
+    flat = ~(std_dev > 0)
+    denom = np.outer(std_dev, std_dev)
+    corr_matrix = np.divide(cov_matrix, denom, out=np.zeros_like(cov_matrix), where=denom > 0)
+    corr_matrix = np.nan_to_num(corr_matrix, nan=0.0, posinf=0.0, neginf=0.0)
+    if flat.any():
+        logger.warning(f"{int(flat.sum())} curves with zero variance treated as uncorrelated")
+    np.fill_diagonal(corr_matrix, 1.0)
+    return corr_matrix
+
+
+def nearest_correlation(matrix: np.ndarray, tol: float = 1e-8, max_iter: int = 100) -> np.ndarray:
+    """
+    Nearest correlation matrix (Higham 2002): alternating projections onto the PSD cone and
+    the unit-diagonal set, with Dykstra's correction.
+    """
+    y = (matrix + matrix.T) / 2
+    correction = np.zeros_like(y)
+    for _ in range(max_iter):
+        r = y - correction
+        eigval, eigvec = np.linalg.eigh(r)
+        x = (eigvec * np.clip(eigval, 0.0, None)) @ eigvec.T
+        correction = x - r
+        y_next = (x + x.T) / 2
+        np.fill_diagonal(y_next, 1.0)
+        converged = np.linalg.norm(y_next - y) <= tol * np.linalg.norm(y)
+        y = y_next
+        if converged:
+            break
+
+    # Clip the residual negative spectrum and rescale back to a unit diagonal
+    eigval, eigvec = np.linalg.eigh(y)
+    y = (eigvec * np.clip(eigval, 0.0, None)) @ eigvec.T
+    d = 1 / np.sqrt(np.diag(y))
+    y = y * np.outer(d, d)
+    return (y + y.T) / 2
+
+
+class CorrelationMatrix:
+    """
+    Validated correlation matrix with its square-root factor cached.
+
+    The matrix is checked once on construction (Cholesky, falling back to an eigendecomposition)
+    and repaired with nearest_correlation when it is not PSD. variance / marginal / factor then
+    reuse that work, so portfolio evaluations are O(n^2) and simulations get F with F F^T = R.
+    """
+
+    def __init__(self, matrix: np.ndarray, labels: Sequence | None = None, repair: bool = True):
+        matrix = np.asarray(matrix, dtype=float)
+        if matrix.ndim != 2 or matrix.shape[0] != matrix.shape[1]:
+            raise ValueError(f"Correlation matrix must be square, got shape {matrix.shape}")
+        if labels is not None and len(labels) != len(matrix):
+            raise ValueError("Correlation labels do not match matrix size")
+        if not np.isfinite(matrix).all():
+            raise ValueError("Correlation matrix contains NaN/inf (use from_cov for raw covariances)")
+        if not np.allclose(matrix, matrix.T):
+            raise ValueError("Correlation matrix must be symmetric")
+
+        self.labels = list(labels) if labels is not None else None
+        self.matrix = (matrix + matrix.T) / 2
+        self.repaired = False
+        self._factor = self._validate(repair)
+
+    @classmethod
+    def from_cov(cls, cov_matrix: np.ndarray, labels: Sequence | None = None) -> 'CorrelationMatrix':
+        return cls(cov_to_corr(cov_matrix), labels)
+
+    @classmethod
+    def identity(cls, n: int, labels: Sequence | None = None) -> 'CorrelationMatrix':
+        return cls(np.eye(n), labels)
+
+    def _validate(self, repair: bool) -> np.ndarray:
+        if len(self.matrix) == 0:
+            return np.zeros((0, 0))
+        try:
+            return np.linalg.cholesky(self.matrix)
+        except np.linalg.LinAlgError:
+            pass
+
+        # Singular or indefinite: decide on the spectrum
+        eigval, eigvec = np.linalg.eigh(self.matrix)
+        if eigval[0] < -PSD_TOL:
+            if not repair:
+                raise ValueError(f"Correlation matrix is not positive semi-definite (min eigenvalue {eigval[0]:.3g})")
+            logger.warning(f"Correlation matrix not PSD (min eigenvalue {eigval[0]:.3g}); projecting to nearest correlation")
+            self.matrix = nearest_correlation(self.matrix)
+            self.repaired = True
+            eigval, eigvec = np.linalg.eigh(self.matrix)
+        return eigvec * np.sqrt(np.clip(eigval, 0.0, None))
+
+    def __len__(self) -> int:
+        return len(self.matrix)
+
+    @property
+    def factor(self) -> np.ndarray:
+        """
+        Square root F with F F^T = R (Cholesky factor when R is positive definite). After take()
+        it is the selected rows of the parent's factor, so it can have more columns than rows.
+        """
+        return self._factor
+
+    def variance(self, s: np.ndarray) -> float:
+        """
+        s^T R s (never negative: R is PSD up to rounding).
+        """
+        return max(float(s @ self.matrix @ s), 0.0)
+
+    def marginal(self, s: np.ndarray) -> tuple[float, np.ndarray]:
+        """
+        Portfolio sigma sqrt(s^T R s) and the per-unit marginal R s / sigma (zero when sigma is 0).
+        """
+        rs = self.matrix @ s
+        sigma = np.sqrt(max(float(s @ rs), 0.0))
+        return sigma, rs / sigma if sigma > 0 else np.zeros_like(rs, dtype=float)
+
+    def take(self, idx: Sequence[int]) -> 'CorrelationMatrix':
+        """
+        Rows/columns idx (reordered, repeats allowed), reusing the validated factor.
+        """
+        idx = np.asarray(idx, dtype=np.intp)
+        sub = object.__new__(CorrelationMatrix)
+        sub.labels = [self.labels[i] for i in idx] if self.labels is not None else None
+        sub.matrix = self.matrix[np.ix_(idx, idx)]
+        sub.repaired = self.repaired
+        sub._factor = self._factor[idx]
+        return sub
+
+    def subset(self, labels: Sequence) -> 'CorrelationMatrix':
+        """
+        take() by label.
+        """
+        if self.labels is None:
+            raise ValueError("Correlation matrix has no labels")
+        pos = {label: i for i, label in enumerate(self.labels)}
+        return self.take([pos[label] for label in labels])
@@ -0,0 +1,194 @@
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+from Done.Pculator.business_calendar import get_calendar, to_date
+from Done.Pculator.correlation import CorrelationMatrix
+
+logger = logging.getLogger(__name__)
+
+# (curves, start, end) -> close prices, pricing date x curve
+PriceLoader = Callable[[list, date, date], pd.DataFrame]
+
+
+def get_ini_date(as_of_date: date, his_len: int) -> date:
+    """
+    First pricing date of a his_len business-day window ending at as_of_date: his_len + 1 US
+    business days before the last business day on or before as_of_date.
+    """
+    return to_date(get_calendar().offset(as_of_date, -(his_len + 1), roll='backward'))
+
+
+def ewma_weights(n: int, lambda_: float = 0.94) -> np.ndarray:
+    """
+    Unnormalized EWMA weights, oldest first: lambda^(n-1), ..., lambda, 1.
+    """
+    return lambda_ ** np.arange(n - 1, -1, -1, dtype=float)
+
+
+def compute_vol_ewma(price_df: pd.DataFrame, lambda_: float = 0.94) -> np.ndarray:
+    """
+    EWMA covariance of daily log returns (weights normalized over the window).
+    """
+    log_returns = np.log(price_df / price_df.shift(1)).dropna().to_numpy(dtype=float)
+    weights = ewma_weights(len(log_returns), lambda_)
+    weights /= weights.sum()
+    return (log_returns * weights[:, np.newaxis]).T @ log_returns
+
+
+@dataclass
+class EwmaState:
+    """
+    Rolling EWMA state for one curve set: price window, its returns and sum(w_i r_i r_i^T).
+    """
+    as_of: date
+    prices: pd.DataFrame
+    returns: pd.DataFrame
+    weighted_sum: np.ndarray
+    updates: int = 0
+
+
+class CovarianceEngine:
+    """
+    EWMA covariance matrices, memoized by (curve set, as_of, lambda, history) and rolled
+    forward incrementally: a later as_of only loads the new pricing days and applies
+
+        S_t = lambda^m * (S_{t-1} - dropped terms) + sum_j lambda^(m-1-j) r_j r_j^T
+
+    which is the fixed-window form of S_t = lambda S_{t-1} + r r^T, so results match a full
+    recompute. The state is rebuilt from scratch every `rebuild_every` updates to bound drift.
+    Memos and rolling states are LRU-capped at `cache_size` and shared across request threads
+    under one lock; price loads and matrix work run outside it.
+    """
+
+    def __init__(self, price_loader: PriceLoader, lambda_: float = 0.94, history_length: int = 121,
+                 cache_size: int = 64, rebuild_every: int = 20):
+        self.price_loader = price_loader
+        self.lambda_ = lambda_
+        self.history_length = history_length
+        self.cache_size = cache_size
+        self.rebuild_every = rebuild_every
+        self._memo: OrderedDict = OrderedDict()
+        self._corr_memo: OrderedDict = OrderedDict()
+        self._states: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, risk_curves: list, as_of: date, lambda_: float | None = None,
+            history_length: int | None = None) -> np.ndarray:
+        """
+        Covariance matrix aligned with risk_curves (duplicates allowed, order preserved).
+        """
+        lambda_ = self.lambda_ if lambda_ is None else lambda_
+        history_length = self.history_length if history_length is None else history_length
+        curves = tuple(sorted(set(risk_curves)))
+
+        key = (curves, as_of, lambda_, history_length)
+        with self._lock:
+            cov = self._memo.get(key)
+            if cov is not None:
+                self._memo.move_to_end(key)
+        if cov is None:
+            cov = self._compute(curves, as_of, lambda_, history_length)
+            with self._lock:
+                self._remember(self._memo, key, cov)
+
+        pos = {c: i for i, c in enumerate(curves)}
+        ix = [pos[c] for c in risk_curves]
+        return cov[np.ix_(ix, ix)]
+
+    def get_corr(self, risk_curves: list, as_of: date, lambda_: float | None = None,
+                 history_length: int | None = None) -> CorrelationMatrix:
+        """
+        Validated correlation aligned with risk_curves. PSD check/repair and factorization run
+        once per memoized curve set; callers get a reordered view of the cached factor.
+        """
+        lambda_ = self.lambda_ if lambda_ is None else lambda_
+        history_length = self.history_length if history_length is None else history_length
+        curves = tuple(sorted(set(risk_curves)))
+
+        key = (curves, as_of, lambda_, history_length)
+        with self._lock:
+            corr = self._corr_memo.get(key)
+            if corr is not None:
+                self._corr_memo.move_to_end(key)
+        if corr is None:
+            corr = CorrelationMatrix.from_cov(self.get(list(curves), as_of, lambda_, history_length), curves)
+            with self._lock:
+                self._remember(self._corr_memo, key, corr)
+        return corr.subset(risk_curves)
+
+    def _compute(self, curves: tuple, as_of: date, lambda_: float, history_length: int) -> np.ndarray:
+        start = get_ini_date(as_of, history_length)
+        state_key = (curves, lambda_, history_length)
+        with self._lock:
+            state = self._states.get(state_key)
+
+        if state is not None and state.as_of == as_of:
+            pass
+        elif state is not None and state.as_of < as_of and state.updates < self.rebuild_every:
+            new_prices = self._load(curves, state.as_of + timedelta(days=1), as_of)
+            state = self._roll(state, new_prices, start, as_of, lambda_)
+        else:
+            state = self._build(self._load(curves, start, as_of), as_of, lambda_)
+
+        # Another thread may have rolled the same curve set further while we were loading
+        with self._lock:
+            current = self._states.get(state_key)
+            if current is None or current.as_of <= as_of:
+                self._remember(self._states, state_key, state)
+            else:
+                self._states.move_to_end(state_key)
+
+        n = len(state.returns)
+        if n == 0:
+            raise ValueError(f"No overlapping price history for {len(curves)} curves as of {as_of}")
+        return state.weighted_sum / ewma_weights(n, lambda_).sum()
+
+    def _remember(self, cache: OrderedDict, key, value) -> None:
+        # Caller holds self._lock
+        cache[key] = value
+        cache.move_to_end(key)
+        if len(cache) > self.cache_size:
+            cache.popitem(last=False)
+
+    def _load(self, curves: tuple, start: date, end: date) -> pd.DataFrame:
+        prices = self.price_loader(list(curves), start, end)
+        prices.index = pd.to_datetime(prices.index)
+        return prices.reindex(columns=list(curves)).sort_index()
+
+    @staticmethod
+    def _build(prices: pd.DataFrame, as_of: date, lambda_: float) -> EwmaState:
+        returns = np.log(prices / prices.shift(1)).dropna()
+        r = returns.to_numpy(dtype=float)
+        weighted_sum = (r * ewma_weights(len(r), lambda_)[:, np.newaxis]).T @ r
+        return EwmaState(as_of, prices, returns, weighted_sum)
+
+    def _roll(self, state: EwmaState, new_prices: pd.DataFrame, start: date, as_of: date,
+              lambda_: float) -> EwmaState:
+        prices = pd.concat([state.prices, new_prices])
+        prices = prices[~prices.index.duplicated(keep='last')].sort_index()
+        prices = prices[prices.index >= pd.Timestamp(start)]
+        returns = np.log(prices / prices.shift(1)).dropna()
+
+        # Incremental update only when the new window is "old window minus head plus new days"
+        old = state.returns
+        d = int(np.searchsorted(old.index, returns.index[0])) if len(returns) else len(old)
+        tail = old.index[d:]
+        if len(returns) < len(tail) or not returns.index[:len(tail)].equals(tail):
+            logger.info(f"Price window changed shape as of {as_of}; rebuilding EWMA state")
+            return self._build(prices, as_of, lambda_)
+
+        n = len(old)
+        dropped = old.iloc[:d].to_numpy(dtype=float)
+        added = returns.iloc[len(tail):].to_numpy(dtype=float)
+        m = len(added)
+
+        weighted_sum = state.weighted_sum - (dropped * ewma_weights(n, lambda_)[:d, np.newaxis]).T @ dropped
+        weighted_sum = lambda_ ** m * weighted_sum + (added * ewma_weights(m, lambda_)[:, np.newaxis]).T @ added
+        return EwmaState(as_of, prices, returns, weighted_sum, state.updates + 1)
@@ -0,0 +1,72 @@
+import logging
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+class CurveRegistry:
+    """
+    (commodity, destination) -> curve root lookups, built once from a curve mapping.
+
+    Accepts either the CURVE_MAPPING_LIST DataFrame ('Curve_Root') or the
+    curve_mapping_source list of dicts ('curve_root'). The first row wins for duplicated pairs.
+    """
+
+    def __init__(self, mapping: pd.DataFrame | list[dict]):
+        frame = pd.DataFrame(mapping)
+        frame = frame.rename(columns={'Curve_Root': 'curve_root', 'Commodity': 'commodity',
+                                      'Destination': 'destination'})
+        frame = frame[['commodity', 'destination', 'curve_root']].drop_duplicates(['commodity', 'destination'])
+
+        self._roots = {(c, d): r for c, d, r in frame.itertuples(index=False)}
+        self._pairs = pd.MultiIndex.from_frame(frame[['commodity', 'destination']])
+        self._root_values = frame['curve_root'].to_numpy(dtype=object)
+
+        by_commodity, by_destination = defaultdict(set), defaultdict(set)
+        for c, d in self._roots:
+            by_commodity[c].add(d)
+            by_destination[d].add(c)
+        self._destinations = {c: sorted(ds) for c, ds in by_commodity.items()}
+        self._commodities = {d: sorted(cs) for d, cs in by_destination.items()}
+
+        self.commodities = sorted(self._destinations)
+        self.destinations = sorted(self._commodities)
+
+    def __len__(self) -> int:
+        return len(self._roots)
+
+    def curve_root(self, commodity: str, destination: str, default: str | None = None) -> str | None:
+        """
+        Curve root for one (commodity, destination) pair.
+        """
+        return self._roots.get((commodity, destination), default)
+
+    def destinations_for(self, commodity: str) -> list[str]:
+        """
+        Sorted destinations available for a commodity.
+        """
+        return self._destinations.get(commodity, [])
+
+    def commodities_for(self, destination: str) -> list[str]:
+        """
+        Sorted commodities available for a destination.
+        """
+        return self._commodities.get(destination, [])
+
+    def map_roots(self, commodities, destinations, unknown: str | None = 'UNKNOWN') -> np.ndarray:
+        """
+        Bulk curve-root mapping for whole columns; unmapped pairs get `unknown`.
+        """
+        keys = pd.MultiIndex.from_arrays([np.asarray(commodities, dtype=object),
+                                          np.asarray(destinations, dtype=object)])
+        pos = self._pairs.get_indexer(keys)
+        out = np.full(len(pos), unknown, dtype=object)
+        hit = pos >= 0
+        out[hit] = self._root_values[pos[hit]]
+        if not hit.all():
+            for commodity, destination in keys[~hit].unique():
+                logger.error(f"No curve root found for commodity '{commodity}' and origin '{destination}'")
+        return out
@@ -0,0 +1,20 @@
+import logging
+
+import numpy as np
+
+from Done.Pculator.correlation import CorrelationMatrix
+
+logger = logging.getLogger(__name__)
+
+Z_95 = 1.645
+
+
+def diversify(s: np.ndarray, corr: CorrelationMatrix | np.ndarray, z: float = Z_95) -> tuple[float, np.ndarray]:
+    """
+    Diversified PFE z*sqrt(s^T R s) and per-unit marginal contributions (contribution = s * marginal,
+    summing to the total by Euler allocation).
+    """
+    if not isinstance(corr, CorrelationMatrix):
+        corr = CorrelationMatrix(corr)
+    sigma, marginal = corr.marginal(s)
+    return float(z * sigma), z * marginal
@@ -0,0 +1,43 @@
+# gunicorn -c Done/Pculator/gunicorn.conf.py
+#
+# preload_app imports the controller (and loads the market snapshot) once in the master;
+# forked workers share it copy-on-write. The master alone owns the reload schedule: when it
+# has published a new snapshot it HUPs itself, gunicorn forks a fresh set of workers (which
+# share the new snapshot) and gracefully retires the old ones. Every worker therefore serves
+# the same snapshot id, and each interval costs one load rather than one per worker.
+#
+# Worker memory is not shared, so what-if books are committed to PFE_WHAT_IF_DIR and any worker
+# rebuilds a counterparty's book from there; they survive the HUP roll. The directory must be
+# shared (or the /what_if routes pinned to one host) when running on several hosts.
+import os
+import signal
+
+wsgi_app = "Done.Pculator.app:app"
+bind = os.environ.get("PFE_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("PFE_WORKERS", "4"))
+threads = int(os.environ.get("PFE_THREADS", "4"))
+worker_class = "gthread"
+preload_app = True
+timeout = 120
+
+
+def when_ready(server):
+    from Done.Pculator.Controller.pfe_controller import market
+
+    def roll_workers(state):
+        server.log.info(f"Snapshot {state.snapshot_id} loaded, rolling workers")
+        os.kill(os.getpid(), signal.SIGHUP)
+
+    market.start_scheduler(on_change=roll_workers)
+    server.log.info(f"Master serving snapshot {market.get().snapshot_id}")
+
+
+def pre_fork(server, worker):
+    from Done.Pculator.Controller.pfe_controller import market
+    market.wait_idle()
+
+
+def post_fork(server, worker):
+    from Done.Pculator.Controller.pfe_controller import market
+    market.disable_scheduler()
+    server.log.info(f"Worker {worker.pid} serving snapshot {market.get().snapshot_id}")
@@ -1,185 +1,160 @@
 import os
 import math
 import logging
-from datetime import datetime, date, timedelta
-from dateutil.relativedelta import relativedelta
+from datetime import datetime, date
 from typing import Optional, List
 
 import pandas as pd
 import numpy as np
-import holidays
 import jv
+from scipy.stats import norm
 from Sandbox.horizon.PFE_Calculator.models.common import (
     CURVE_MAPPING_LIST,
-    MONTH_CODE_MAP,
     querys,
     prd_db,
 )
 from xlsxwriter.utility import xl_col_to_name
+from Done.Pculator.columnar import (
+    deliver_month_to_date,
+    time_to_expiry,
+    pfe_vectorized,
+)
+from Done.Pculator.vol_store import VolStore
+from Done.Pculator.vol_cache import VolCache, JvVolLoader
+from Done.Pculator.tenor import (
+    NAT_ORDINAL,
+    TenorIndex,
+    date_to_ordinal,
+    label_to_ordinal,
+    month_end,
+    ordinal_to_label,
+)
+from Done.Pculator.business_calendar import get_calendar
+from Done.Pculator.curve_registry import CurveRegistry
+from Done.Pculator.correlation import CorrelationMatrix
+from Done.Pculator.streaming import DEFAULT_CHUNK_SIZE, OUTPUT_FORMATS, ChunkWriter, iter_chunks, write_frame
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Hash lookups over CURVE_MAPPING_LIST, built once per process
+CURVE_REGISTRY = CurveRegistry(CURVE_MAPPING_LIST)
+
+# Columns summed into the running totals of a streaming run
+STREAM_SUM_COLS = ['Existing_MTM', 'position', 'PFE_Value', 'PFE_Output', 'Total_Exposure']
+
+# Excel column widths are estimated from a bounded sample instead of every cell
+WIDTH_SAMPLE_ROWS = 1000
+MAX_COL_WIDTH = 60
+
 
 class PFEEngine:
     """
     Engine to process Potential Future Exposure (PFE) calculations and template management.
     """
 
-    def __init__(self, template_path: str = 'PFE_template.xlsx'):
+    def __init__(self, template_path: str = 'PFE_template.xlsx', columnar: bool = True,
+                 vol_data: Optional[pd.DataFrame] = None, vol_cache_dir: Optional[str] = None):
         self.template_path = template_path
-        # Preload volatility data
-        self.vol_data = jv.download_data_db(querys.viya_vol, connection_type=prd_db)
-        # Initialize empty holidays - will be dynamically updated
-        self.us_holidays = holidays.US(years=[])
+        # Columnar (whole-array) pricing by default; row-wise path kept for reference/benchmarks
+        self.columnar = columnar
+        # Preload volatility data (local Parquet cache + incremental refresh when a cache dir is given)
+        if vol_data is None and vol_cache_dir:
+            vol_data = VolCache(vol_cache_dir, JvVolLoader(querys.viya_vol, prd_db)).load()
+        elif vol_data is None:
+            vol_data = jv.download_data_db(querys.viya_vol, connection_type=prd_db)
+        self.vol_data = vol_data
+        self.vol_store = VolStore(vol_data)
+        self.tenor_index = TenorIndex.from_vol_data(vol_data)
 
     @staticmethod
     def get_prod_list() -> list[str]:
         """
         Return sorted unique list of products (commodities).
         """
-        return sorted({row['commodity'] for _, row in CURVE_MAPPING_LIST.iterrows()})
+        return CURVE_REGISTRY.commodities
 
     @staticmethod
     def convert_deliver_month_to_date(date_str: str) -> date | None:
         """
         Convert 'MMM-YY' string to last day of that month.
         """
-        try:
-            month_str, year_short = date_str.split('-')
-            # Handle two-digit year conversion
-            full_year = 2000 + int(year_short) if int(year_short) < 100 else int(year_short)
-            first = datetime.strptime(f"{month_str}-{full_year}", "%b-%Y")
-            last = (first.replace(day=1) + relativedelta(months=1) - relativedelta(days=1)).date()
-            return last
-        except Exception as e:
-            logger.warning(f"Invalid deliver_month '{date_str}': {str(e)}")
+        ordinal = label_to_ordinal([date_str])[0]
+        if ordinal == NAT_ORDINAL:
+            logger.warning(f"Invalid deliver_month '{date_str}'")
             return None
+        return month_end(ordinal).item()
 
     @staticmethod
     def deliver_month_list(years: int = 5) -> list[str]:
         """
         Generate future 'MMM-YY' labels for next N years.
         """
-        today = datetime.today().replace(day=1)
-        end = today + relativedelta(years=years, day=31)
-        months = pd.date_range(start=today, end=end, freq='M')
-        return [d.strftime('%b-%y') for d in months]
+        this_month = date_to_ordinal([datetime.today()])[0]
+        return list(ordinal_to_label(np.arange(this_month, this_month + 12 * years + 1)))
 
     def get_aod_list(self, days: int = 31) -> list[str]:
         """
         Recent workdays (YYYY-MM-DD), excluding weekends and US holidays.
         """
-        today = datetime.today().date()
-        start_date = today - timedelta(days=days)
-
-        # Update holidays to cover the required date range
-        years = range(start_date.year, today.year + 1)
-        if years:
-            self.us_holidays = holidays.US(years=years)
-
-        workdays = []
-        current = today
-        while len(workdays) < days:
-            current -= timedelta(days=1)
-            if current.weekday() < 5 and current not in self.us_holidays:
-                workdays.append(current.strftime('%Y-%m-%d'))
-        return workdays
+        aods = get_calendar().last_n_business_days(datetime.today().date(), days)
+        return list(np.datetime_as_string(aods, unit='D'))
 
     @staticmethod
     def risk_cr(commodity: str, origin: str) -> str:
         """
         Lookup curve root by commodity and destination.
         """
-        df = CURVE_MAPPING_LIST
-        sel = df[(df['commodity'] == commodity) & (df['destination'] == origin)]['Curve_Root']
-        if sel.empty:
+        root = CURVE_REGISTRY.curve_root(commodity, origin)
+        if root is None:
             logger.error(f"No curve root found for commodity '{commodity}' and origin '{origin}'")
             return "UNKNOWN"
-        return sel.item()
+        return root
 
     def get_date_list(self, risk_curve_root: str) -> list[date]:
         """
         Available factor dates (first of month) for a given curve root.
         """
-        pattern = fr'^{risk_curve_root}_[A-Z][0-9]{{2}}$'
-        mask = self.vol_data['RISK_FACTOR'].str.contains(pattern, regex=True, na=False)
-        if not mask.any():
+        dates = self.tenor_index.months(risk_curve_root)
+        if not dates:
             logger.warning(f"No volatility data found for curve root: {risk_curve_root}")
-            return []
-        code_to_mon = {v: k for k, v in MONTH_CODE_MAP.items()}
-        dates = set()
-        for factor in self.vol_data.loc[mask, 'RISK_FACTOR']:
-            code = factor.split('_')[-1]
-            mon_code, yr = code[0], code[1:]
-            mon = code_to_mon.get(mon_code)
-            if mon:
-                try:
-                    dt = datetime.strptime(f"{mon}-{yr}", "%b-%y").date().replace(day=1)
-                    dates.add(dt)
-                except ValueError:
-                    logger.warning(f"Invalid date code in factor: {factor}")
-        return sorted(dates, reverse=True)
+        return dates
 
-    def match_curve(self, risk_curve_root: str, deliver_month: str) -> str | None:
+    def match_curve(self, risk_curve_root: str, deliver_month: str, clamp: bool = True) -> str | None:
         """
         Find nearest RISK_FACTOR code for given deliver_month.
         """
-        try:
-            target = datetime.strptime(deliver_month, "%b-%y").date().replace(day=1)
-        except ValueError:
+        if label_to_ordinal([deliver_month])[0] == NAT_ORDINAL:
             logger.error(f"Invalid deliver_month format: {deliver_month}")
             return None
 
-        dates = self.get_date_list(risk_curve_root)
-        if not dates:
+        factor = self.tenor_index.match(risk_curve_root, deliver_month, clamp=clamp)
+        if factor is None:
             logger.warning(f"No available dates for curve root: {risk_curve_root}")
-            return None
+        return factor
 
-        # Find the nearest date
-        nearest = min(dates, key=lambda d: abs((d - target).days))
-        mon_code = next((k for k, v in MONTH_CODE_MAP.items() if v == nearest.strftime('%b')), None)
-        if not mon_code:
-            logger.error(f"Month code not found for date: {nearest}")
-            return None
-
-        yr = str(nearest.year)[-2:]
-        return f"{risk_curve_root}_{mon_code}{yr}"
+    def match_curves(self, roots: pd.Series, deliver_months: pd.Series, clamp: bool = True) -> np.ndarray:
+        """
+        Vectorized match_curve over whole columns (binary search in the tenor index).
+        """
+        factors = self.tenor_index.match_many(roots, deliver_months, clamp=clamp)
+        if (missing := pd.isna(factors)).any():
+            logger.warning(f"No matching risk factor for {int(missing.sum())} contracts")
+        return factors
 
     def get_vol(self, risk_curve: str, as_of: date) -> float | None:
         """
-        Fetch annualized volatility (sqrt(252)) from vol_data.
+        Fetch annualized volatility (sqrt(252)) from the vol store.
         """
         if not risk_curve:
             return None
 
-        # Try to get volatility from the exact date
-        sel = self.vol_data[
-            (self.vol_data['RISK_FACTOR'] == risk_curve) &
-            (self.vol_data['AS_OF_DATE'] == pd.to_datetime(as_of))
-            ]
-
-        # If not found, try recent dates
-        if sel.empty:
-            for days_back in [1, 2, 3, 7]:
-                target_date = as_of - timedelta(days=days_back)
-                sel = self.vol_data[
-                    (self.vol_data['RISK_FACTOR'] == risk_curve) &
-                    (self.vol_data['AS_OF_DATE'] == pd.to_datetime(target_date))
-                    ]
-                if not sel.empty:
-                    break
-
-        if sel.empty:
+        # Latest vol on or before as_of, up to a week old
+        vol = self.vol_store.get(risk_curve, as_of, max_days_back=7)
+        if vol is None:
             logger.warning(f"No volatility found for {risk_curve} as of {as_of} (and recent days)")
             return None
-
-        try:
-            val = sel['VOLATILITY'].iloc[0]
-            return float(val * math.sqrt(252))  # Annualize daily volatility
-        except Exception as e:
-            logger.error(f"Error processing volatility for {risk_curve}: {str(e)}")
-            return None
+        return float(vol * math.sqrt(252))  # Annualize daily volatility
 
     @staticmethod
     def calculate_time_to_expiry(as_of: date, delivery: date) -> float:
@@ -215,27 +190,10 @@ class PFEEngine:
         # Return PFE based on direction
         return price * (-1 + math.exp(up)) if direction == 'buy' else price * (1 - math.exp(down))
 
-    def process_dataframe(self, df: pd.DataFrame) -> pd.DataFrame:
+    def _price_rows(self, df: pd.DataFrame) -> None:
         """
-        Full PFE pipeline: date conversion, curve matching, vol fetch, PFE & exposure.
+        Row-wise pricing (one df.apply pass per step).
         """
-        req = ['as_of_date', 'product', 'origin', 'deliver_month', 'direction', 'contract_price', 'Existing_MTM']
-        if missing := set(req) - set(df.columns):
-            logger.error(f"Missing required columns: {missing}")
-            return df
-
-        # Data validation
-        if df['contract_price'].lt(0).any():
-            logger.warning("Negative contract prices found. Check data validity.")
-
-        # Ensure position column exists and validate
-        if 'position' not in df.columns:
-            df['position'] = 1
-        elif df['position'].eq(0).any():
-            logger.warning("Zero positions found. May affect exposure calculations.")
-
-        # Convert dates
-        df['as_of_date'] = pd.to_datetime(df['as_of_date']).dt.date
         df['delivery_date'] = df['deliver_month'].apply(self.convert_deliver_month_to_date)
 
         # Calculate time to expiry
@@ -270,6 +228,57 @@ class PFEEngine:
             axis=1
         )
 
+    def _price_columnar(self, df: pd.DataFrame) -> None:
+        """
+        Columnar pricing: same columns as _price_rows, computed as whole-array operations.
+        """
+        delivery = deliver_month_to_date(df['deliver_month'])
+        df['delivery_date'] = delivery.dt.date
+        df['time_to_exp'] = time_to_expiry(df['as_of_date'], delivery)
+
+        # Curve root via one hash lookup on (commodity, destination)
+        df['Risk_Curve'] = CURVE_REGISTRY.map_roots(df['product'], df['origin'])
+
+        # Match curve only for live contracts, then join volatility on (factor, as_of)
+        live = df['time_to_exp'].to_numpy() > 0
+        factors = np.full(len(df), None, dtype=object)
+        if live.any():
+            factors[live] = self.match_curves(df.loc[live, 'Risk_Curve'], df.loc[live, 'deliver_month'])
+        df['contract_vol'] = self.vol_store.get_many(factors, df['as_of_date'], max_days_back=7) * math.sqrt(252)
+
+        df['PFE_Value'] = pfe_vectorized(
+            df['direction'],
+            df['contract_price'].to_numpy(dtype=float),
+            df['contract_vol'].to_numpy(),
+            df['time_to_exp'].to_numpy()
+        )
+
+    def process_dataframe(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Full PFE pipeline: date conversion, curve matching, vol fetch, PFE & exposure.
+        """
+        req = ['as_of_date', 'product', 'origin', 'deliver_month', 'direction', 'contract_price', 'Existing_MTM']
+        if missing := set(req) - set(df.columns):
+            logger.error(f"Missing required columns: {missing}")
+            return df
+
+        # Data validation
+        if df['contract_price'].lt(0).any():
+            logger.warning("Negative contract prices found. Check data validity.")
+
+        # Ensure position column exists and validate
+        if 'position' not in df.columns:
+            df['position'] = 1
+        elif df['position'].eq(0).any():
+            logger.warning("Zero positions found. May affect exposure calculations.")
+
+        # Convert dates
+        df['as_of_date'] = pd.to_datetime(df['as_of_date']).dt.date
+        if self.columnar:
+            self._price_columnar(df)
+        else:
+            self._price_rows(df)
+
         # Calculate outputs
         df['PFE_Output'] = df['PFE_Value'] * df['position']
         df['Total_Exposure'] = df['PFE_Output'] + df['Existing_MTM']
@@ -277,10 +286,25 @@ class PFEEngine:
         return df
 
     @staticmethod
-    def write_results(df: pd.DataFrame, path: str) -> None:
+    def column_width(col: pd.Series, col_name: str) -> int:
+        """
+        Excel column width from the first/last rows only, capped at MAX_COL_WIDTH.
+        """
+        sample = pd.concat([col.head(WIDTH_SAMPLE_ROWS), col.tail(1)])
+        width = max(int(sample.astype(str).str.len().max()) if sample.notna().any() else 0, len(col_name)) + 2
+        return min(width, MAX_COL_WIDTH)
+
+    @classmethod
+    def write_results(cls, df: pd.DataFrame, path: str) -> None:
         """
         Export DataFrame to Excel with formatting.
+        Non-Excel paths (.parquet/.feather/.csv) are written as plain columnar data.
         """
+        if not path.lower().endswith(('.xlsx', '.xlsm')):
+            write_frame(df, path)
+            logger.info(f"Results saved successfully: {path}")
+            return
+
         try:
             with pd.ExcelWriter(path, engine='xlsxwriter') as writer:
                 df.to_excel(writer, index=False, sheet_name='PFE_Results')
@@ -294,7 +318,7 @@ class PFEEngine:
                 # Apply column formatting
                 for col_idx, col_name in enumerate(df.columns):
                     # Set column width
-                    width = max(df[col_name].astype(str).map(len).max(), len(col_name)) + 2
+                    width = cls.column_width(df[col_name], col_name)
                     ws.set_column(col_idx, col_idx, width)
 
                     # Apply format based on column type
@@ -345,7 +369,7 @@ class PFEEngine:
         """
         try:
             products = self.get_prod_list()
-            origins = sorted({row['destination'] for _, row in CURVE_MAPPING_LIST.iterrows()})
+            origins = CURVE_REGISTRY.destinations
             months = self.deliver_month_list()
             aods = self.get_aod_list()
             dirs = ['Buy', 'Sell']
@@ -413,7 +437,7 @@ class PFEEngine:
             logger.error(f"Failed to create template: {str(e)}")
             raise
 
-    def run(self) -> None:
+    def run(self, output_format: str = 'xlsx') -> None:
         try:
             if not os.path.exists(self.template_path):
                 logger.info(f"Template not found. Creating {self.template_path}...")
@@ -433,7 +457,7 @@ class PFEEngine:
 
             # Generate output filename
             stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            fname = f"PFE_result_{stamp}.xlsx"
+            fname = f"PFE_result_{stamp}{OUTPUT_FORMATS[output_format]}"
 
             logger.info(f"Saving results to {fname}")
             self.write_results(out, fname)
@@ -442,16 +466,14 @@ class PFEEngine:
             logger.error(f"An error occurred during processing: {str(e)}")
             logger.exception("Stack trace:")
 
+    @staticmethod
     def diversified_pfe_varcov(contracts, corr_matrix, alpha=0.95):
         n = len(contracts)
-        if corr_matrix.shape != (n, n):
+        # 传入 CorrelationMatrix 时复用其校验结果, 否则只校验一次 (非对称/非半正定直接报错)
+        corr = corr_matrix if isinstance(corr_matrix, CorrelationMatrix) else CorrelationMatrix(corr_matrix, repair=False)
+        if len(corr) != n:
             raise ValueError("Correlation matrix must be n x n")
 
-
-        if not (np.allclose(corr_matrix, corr_matrix.T) or
-                np.any(np.linalg.eigvalsh(corr_matrix) < 0)):
-            raise ValueError("Correlation matrix must be symmetric positive semi-definite")
-
         z = norm.ppf(alpha)
         s = np.zeros(n)
 
@@ -464,9 +486,25 @@ class PFEEngine:
             sign = 1 if c["direction"].lower() == "buy" else -1
             s[i] = sign * c["vol"] * np.sqrt(c["tte"]) * c["price"] * c["quantity"]
 
-        portfolio_variance = s @ corr_matrix @ s
-        if portfolio_variance < 0:
-            raise ValueError("Negative portfolio variance (invalid correlation matrix?)")
+        sigma_port = np.sqrt(corr.variance(s))
+        return z * sigma_port
 
-        sigma_port = np.sqrt(portfolio_variance)
-        return z * sigma_port
\ No newline at end of file
+    def run_streaming(self, input_path: str, output_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> dict:
+        """
+        Chunked pipeline for large inputs (xlsx/csv/parquet): each chunk is priced and appended
+        to output_path (csv/parquet/feather), so peak memory is bounded by chunk_size.
+        """
+        totals = pd.Series(0.0, index=STREAM_SUM_COLS)
+
+        with ChunkWriter(output_path) as writer:
+            for i, chunk in enumerate(iter_chunks(input_path, chunk_size)):
+                out = self.process_dataframe(chunk)
+                if 'PFE_Output' not in out.columns:
+                    raise ValueError(f"Chunk {i + 1} could not be priced (missing required columns)")
+                writer.write(out)
+                totals += out[STREAM_SUM_COLS].sum()
+                logger.info(f"Chunk {i + 1}: {writer.rows} rows written to {output_path}")
+
+        result = {'rows': writer.rows, 'totals': totals.to_dict()}
+        logger.info(f"Streaming run complete: {result}")
+        return result
@@ -0,0 +1,179 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import logging
+import tempfile
+import threading
+import traceback
+from concurrent.futures import BrokenExecutor, Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+# Job directories live here; shared by every web worker on the host
+JOB_DIR = os.environ.get('PFE_JOB_DIR', os.path.join(tempfile.gettempdir(), 'pfe_jobs'))
+JOB_WORKERS = int(os.environ.get('PFE_JOB_WORKERS', '2'))
+# Finished job directories older than this are removed on the next submit
+JOB_TTL = int(os.environ.get('PFE_JOB_TTL', str(24 * 3600)))
+
+STATUS_FILE = 'status.json'
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+
+def _now() -> str:
+    return datetime.now().isoformat(timespec='seconds')
+
+
+def read_status(job_dir: str) -> dict:
+    with open(os.path.join(job_dir, STATUS_FILE)) as f:
+        return json.load(f)
+
+
+def write_status(job_dir: str, **fields) -> dict:
+    """
+    Merge fields into the job's status file; written to a temp file and renamed so readers in
+    other processes never see a partial document.
+    """
+    path = os.path.join(job_dir, STATUS_FILE)
+    status = read_status(job_dir) if os.path.exists(path) else {}
+    status.update(fields)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(status, f, default=str)
+    os.replace(tmp, path)
+    return status
+
+
+class JobProgress:
+    """
+    Progress callback handed to job functions: update(stage, done, total). Throttled so a
+    tight loop does not rewrite the status file on every chunk.
+    """
+
+    def __init__(self, job_dir: str, min_interval: float = 0.5):
+        self.job_dir = job_dir
+        self.min_interval = min_interval
+        self._last = 0.0
+
+    def update(self, stage: str, done: int, total: int | None = None, force: bool = False) -> None:
+        now = time.monotonic()
+        if force or now - self._last >= self.min_interval:
+            write_status(self.job_dir, stage=stage, done=done, total=total)
+            self._last = now
+
+
+def run_job(job_dir: str, fn: Callable, args: tuple, kwargs: dict) -> None:
+    """
+    Executed in the pool: fn(*args, job_dir=..., progress=JobProgress, **kwargs) returns a dict
+    that may name a 'result_file' inside job_dir. Status is always left as done or failed.
+    """
+    write_status(job_dir, state=RUNNING, started_at=_now(), pid=os.getpid())
+    try:
+        result = fn(*args, job_dir=job_dir, progress=JobProgress(job_dir), **kwargs) or {}
+        write_status(job_dir, state=DONE, finished_at=_now(), result=result,
+                     result_file=result.get('result_file'))
+    except Exception as e:
+        logger.error(f"Job {os.path.basename(job_dir)} failed: {str(e)}")
+        write_status(job_dir, state=FAILED, finished_at=_now(), error=str(e),
+                     traceback=traceback.format_exc(limit=5))
+
+
+class JobQueue:
+    """
+    Local job subsystem: submit() creates a job directory (inputs, status.json, result file),
+    runs the work on a process pool and returns the job id at once. Status lives on disk, so
+    any gunicorn worker can answer status/result requests for a job another worker started.
+    """
+
+    def __init__(self, root: str = JOB_DIR, workers: int = JOB_WORKERS, use_processes: bool = True):
+        self.root = root
+        self.workers = workers
+        self.use_processes = use_processes
+        self._executor: Executor | None = None
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _pool(self) -> Executor:
+        # Created on first submit, i.e. after gunicorn has forked this worker
+        with self._lock:
+            if self._executor is None:
+                pool_cls = ProcessPoolExecutor if self.use_processes else ThreadPoolExecutor
+                self._executor = pool_cls(max_workers=self.workers)
+            return self._executor
+
+    def new_job(self, kind: str) -> tuple[str, str]:
+        """
+        Reserve a job id and directory (callers save uploaded inputs there before submit).
+        """
+        job_id = uuid.uuid4().hex
+        job_dir = os.path.join(self.root, job_id)
+        os.makedirs(job_dir)
+        write_status(job_dir, job_id=job_id, kind=kind, state=QUEUED, submitted_at=_now(),
+                     stage=None, done=0, total=None)
+        return job_id, job_dir
+
+    def submit(self, job_id: str, fn: Callable, *args, **kwargs) -> str:
+        """
+        Queue fn for a job from new_job(); fn must be a module-level function (picklable).
+        """
+        self.prune()
+        job_dir = self.job_dir(job_id)
+        try:
+            future = self._pool().submit(run_job, job_dir, fn, args, kwargs)
+        except Exception as e:
+            write_status(job_dir, state=FAILED, finished_at=_now(), error=f"Could not queue job: {str(e)}")
+            raise
+        future.add_done_callback(lambda f: self._on_done(job_dir, f))
+        return job_id
+
+    def _on_done(self, job_dir: str, future) -> None:
+        # run_job records its own failures; this catches a worker process that died outright
+        if future.cancelled() or future.exception() is None:
+            return
+        if isinstance(future.exception(), BrokenExecutor):
+            with self._lock:
+                self._executor = None
+        if read_status(job_dir).get('state') not in (DONE, FAILED):
+            write_status(job_dir, state=FAILED, finished_at=_now(), error=f"Job worker died: {str(future.exception())}")
+
+    def job_dir(self, job_id: str) -> str:
+        # job ids are uuid hex; anything else never maps into the job root
+        if not job_id.isalnum():
+            raise KeyError(job_id)
+        return os.path.join(self.root, job_id)
+
+    def status(self, job_id: str) -> dict:
+        try:
+            status = read_status(self.job_dir(job_id))
+        except (KeyError, FileNotFoundError):
+            raise KeyError(f"Unknown job: {job_id}")
+        status.pop('traceback', None)
+        return status
+
+    def result_path(self, job_id: str) -> str:
+        """
+        Path of a finished job's result file; KeyError if unknown, ValueError if not done.
+        """
+        status = self.status(job_id)
+        if status['state'] != DONE or not status.get('result_file'):
+            raise ValueError(f"Job {job_id} is {status['state']}")
+        return os.path.join(self.job_dir(job_id), status['result_file'])
+
+    def prune(self, max_age: int = JOB_TTL) -> None:
+        cutoff = time.time() - max_age
+        for name in os.listdir(self.root):
+            job_dir = os.path.join(self.root, name)
+            try:
+                if read_status(job_dir).get('state') in (DONE, FAILED) and os.path.getmtime(job_dir) < cutoff:
+                    shutil.rmtree(job_dir, ignore_errors=True)
+            except (OSError, ValueError):
+                continue
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Load test for the PFE controller: p50/p99 latency of /calculate_pfe and /get_available_months.
+
+    python -m Done.Pculator.loadtest --url http://localhost:8000 -n 2000 -c 16
+    python -m Done.Pculator.loadtest -n 500        # in-process, Flask test client
+"""
+import json
+import time
+import argparse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from Done.Pculator.tenor import FUTURES_MONTH_CODES
+
+ENDPOINTS = ['/calculate_pfe', '/get_available_months']
+
+
+def build_payloads(state, n: int, seed: int = 5) -> list[tuple[str, dict]]:
+    """
+    n requests alternating between the endpoints, drawn from the snapshot's curve mapping
+    and risk factors (so most /calculate_pfe calls hit a real vol).
+    """
+    rng = np.random.default_rng(seed)
+    registry = state.curve_registry
+    pairs = [(c, d) for c in registry.commodities for d in registry.destinations_for(c)]
+    by_root = {}
+    for c, d in pairs:
+        by_root.setdefault(registry.curve_root(c, d), []).append((c, d))
+
+    # 风险因子 -> (商品, 目的地, YYYY-MM)
+    trades = []
+    for factor in state.first_vol.index:
+        root, code = factor.rsplit('_', 1)
+        if root in by_root and len(code) == 3 and code[0] in FUTURES_MONTH_CODES and code[1:].isdigit():
+            c, d = by_root[root][0]
+            trades.append((c, d, f"20{code[1:]}-{FUTURES_MONTH_CODES.index(code[0]) + 1:02d}"))
+    if not trades:
+        raise ValueError("Snapshot has no risk factors matching the curve mapping")
+
+    payloads = []
+    for i in range(n):
+        c, d, month = trades[rng.integers(len(trades))]
+        if i % 2 == 0:
+            payloads.append(('/calculate_pfe', {
+                'commodity': c, 'destination': d, 'deliver_date': month,
+                'direction': 'Buy' if rng.random() < 0.5 else 'Sell',
+                'position': int(rng.integers(1, 1000)), 'price': round(float(rng.uniform(100, 600)), 2),
+            }))
+        else:
+            payloads.append(('/get_available_months', {'commodity': c, 'destination': d}))
+    return payloads
+
+
+def http_sender(base_url: str):
+    def send(endpoint: str, payload: dict) -> int:
+        req = urllib.request.Request(
+            base_url.rstrip('/') + endpoint, data=json.dumps(payload).encode(),
+            headers={'Content-Type': 'application/json'}, method='POST'
+        )
+        try:
+            with urllib.request.urlopen(req, timeout=30) as resp:
+                resp.read()
+                return resp.status
+        except urllib.error.HTTPError as e:
+            return e.code
+    return send
+
+
+def client_sender(app):
+    def send(endpoint: str, payload: dict) -> int:
+        try:
+            return app.test_client().post(endpoint, json=payload).status_code
+        except Exception:
+            # 测试客户端会把未处理异常抛给调用方, 按 500 计
+            return 500
+    return send
+
+
+def run_load(send, payloads: list[tuple[str, dict]], concurrency: int = 8) -> dict:
+    """
+    Fire payloads from `concurrency` threads; per-endpoint count, errors, p50/p99/max in ms.
+    """
+    def timed(item):
+        endpoint, payload = item
+        start = time.perf_counter()
+        status = send(endpoint, payload)
+        return endpoint, status, (time.perf_counter() - start) * 1e3
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(timed, payloads))
+    elapsed = time.perf_counter() - start
+
+    report = {'requests': len(results), 'seconds': elapsed, 'rps': len(results) / elapsed}
+    for endpoint in ENDPOINTS:
+        lat = np.array([ms for e, _, ms in results if e == endpoint])
+        if not len(lat):
+            continue
+        report[endpoint] = {
+            'count': len(lat),
+            # 404 (no vol for that month) is a valid answer for /calculate_pfe
+            'errors': sum(1 for e, status, _ in results if e == endpoint and status >= 500),
+            'p50_ms': float(np.percentile(lat, 50)),
+            'p99_ms': float(np.percentile(lat, 99)),
+            'max_ms': float(lat.max()),
+        }
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load-test the PFE controller endpoints.')
+    parser.add_argument('--url', help='Base URL of a running server (default: in-process test client)')
+    parser.add_argument('--requests', '-n', type=int, default=1000, help='Total requests')
+    parser.add_argument('--concurrency', '-c', type=int, default=8, help='Concurrent client threads')
+    args = parser.parse_args()
+
+    from Done.Pculator.Controller.pfe_controller import market
+    payloads = build_payloads(market.get(), args.requests)
+    if args.url:
+        sender = http_sender(args.url)
+    else:
+        from Done.Pculator.app import app
+        sender = client_sender(app)
+
+    res = run_load(sender, payloads, args.concurrency)
+    print(f"{res['requests']} requests in {res['seconds']:.2f}s ({res['rps']:.0f} req/s, concurrency {args.concurrency})")
+    for endpoint in ENDPOINTS:
+        if endpoint in res:
+            r = res[endpoint]
+            print(f"  {endpoint:<24} n={r['count']:<6} p50 {r['p50_ms']:.2f}ms  p99 {r['p99_ms']:.2f}ms  "
+                  f"max {r['max_ms']:.2f}ms  5xx {r['errors']}")
@@ -1,18 +1,37 @@
 #!/usr/bin/env python3
 import os
 import argparse
-from Sandbox.horizon.PFE_Calculator.models.pfe_engine import PFEEngine
+import importlib
+from datetime import datetime
+from Done.Pculator.streaming import OUTPUT_FORMATS
 
+# 29th_June.py 是带净额结算组 / 多进程 / 流式输出的引擎; 模块名以数字开头, 只能按名字导入
+PFEEngine = importlib.import_module('Done.Pculator.29th_June').PFEEngine
 
-def main(template_path: str):
+
+def main(template_path: str, columnar: bool = True, input_path: str | None = None,
+         output_path: str | None = None, chunk_size: int = 50_000, output_format: str | None = None,
+         vol_cache_dir: str | None = None, netting_cols: list[str] | None = None, workers: int = 0):
     """
     Entry point for PFE processing.
 
     - If the template does not exist, it will be created and program will exit.
     - Otherwise, it reads the template, computes PFE, and writes results.
+    - With input_path, the file is streamed in chunks and results appended to output_path.
+    - output_format picks xlsx/parquet/feather/csv; Excel is only the default for the template run.
+    - Diversification runs per as_of_date and netting_cols group, on `workers` processes.
     """
-    engine = PFEEngine(template_path=template_path)
-    engine.run()
+    engine = PFEEngine(template_path=template_path, columnar=columnar, vol_cache_dir=vol_cache_dir,
+                       netting_cols=netting_cols, workers=workers)
+    if input_path:
+        output_format = output_format or 'parquet'
+        if output_format == 'xlsx':
+            raise ValueError("Streaming mode writes parquet/feather/csv, not xlsx")
+        if not output_path:
+            output_path = f"PFE_result_{datetime.now().strftime('%Y%m%d_%H%M%S')}{OUTPUT_FORMATS[output_format]}"
+        engine.run_streaming(input_path, output_path, chunk_size=chunk_size)
+    else:
+        engine.run(output_format=output_format or 'xlsx')
 
 
 if __name__ == '__main__':
@@ -24,7 +43,58 @@ if __name__ == '__main__':
         default='PFE_template.xlsx',
         help='Path to PFE template file (default: PFE_template.xlsx)'
     )
+    parser.add_argument(
+        '--row-wise',
+        action='store_true',
+        help='Use the reference row-by-row pricing path instead of the columnar engine'
+    )
+    parser.add_argument(
+        '--input', '-i',
+        help='Stream a large input file (xlsx/csv/parquet) in chunks instead of the template'
+    )
+    parser.add_argument(
+        '--output', '-o',
+        help='Streaming output file (.csv/.parquet/.feather, default: PFE_result_<timestamp>.<format>)'
+    )
+    parser.add_argument(
+        '--output-format', '-f',
+        choices=sorted(OUTPUT_FORMATS),
+        help='Result format (default: xlsx for the template run, parquet for --input streaming)'
+    )
+    parser.add_argument(
+        '--vol-cache',
+        default=os.environ.get('PFE_VOL_CACHE_DIR'),
+        help='Directory for the local viya_vol Parquet cache (default: $PFE_VOL_CACHE_DIR, disabled if unset)'
+    )
+    parser.add_argument(
+        '--chunk-size',
+        type=int,
+        default=50_000,
+        help='Rows per chunk in streaming mode (default: 50000)'
+    )
+    parser.add_argument(
+        '--netting-cols',
+        nargs='*',
+        default=[],
+        help='Columns (e.g. counterparty netting_set) diversified separately, on top of as_of_date'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=0,
+        help='Processes for Monte Carlo path blocks (default: 0, serial)'
+    )
     args = parser.parse_args()
 
     # 调用主逻辑
-    main(template_path=args.template)
+    main(
+        template_path=args.template,
+        columnar=not args.row_wise,
+        input_path=args.input,
+        output_path=args.output,
+        chunk_size=args.chunk_size,
+        output_format=args.output_format,
+        vol_cache_dir=args.vol_cache,
+        netting_cols=args.netting_cols,
+        workers=args.workers
+    )
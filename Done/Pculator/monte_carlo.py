@@ -0,0 +1,216 @@
+import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from Done.Pculator.correlation import CorrelationMatrix
+
+logger = logging.getLogger(__name__)
+
+# Memory budget for one block of paths (Brownian states, per-position values and netted
+# exposures, float64)
+DEFAULT_BLOCK_BYTES = 256 * 2 ** 20
+# Histogram bins per (bucket, netting set) for the PFE quantile
+DEFAULT_BINS = 1024
+
+
+@dataclass
+class PathModel:
+    """
+    One as-of date of a book, reduced for simulation.
+
+    Contracts sharing (netting set, curve, vol, expiry) are collapsed into one position with
+    summed signed notional, so the per-path work scales with distinct positions, not trades.
+    Every position follows ln(S_t/S_0) = vol * W_t - vol^2 t / 2, with W the curve's Brownian
+    motion (curves correlated through factor) and the position alive while t <= expiry.
+    """
+    factor: np.ndarray        # k x m square root of the curve correlation (F F^T = R; m > k after take())
+    times: np.ndarray         # bucket times in years, ascending
+    curve: np.ndarray         # position -> curve index
+    vol: np.ndarray           # position annualized vol
+    expiry: np.ndarray        # position time to expiry (years)
+    notional: np.ndarray      # signed notional: +price*position for buy, - for sell
+    netting_set: np.ndarray   # position -> netting set index (non-decreasing)
+    n_sets: int
+
+    def block_paths(self, block_bytes: int = DEFAULT_BLOCK_BYTES) -> int:
+        # Per path: Brownian states (buckets x curves), one bucket of position values or the
+        # netted exposures (buckets x sets)
+        per_path = 8 * max(len(self.times) * max(*self.factor.shape, self.n_sets), len(self.notional), 1)
+        return max(1, block_bytes // per_path)
+
+    def simulate(self, n_paths: int, seed) -> np.ndarray:
+        """
+        Netted exposure (n_paths x buckets x netting sets) for one block of paths.
+        """
+        rng = np.random.default_rng(seed)
+        dt = np.diff(self.times, prepend=0.0)
+
+        # Correlated Brownian states at every bucket for every curve
+        z = rng.standard_normal((n_paths, len(self.times), self.factor.shape[1]))
+        w = np.cumsum((z @ self.factor.T) * np.sqrt(dt)[np.newaxis, :, np.newaxis], axis=1)
+        del z
+
+        out = np.zeros((n_paths, len(self.times), self.n_sets))
+        for b, t in enumerate(self.times):
+            alive = self.expiry >= t
+            if not alive.any():
+                continue
+            vol = self.vol[alive]
+            x = w[:, b, self.curve[alive]] * vol - 0.5 * vol ** 2 * t
+            value = np.expm1(x) * self.notional[alive]
+            # Net positions into their netting sets (positions are sorted by set)
+            sets = self.netting_set[alive]
+            starts = np.flatnonzero(np.r_[True, sets[1:] != sets[:-1]])
+            out[:, b, sets[starts]] = np.add.reduceat(value, starts, axis=1)
+        return out
+
+
+class ExposureHistogram:
+    """
+    Running PFE/EPE statistics of netted exposure per (bucket, netting set), so memory grows
+    with buckets x sets x bins rather than with the number of paths.
+
+    Positive exposure is binned linearly on (0, upper] per cell, with exact zeros and values
+    above upper counted in their own bins; upper is the maximum of the first block. EPE is
+    exact, PFE is interpolated within its bin.
+    """
+
+    def __init__(self, upper: np.ndarray, bins: int = DEFAULT_BINS):
+        self.upper = upper
+        self.bins = bins
+        self.counts = np.zeros(upper.shape + (bins + 2,), dtype=np.int32)
+        self.total = np.zeros(upper.shape)
+        self.peak = np.zeros(upper.shape)
+        self.n_paths = 0
+        # Cells with no positive exposure in the first block send everything positive to overflow
+        self._scale = bins / np.where(upper > 0, upper, np.inf)
+        self._offsets = np.arange(upper.shape[1]) * (bins + 2)
+
+    @classmethod
+    def from_block(cls, exposures: np.ndarray, bins: int = DEFAULT_BINS) -> 'ExposureHistogram':
+        hist = cls(np.maximum(exposures, 0.0).max(axis=0), bins)
+        hist.add(exposures)
+        return hist
+
+    def add(self, exposures: np.ndarray) -> None:
+        """
+        Fold in one block of netted exposures (n_paths x buckets x netting sets).
+        """
+        for b in range(exposures.shape[1]):
+            positive = np.maximum(exposures[:, b, :], 0.0)
+            idx = np.minimum(np.ceil(positive * self._scale[b]), self.bins).astype(np.int64)
+            idx = np.maximum(idx, positive > 0)
+            idx[positive > self.upper[b]] = self.bins + 1
+            self.counts[b] += np.bincount((idx + self._offsets).ravel(),
+                                          minlength=self.counts[b].size).reshape(self.counts[b].shape)
+            self.total[b] += positive.sum(axis=0)
+            np.maximum(self.peak[b], positive.max(axis=0), out=self.peak[b])
+        self.n_paths += len(exposures)
+
+    def epe(self) -> np.ndarray:
+        return self.total / max(self.n_paths, 1)
+
+    def pfe(self, alpha: float = 0.95) -> np.ndarray:
+        """
+        alpha quantile of positive exposure per cell (linear order-statistic position, as
+        np.quantile), treating the paths of a bin as evenly spread across it.
+        """
+        cum = np.cumsum(self.counts, axis=-1)
+        rank = alpha * (self.n_paths - 1)
+        k = (cum <= rank).sum(axis=-1)
+        count = np.take_along_axis(self.counts, k[..., np.newaxis], -1)[..., 0]
+        below = np.take_along_axis(cum, k[..., np.newaxis], -1)[..., 0] - count
+        width = self.upper / self.bins
+        overflow = k > self.bins
+        lo = np.where(overflow, self.upper, (k - 1) * width)
+        hi = np.where(overflow, self.peak, k * width)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            value = lo + np.minimum((rank - below + 0.5) / count, 1.0) * (hi - lo)
+        return np.where(k == 0, 0.0, value)
+
+
+def _simulate_block(args: tuple) -> np.ndarray:
+    model, n_paths, seed = args
+    return model.simulate(n_paths, seed)
+
+
+def _iter_blocks(tasks: list, workers: int):
+    if workers <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            yield _simulate_block(task)
+        return
+    # At most `workers` blocks in flight, so finished blocks never pile up in memory
+    with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+        pending = deque()
+        for task in tasks:
+            if len(pending) >= workers:
+                yield pending.popleft().result()
+            pending.append(pool.submit(_simulate_block, task))
+        while pending:
+            yield pending.popleft().result()
+
+
+def simulate_profile(model: PathModel, n_paths: int = 10_000, seed: int = 0, workers: int = 0,
+                     alpha: float = 0.95, block_bytes: int = DEFAULT_BLOCK_BYTES,
+                     bins: int = DEFAULT_BINS) -> tuple[np.ndarray, np.ndarray]:
+    """
+    PFE (alpha quantile of positive exposure) and EPE per bucket and netting set over n_paths
+    paths. Blocks of paths are folded into an ExposureHistogram as they finish, so memory is
+    bounded by block_bytes and the histogram whatever n_paths is. Each block gets its own
+    child of SeedSequence(seed), so results are identical for any worker count.
+    """
+    if n_paths < 1:
+        raise ValueError(f"n_paths must be positive, got {n_paths}")
+    block = model.block_paths(block_bytes)
+    sizes = [min(block, n_paths - start) for start in range(0, n_paths, block)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(model, size, s) for size, s in zip(sizes, seeds)]
+
+    blocks = _iter_blocks(tasks, workers)
+    hist = ExposureHistogram.from_block(next(blocks), bins)
+    for exposures in blocks:
+        hist.add(exposures)
+    return hist.pfe(alpha), hist.epe()
+
+
+def build_model(book: pd.DataFrame, corr: CorrelationMatrix, curves: list, set_keys: list[str]) -> tuple[PathModel, pd.DataFrame]:
+    """
+    PathModel for a priced book of one as-of date (Risk_Curve, contract_vol, time_to_exp,
+    direction, contract_price, position) with corr aligned to curves. Returns the model and
+    the netting-set labels.
+    """
+    live = book[(book['time_to_exp'] > 0) & (book['contract_vol'] > 0)]
+    sign = np.where(live['direction'].astype(str).str.lower() == 'sell', -1.0, 1.0)
+    notional = sign * live['contract_price'].to_numpy(dtype=float) * live['position'].to_numpy(dtype=float)
+
+    if set_keys:
+        set_codes, sets = pd.MultiIndex.from_frame(live[set_keys]).factorize()
+        sets = sets.to_frame(index=False, name=set_keys)
+    else:
+        set_codes, sets = np.zeros(len(live), dtype=np.intp), pd.DataFrame(index=[0])
+
+    # 同一 (净额结算集, 曲线, 波动率, 到期) 的合约合并为一个头寸
+    curve_codes = pd.Index(curves).get_indexer(live['Risk_Curve'])
+    positions = pd.DataFrame({
+        'set': set_codes,
+        'curve': curve_codes,
+        'vol': live['contract_vol'].to_numpy(dtype=float),
+        'expiry': live['time_to_exp'].to_numpy(dtype=float),
+        'notional': notional,
+    }).groupby(['set', 'curve', 'vol', 'expiry'], as_index=False)['notional'].sum()
+
+    model = PathModel(
+        factor=corr.factor,
+        times=np.unique(positions['expiry'].to_numpy()),
+        curve=positions['curve'].to_numpy(),
+        vol=positions['vol'].to_numpy(),
+        expiry=positions['expiry'].to_numpy(),
+        notional=positions['notional'].to_numpy(),
+        netting_set=positions['set'].to_numpy(),
+        n_sets=len(sets),
+    )
+    return model, sets
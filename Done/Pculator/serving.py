@@ -0,0 +1,196 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable
+
+import pandas as pd
+
+from Done.Pculator.curve_registry import CurveRegistry
+from Done.Pculator.tenor import FUTURES_MONTH_CODES, code_to_ordinal, ordinal_to_label
+
+logger = logging.getLogger(__name__)
+
+# Seconds between scheduled snapshot reloads in a serving worker (0 disables)
+RELOAD_INTERVAL = int(os.environ.get('PFE_RELOAD_INTERVAL', '900'))
+
+# () -> (viya_vol frame, curve mapping rows)
+SnapshotLoader = Callable[[], tuple]
+
+# RISK_FACTOR = <curve root>_<month code><yy>
+FACTOR_PATTERN = rf'^(?P<root>.+)_(?P<code>[{FUTURES_MONTH_CODES}])(?P<yy>\d{{2}})$'
+
+
+def month_labels_by_root(viya_vol: pd.DataFrame) -> dict[str, tuple[str, ...]]:
+    """
+    Distinct 'Mon-YY' labels per curve root, latest first, from one vectorized pass.
+    """
+    factors = pd.Series(viya_vol['RISK_FACTOR'].dropna().unique(), dtype=object)
+    parts = factors.str.extract(FACTOR_PATTERN).dropna()
+    if parts.empty:
+        return {}
+    parts['month'] = code_to_ordinal(parts['code'] + parts['yy'])
+    parts = parts.sort_values(['root', 'month'], ascending=[True, False])
+    labels = pd.Series(ordinal_to_label(parts['month']), index=parts.index)
+    return {root: tuple(group) for root, group in labels.groupby(parts['root'], sort=False)}
+
+
+@dataclass(frozen=True)
+class MarketState:
+    """
+    Read-only market snapshot served by the controller. Never mutated after construction:
+    a reload builds a new MarketState and swaps the reference.
+    """
+    viya_vol: pd.DataFrame
+    curve_registry: CurveRegistry
+    first_vol: pd.Series          # RISK_FACTOR -> first VOLATILITY row (calculate_pfe's iloc[0])
+    month_labels: dict            # curve root -> ('Mon-YY', ...) latest first
+    as_of: object                 # latest AS_OF_DATE in the snapshot
+    snapshot_id: str
+    loaded_at: datetime = field(default_factory=datetime.now)
+
+    @classmethod
+    def build(cls, viya_vol: pd.DataFrame, curve_mapping) -> 'MarketState':
+        as_of = pd.Timestamp(viya_vol['AS_OF_DATE'].max()).date()
+        return cls(
+            viya_vol=viya_vol,
+            curve_registry=CurveRegistry(curve_mapping),
+            first_vol=viya_vol.drop_duplicates('RISK_FACTOR').set_index('RISK_FACTOR')['VOLATILITY'],
+            month_labels=month_labels_by_root(viya_vol),
+            as_of=as_of,
+            snapshot_id=f"{as_of.isoformat()}-{pd.util.hash_pandas_object(viya_vol, index=False).sum() & 0xFFFFFFFF:08x}",
+        )
+
+
+def fe_snapshot() -> tuple:
+    """
+    Snapshot from Practice.FE (the controller's historical source).
+    """
+    from Practice.FE import viya_vol, curve_mapping_source
+    return viya_vol, curve_mapping_source
+
+
+def vol_cache_snapshot(cache_dir: str) -> SnapshotLoader:
+    """
+    Production snapshot: viya_vol through the local Parquet cache, curve mapping from common.
+    """
+    def load() -> tuple:
+        from Sandbox.horizon.PFE_Calculator.models.common import CURVE_MAPPING_LIST, querys, prd_db
+        from Done.Pculator.vol_cache import VolCache, JvVolLoader
+        return VolCache(cache_dir, JvVolLoader(querys.viya_vol, prd_db)).load(), CURVE_MAPPING_LIST
+    return load
+
+
+def default_loader() -> SnapshotLoader:
+    cache_dir = os.environ.get('PFE_VOL_CACHE_DIR')
+    return vol_cache_snapshot(cache_dir) if cache_dir else fe_snapshot
+
+
+class MonthLabelCache:
+    """
+    LRU of serialized /get_available_months answers keyed by (snapshot id, curve root), with a
+    content ETag. Entries of a replaced snapshot simply age out.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, state: MarketState, curve_root: str | None) -> tuple[bytes, str]:
+        key = (state.snapshot_id, curve_root)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+
+        body = json.dumps(list(state.month_labels.get(curve_root, ()))).encode()
+        entry = (body, hashlib.sha1(body).hexdigest()[:20])
+        with self._lock:
+            self._entries[key] = entry
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return entry
+
+
+class MarketStateHolder:
+    """
+    Holds the current MarketState. Loaded once at import (before gunicorn forks with
+    preload_app, so workers share the pages copy-on-write); reload() builds the next snapshot
+    off to the side and publishes it with a single reference assignment, so a request sees
+    either the old or the new snapshot, never a mix.
+    """
+
+    def __init__(self, loader: SnapshotLoader):
+        self.loader = loader
+        self._state = MarketState.build(*loader())
+        self._reload_lock = threading.Lock()
+        self._timer: threading.Thread | None = None
+        self._stop = threading.Event()
+        self._scheduler_disabled = False
+        self._listeners: list = []
+
+    def get(self) -> MarketState:
+        return self._state
+
+    def on_reload(self, callback: Callable[[MarketState], None]) -> None:
+        """
+        Call callback(new_state) after every published reload (e.g. to drop derived caches).
+        """
+        self._listeners.append(callback)
+
+    def reload(self) -> bool:
+        """
+        Load a fresh snapshot and publish it; keeps the current one if loading fails.
+        Returns True when a different snapshot was published.
+        """
+        with self._reload_lock:
+            try:
+                state = MarketState.build(*self.loader())
+            except Exception as e:
+                logger.error(f"Snapshot reload failed, keeping {self._state.snapshot_id}: {str(e)}")
+                return False
+            if state.snapshot_id == self._state.snapshot_id:
+                return False
+            old, self._state = self._state, state
+            logger.info(f"Snapshot reloaded: {old.snapshot_id} -> {state.snapshot_id}")
+        for callback in self._listeners:
+            callback(state)
+        return True
+
+    def start_scheduler(self, interval: int = RELOAD_INTERVAL,
+                        on_change: Callable[[MarketState], None] | None = None) -> None:
+        """
+        Reload every `interval` seconds on a daemon thread, calling on_change(new_state) after
+        each published reload. Under gunicorn only the master runs this (see gunicorn.conf.py);
+        workers call disable_scheduler() so an ASGI lifespan start is a no-op there.
+        """
+        if self._scheduler_disabled or interval <= 0 or (self._timer is not None and self._timer.is_alive()):
+            return
+        self._stop.clear()
+
+        def loop():
+            while not self._stop.wait(interval):
+                if self.reload() and on_change is not None:
+                    on_change(self._state)
+
+        self._timer = threading.Thread(target=loop, name='pfe-snapshot-reload', daemon=True)
+        self._timer.start()
+
+    def disable_scheduler(self) -> None:
+        self._scheduler_disabled = True
+
+    def wait_idle(self) -> None:
+        """
+        Block while a reload is in progress (so a fork never inherits a half-built snapshot
+        or a held lock).
+        """
+        with self._reload_lock:
+            pass
+
+    def stop_scheduler(self) -> None:
+        self._stop.set()
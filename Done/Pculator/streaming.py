@@ -0,0 +1,159 @@
+import os
+import logging
+from typing import Iterator
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 50_000
+
+# --output-format -> file extension
+OUTPUT_FORMATS = {'xlsx': '.xlsx', 'parquet': '.parquet', 'feather': '.feather', 'csv': '.csv'}
+_PARQUET_EXT = ('.parquet', '.pq')
+_ARROW_EXT = ('.feather', '.arrow', '.ipc')
+
+
+def iter_chunks(path: str, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                sheet_name: str = 'PFE Data Input') -> Iterator[pd.DataFrame]:
+    """
+    Yield the input file in DataFrames of at most chunk_size rows (xlsx, csv or parquet).
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.csv':
+        yield from pd.read_csv(path, chunksize=chunk_size)
+    elif ext in _PARQUET_EXT:
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    elif ext in ('.xlsx', '.xlsm'):
+        yield from _iter_xlsx(path, sheet_name, chunk_size)
+    else:
+        raise ValueError(f"Unsupported input format: {path}")
+
+
+def _iter_xlsx(path: str, sheet_name: str, chunk_size: int) -> Iterator[pd.DataFrame]:
+    """
+    Read-only openpyxl pass: rows are pulled lazily, never the whole sheet.
+    """
+    import openpyxl
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = wb[sheet_name].iter_rows(values_only=True)
+        header = [str(c).strip() if c is not None else f'Unnamed: {i}' for i, c in enumerate(next(rows, []))]
+        buf = []
+        for row in rows:
+            if all(v is None for v in row):
+                continue
+            buf.append(row)
+            if len(buf) >= chunk_size:
+                yield pd.DataFrame(buf, columns=header)
+                buf = []
+        if buf:
+            yield pd.DataFrame(buf, columns=header)
+    finally:
+        wb.close()
+
+
+def widen_schema(schema):
+    """
+    Types a later chunk can still be cast into: all-null columns become strings and integer
+    columns float64 (a later chunk may carry text in the first, NaN or 1.5 in the second).
+    """
+    import pyarrow as pa
+    fields = []
+    for field in schema:
+        if pa.types.is_null(field.type):
+            field = field.with_type(pa.large_string())
+        elif pa.types.is_integer(field.type):
+            field = field.with_type(pa.float64())
+        fields.append(field)
+    return pa.schema(fields, metadata=schema.metadata)
+
+
+class ChunkWriter:
+    """
+    Append priced chunks to a csv, parquet or Arrow IPC (feather) file as they are produced.
+    arrow_csv writes csv through pyarrow's multi-threaded writer instead of DataFrame.to_csv;
+    only use it for frames of plain numeric/string columns (timestamps are formatted differently).
+
+    The Arrow file schema is the declared `schema` if given, else the first chunk's schema
+    widened by widen_schema(); every chunk is cast to it column by column.
+    """
+
+    def __init__(self, path: str, arrow_csv: bool = False, schema=None):
+        self.path = path
+        self.arrow_csv = arrow_csv
+        self.ext = os.path.splitext(path)[1].lower()
+        if self.ext not in ('.csv',) + _PARQUET_EXT + _ARROW_EXT:
+            raise ValueError(f"Streaming output must be .csv, .parquet or .feather, got: {path}")
+        self.rows = 0
+        self._writer = None
+        self._schema = schema
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, df: pd.DataFrame) -> None:
+        if self.ext == '.csv' and not self.arrow_csv:
+            df.to_csv(self.path, mode='w' if self.rows == 0 else 'a', header=self.rows == 0, index=False)
+        else:
+            import pyarrow as pa
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self._writer is None:
+                if self._schema is None:
+                    self._schema = widen_schema(table.schema)
+                if self.ext == '.csv':
+                    import pyarrow.csv as pa_csv
+                    self._writer = pa_csv.CSVWriter(self.path, self._schema,
+                                                    write_options=pa_csv.WriteOptions(quoting_style='needed'))
+                elif self.ext in _PARQUET_EXT:
+                    import pyarrow.parquet as pq
+                    self._writer = pq.ParquetWriter(self.path, self._schema)
+                else:
+                    self._writer = pa.ipc.new_file(self.path, self._schema)
+            self._writer.write_table(self._conform(table))
+        self.rows += len(df)
+
+    def _conform(self, table):
+        """
+        Cast a chunk to the file schema; columns missing from the chunk are written as nulls.
+        """
+        import pyarrow as pa
+        columns = []
+        for field in self._schema:
+            if field.name not in table.column_names:
+                columns.append(pa.nulls(table.num_rows, field.type))
+                continue
+            column = table[field.name]
+            if column.type != field.type:
+                try:
+                    column = column.cast(field.type)
+                except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+                    raise ValueError(
+                        f"Column '{field.name}' changed type from {field.type} to {column.type} "
+                        f"after row {self.rows}: {str(e)}"
+                    ) from e
+            columns.append(column)
+        return pa.Table.from_arrays(columns, schema=self._schema)
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+def write_frame(df: pd.DataFrame, path: str) -> None:
+    """
+    One-shot csv/parquet/feather write, picked by file extension.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext in _PARQUET_EXT:
+        df.to_parquet(path, index=False)
+    elif ext in _ARROW_EXT:
+        df.reset_index(drop=True).to_feather(path)
+    else:
+        df.to_csv(path, index=False)
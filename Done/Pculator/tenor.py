@@ -0,0 +1,229 @@
+import logging
+from datetime import date
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Futures month codes, Jan..Dec
+FUTURES_MONTH_CODES = 'FGHJKMNQUVXZ'
+MONTH_ABBR = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+# Month ordinals are months since 1970-01, i.e. the integer value of datetime64[M];
+# missing months use the same sentinel as NaT
+NAT_ORDINAL = np.datetime64('NaT', 'M').astype(np.int64)
+EXCEL_EPOCH = np.datetime64('1899-12-30', 'D')
+
+_FACTOR_PATTERN = fr'^(?P<root>.+)_(?P<code>[{FUTURES_MONTH_CODES}])(?P<yy>[0-9]{{2}})$'
+_LABEL_PATTERN = r'^\s*(?P<mon>[A-Za-z]{3})-(?P<year>[0-9]{2}|[0-9]{4})\s*$'
+_CODE_PATTERN = fr'^\s*(?P<code>[{FUTURES_MONTH_CODES}])(?P<yy>[0-9]{{2}})\s*$'
+_ABBR_INDEX = {m.lower(): i for i, m in enumerate(MONTH_ABBR)}
+_CODE_INDEX = {c: i for i, c in enumerate(FUTURES_MONTH_CODES)}
+
+
+def _per_unique(values, parse) -> np.ndarray:
+    """
+    Apply an array parser to the distinct values only (contract-month columns repeat a few
+    dozen labels), then broadcast back. Missing values give NAT_ORDINAL.
+    """
+    codes, uniques = pd.factorize(np.asarray(values, dtype=object).ravel())
+    parsed = np.append(parse(pd.Series(uniques, dtype=object).astype(str)), NAT_ORDINAL)
+    return parsed[codes]
+
+
+def _year_month_ordinal(year: pd.Series, month: pd.Series) -> np.ndarray:
+    ordinal = (year - 1970) * 12 + month
+    return ordinal.fillna(NAT_ORDINAL).to_numpy(dtype=np.int64)
+
+
+def _parse_labels(labels: pd.Series) -> np.ndarray:
+    parts = labels.str.extract(_LABEL_PATTERN)
+    year = pd.to_numeric(parts['year'])
+    year = year.where(year >= 100, year + 2000)
+    return _year_month_ordinal(year, parts['mon'].str.lower().map(_ABBR_INDEX))
+
+
+def _parse_codes(codes: pd.Series) -> np.ndarray:
+    parts = codes.str.extract(_CODE_PATTERN)
+    return _year_month_ordinal(2000 + pd.to_numeric(parts['yy']), parts['code'].map(_CODE_INDEX))
+
+
+def label_to_ordinal(labels) -> np.ndarray:
+    """
+    'MMM-YY' / 'MMM-YYYY' labels -> month ordinals (NAT_ORDINAL when unparseable). Two-digit
+    years are 20YY, as in the futures codes.
+    """
+    return _per_unique(labels, _parse_labels)
+
+
+def code_to_ordinal(codes) -> np.ndarray:
+    """
+    Futures month codes ('J25') -> month ordinals.
+    """
+    return _per_unique(codes, _parse_codes)
+
+
+def date_to_ordinal(dates) -> np.ndarray:
+    """
+    Datetime-likes -> month ordinals of their calendar month.
+    """
+    months = pd.to_datetime(pd.Series(np.asarray(dates, dtype=object).ravel()), errors='coerce')
+    return months.to_numpy(dtype='datetime64[M]').astype(np.int64)
+
+
+def _format_per_unique(ordinals, fmt) -> np.ndarray:
+    uniques, inverse = np.unique(np.asarray(ordinals, dtype=np.int64).ravel(), return_inverse=True)
+    formatted = np.array(
+        [None if o == NAT_ORDINAL else fmt(int(o) % 12, (1970 + int(o) // 12) % 100) for o in uniques],
+        dtype=object
+    )
+    return formatted[inverse]
+
+
+def ordinal_to_label(ordinals) -> np.ndarray:
+    """
+    Month ordinals -> 'MMM-YY' labels (None for NAT_ORDINAL).
+    """
+    return _format_per_unique(ordinals, lambda m, yy: f"{MONTH_ABBR[m]}-{yy:02d}")
+
+
+def ordinal_to_code(ordinals) -> np.ndarray:
+    """
+    Month ordinals -> futures month codes, e.g. 'J25' (None for NAT_ORDINAL).
+    """
+    return _format_per_unique(ordinals, lambda m, yy: f"{FUTURES_MONTH_CODES[m]}{yy:02d}")
+
+
+def month_start(ordinals) -> np.ndarray:
+    return np.asarray(ordinals, dtype=np.int64).astype('datetime64[M]').astype('datetime64[D]')
+
+
+def month_end(ordinals) -> np.ndarray:
+    """
+    Last calendar day of each month as datetime64[D] (NaT for NAT_ORDINAL).
+    """
+    return (np.asarray(ordinals, dtype=np.int64).astype('datetime64[M]') + 1).astype('datetime64[D]') - 1
+
+
+def excel_serial(days) -> np.ndarray:
+    """
+    Dates -> Excel serial day numbers (1900 date system); float so NaT can map to NaN.
+    """
+    days = np.asarray(days, dtype='datetime64[D]')
+    serial = (days - EXCEL_EPOCH).astype(np.int64).astype(float)
+    serial[np.isnat(days)] = np.nan
+    return serial
+
+
+def month_table(start, months: int) -> pd.DataFrame:
+    """
+    `months` consecutive contract months from start's month: label, futures code and the Excel
+    serial of the month end.
+    """
+    ordinals = date_to_ordinal([start])[0] + np.arange(months)
+    return pd.DataFrame({
+        'month_str': ordinal_to_label(ordinals),
+        'short_month': ordinal_to_code(ordinals),
+        'date_number': excel_serial(month_end(ordinals)).astype(np.int64),
+    })
+
+
+def _month_start_days(values) -> np.ndarray:
+    """
+    'MMM-YY' labels or datetime-likes -> first-of-month as datetime64[D] (NaT when unparseable).
+    """
+    values = pd.Series(np.asarray(values, dtype=object))
+    ordinals = label_to_ordinal(values)
+    # Dates / Timestamps (alone or mixed in with labels) are taken as their calendar month
+    rest = (ordinals == NAT_ORDINAL) & values.notna().to_numpy()
+    if rest.any() and pd.api.types.infer_dtype(values[rest], skipna=True) != 'string':
+        ordinals[rest] = date_to_ordinal(values[rest])
+    return month_start(ordinals)
+
+
+class TenorIndex:
+    """
+    Curve root -> sorted contract months, built once per vol snapshot.
+
+    Nearest-tenor matching is a binary search inside the root's block of a single sorted
+    (root code << 32 | day offset) key array, so a whole column matches in one call.
+    """
+
+    def __init__(self, risk_factors: Iterable[str]):
+        names = pd.Series(pd.unique(pd.Series(list(risk_factors), dtype=object).dropna()), dtype=object)
+        parts = names.str.extract(_FACTOR_PATTERN).dropna()
+        names = names[parts.index]
+
+        days = month_start(code_to_ordinal(parts['code'] + parts['yy'])).astype(np.int64)
+        codes, roots = pd.factorize(parts['root'], sort=True)
+
+        self.roots = pd.Index(roots)
+        self._day0 = int(days.min()) if len(days) else 0
+
+        order = np.lexsort((days, codes))
+        keys = (codes[order].astype(np.int64) << 32) + (days[order] - self._day0)
+        keep = np.r_[True, keys[1:] != keys[:-1]] if len(keys) else np.zeros(0, dtype=bool)
+
+        self._keys = keys[keep]
+        self._codes = codes[order][keep]
+        self._days = days[order][keep]
+        self._names = names.to_numpy(dtype=object)[order][keep]
+        # Block bounds [start, end) of each root inside the sorted arrays
+        self._start = np.searchsorted(self._codes, np.arange(len(roots)), side='left')
+        self._end = np.searchsorted(self._codes, np.arange(len(roots)), side='right')
+
+    @classmethod
+    def from_vol_data(cls, vol_data: pd.DataFrame) -> 'TenorIndex':
+        return cls(vol_data['RISK_FACTOR'])
+
+    def months(self, risk_curve_root: str) -> list[date]:
+        """
+        Available contract months (first of month) for a curve root, latest first.
+        """
+        code = self.roots.get_indexer([risk_curve_root])[0]
+        if code < 0:
+            return []
+        days = self._days[self._start[code]:self._end[code]][::-1]
+        return [d.item() for d in days.astype('datetime64[D]')]
+
+    def match(self, risk_curve_root: str, deliver_month, clamp: bool = True) -> str | None:
+        """
+        Nearest RISK_FACTOR for one deliver month ('MMM-YY' or date).
+        """
+        return self.match_many([risk_curve_root], [deliver_month], clamp=clamp)[0]
+
+    def match_many(self, roots, deliver_months, clamp: bool = True) -> np.ndarray:
+        """
+        Nearest RISK_FACTOR for each (root, deliver month); None where nothing matches.
+
+        Distance is measured in days between month starts and ties go to the later month,
+        as in the original min() over a descending date list. With clamp=True (Practice/FE.py
+        match_curve semantics) months outside a root's range snap to its first/last tenor;
+        with clamp=False they are left unmatched.
+        """
+        codes = self.roots.get_indexer(pd.Index(np.asarray(roots, dtype=object))).astype(np.int64)
+        target = _month_start_days(deliver_months)
+        out = np.full(len(codes), None, dtype=object)
+
+        ok = (codes >= 0) & ~np.isnat(target)
+        if not ok.any():
+            return out
+        idx = np.flatnonzero(ok)
+        code = codes[idx]
+        day = target[idx].astype(np.int64)
+        start, end = self._start[code], self._end[code]
+
+        pos = np.searchsorted(self._keys, (code << 32) + (day - self._day0), side='left')
+        lo = np.clip(pos - 1, start, end - 1)
+        hi = np.clip(pos, start, end - 1)
+        lo_dist = np.abs(day - self._days[lo])
+        hi_dist = np.abs(self._days[hi] - day)
+        chosen = np.where(hi_dist <= lo_dist, hi, lo)
+
+        if not clamp:
+            inside = (day >= self._days[start]) & (day <= self._days[end - 1])
+            idx, chosen = idx[inside], chosen[inside]
+        out[idx] = self._names[chosen]
+        return out
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from Done.Pculator.correlation import CorrelationMatrix
+from Done.Pculator.diversification import diversify
+from Done.Pculator.monte_carlo import PathModel, simulate_profile
+
+R = np.array([[1.0, 0.5, 0.2], [0.5, 1.0, 0.3], [0.2, 0.3, 1.0]])
+
+
+def test_zero_variance_book_gets_zero_marginals():
+    # 敞口完全对冲 (sᵀRs = 0): 分散后 PFE 为 0, 边际贡献全为 0 (不再按原始敞口分摊)
+    corr = CorrelationMatrix(np.ones((2, 2)))
+    total, marginal = diversify(np.array([100.0, -100.0]), corr)
+    assert total == pytest.approx(0.0, abs=1e-9)
+    np.testing.assert_array_equal(marginal, np.zeros(2))
+
+    total, marginal = diversify(np.zeros(3), CorrelationMatrix(R))
+    assert total == 0.0
+    np.testing.assert_array_equal(marginal, np.zeros(3))
+
+
+def test_take_keeps_factor_of_subset():
+    corr = CorrelationMatrix(R, ['A', 'B', 'C'])
+    sub = corr.subset(['C', 'A'])
+    assert sub.factor.shape == (2, 3)
+    np.testing.assert_allclose(sub.factor @ sub.factor.T, R[np.ix_([2, 0], [2, 0])])
+
+
+def test_simulate_with_subset_factor():
+    sub = CorrelationMatrix(R, ['A', 'B', 'C']).subset(['C', 'A'])
+    model = PathModel(factor=sub.factor, times=np.array([0.5, 1.0]), curve=np.array([0, 1]),
+                      vol=np.array([0.2, 0.3]), expiry=np.array([1.0, 1.0]),
+                      notional=np.array([100.0, -50.0]), netting_set=np.array([0, 0]), n_sets=1)
+    pfe, epe = simulate_profile(model, 2000, seed=1)
+    assert pfe.shape == epe.shape == (2, 1)
+    assert (pfe > 0).all()
+
+
+def test_simulate_rejects_empty_run():
+    model = PathModel(factor=np.eye(1), times=np.array([1.0]), curve=np.array([0]), vol=np.array([0.3]),
+                      expiry=np.array([1.0]), notional=np.array([100.0]), netting_set=np.array([0]), n_sets=1)
+    with pytest.raises(ValueError):
+        simulate_profile(model, 0)
@@ -0,0 +1,130 @@
+import os
+import shutil
+import logging
+from datetime import date
+from typing import Protocol
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+_PARTITION_PREFIX = 'AS_OF_DATE='
+
+
+class VolLoader(Protocol):
+    """
+    Source of viya_vol rows. `since` asks only for AS_OF_DATE >= since (None = everything).
+    """
+
+    def load(self, since: date | None = None) -> pd.DataFrame:
+        ...
+
+
+class JvVolLoader:
+    """
+    Production loader: querys.viya_vol through jv, narrowed by as-of date on refresh.
+    """
+
+    def __init__(self, query: str, connection_type):
+        self.query = query
+        self.connection_type = connection_type
+
+    def load(self, since: date | None = None) -> pd.DataFrame:
+        import jv
+        query = self.query
+        if since is not None:
+            query = f"SELECT * FROM ({self.query}) v WHERE v.AS_OF_DATE >= date'{since.strftime('%Y-%m-%d')}'"
+        return jv.download_data_db(query, connection_type=self.connection_type)
+
+
+class FrameVolLoader:
+    """
+    Local stand-in for jv: serves a DataFrame (tests, benchmarks, offline runs).
+    """
+
+    def __init__(self, vol_data: pd.DataFrame):
+        self.vol_data = vol_data
+
+    def load(self, since: date | None = None) -> pd.DataFrame:
+        if since is None:
+            return self.vol_data.copy()
+        return self.vol_data[pd.to_datetime(self.vol_data['AS_OF_DATE']) >= pd.Timestamp(since)].copy()
+
+
+class VolCache:
+    """
+    viya_vol snapshot persisted as Parquet, one partition directory per AS_OF_DATE.
+
+    load() only asks the loader for as-of dates from the cached max onwards (that day is
+    re-fetched in case it was still being populated) and falls back to the cache when the
+    loader fails.
+    """
+
+    def __init__(self, cache_dir: str, loader: VolLoader):
+        self.cache_dir = cache_dir
+        self.loader = loader
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def cached_dates(self) -> list[date]:
+        dates = []
+        for name in os.listdir(self.cache_dir):
+            if name.startswith(_PARTITION_PREFIX):
+                try:
+                    dates.append(date.fromisoformat(name[len(_PARTITION_PREFIX):]))
+                except ValueError:
+                    logger.warning(f"Ignoring unexpected cache entry: {name}")
+        return sorted(dates)
+
+    def _partition_path(self, as_of: date) -> str:
+        return os.path.join(self.cache_dir, f"{_PARTITION_PREFIX}{as_of.isoformat()}")
+
+    def read(self) -> pd.DataFrame:
+        """
+        Whole cached snapshot (empty frame when nothing is cached yet).
+        """
+        parts = [
+            pd.read_parquet(os.path.join(self._partition_path(d), 'part.parquet'))
+            for d in self.cached_dates()
+        ]
+        if not parts:
+            return pd.DataFrame(columns=['AS_OF_DATE', 'RISK_FACTOR', 'VOLATILITY'])
+        return pd.concat(parts, ignore_index=True)
+
+    def write(self, vol_data: pd.DataFrame) -> None:
+        """
+        (Re)write one partition per as-of date present in vol_data. Every step is a single
+        rename, so concurrent readers see either the old or the new partition, never neither.
+        """
+        as_of = pd.to_datetime(vol_data['AS_OF_DATE']).dt.date
+        for d, part in vol_data.groupby(as_of):
+            final = self._partition_path(d)
+            if os.path.isdir(final):
+                # Existing partition: keep the directory and swap its file in place
+                tmp = os.path.join(final, 'part.parquet.tmp')
+                part.to_parquet(tmp, index=False)
+                os.replace(tmp, os.path.join(final, 'part.parquet'))
+            else:
+                # New partition: build it aside and publish the directory with one rename
+                tmp = f"{final}.tmp"
+                shutil.rmtree(tmp, ignore_errors=True)
+                os.makedirs(tmp)
+                part.to_parquet(os.path.join(tmp, 'part.parquet'), index=False)
+                os.replace(tmp, final)
+
+    def load(self, refresh: bool = True) -> pd.DataFrame:
+        """
+        Cached snapshot topped up with anything newer from the loader.
+        """
+        dates = self.cached_dates()
+        since = dates[-1] if dates else None
+        if refresh:
+            try:
+                fresh = self.loader.load(since=since)
+                if not fresh.empty:
+                    self.write(fresh)
+                logger.info(f"Vol cache refreshed from {since or 'scratch'}: {len(fresh)} rows fetched")
+            except Exception as e:
+                if since is None:
+                    raise
+                logger.warning(f"Vol source unavailable ({str(e)}); using cached snapshot up to {since}")
+        return self.read()
@@ -0,0 +1,72 @@
+import logging
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+class VolStore:
+    """
+    Volatility snapshot indexed by (RISK_FACTOR, AS_OF_DATE).
+
+    Rows are sorted once on a composite int64 key (factor code << 32 | day offset), so
+    "latest vol on or before D within N days" is a single binary search per query.
+    """
+
+    def __init__(self, vol_data: pd.DataFrame):
+        frame = vol_data[['RISK_FACTOR', 'AS_OF_DATE', 'VOLATILITY']].dropna(subset=['RISK_FACTOR', 'AS_OF_DATE'])
+        days = pd.to_datetime(frame['AS_OF_DATE']).to_numpy(dtype='datetime64[D]').astype(np.int64)
+        codes, factors = pd.factorize(frame['RISK_FACTOR'], sort=True)
+
+        self.factors = pd.Index(factors)
+        self._code_of = {f: i for i, f in enumerate(factors)}
+        self._day0 = int(days.min()) if len(days) else 0
+
+        # Stable sort keeps the first row of duplicated keys first, matching the old iloc[0]
+        order = np.lexsort((days, codes))
+        keys = (codes[order].astype(np.int64) << 32) + (days[order] - self._day0)
+        keep = np.r_[True, keys[1:] != keys[:-1]] if len(keys) else np.zeros(0, dtype=bool)
+
+        self._keys = keys[keep]
+        self._codes = codes[order][keep]
+        self._days = days[order][keep]
+        self._vols = frame['VOLATILITY'].to_numpy(dtype=float)[order][keep]
+        logger.info(f"Vol store indexed: {len(self._keys)} rows, {len(self.factors)} risk factors")
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def get(self, risk_factor: str, as_of: date, max_days_back: int = 7) -> float | None:
+        """
+        Latest daily vol for risk_factor on or before as_of, at most max_days_back days old.
+        """
+        code = self._code_of.get(risk_factor)
+        if code is None or as_of is None:
+            return None
+        day = np.datetime64(pd.Timestamp(as_of).date(), 'D').astype(np.int64)
+        pos = int(np.searchsorted(self._keys, (code << 32) + (day - self._day0), side='right')) - 1
+        if pos < 0 or self._codes[pos] != code or self._days[pos] < day - max_days_back:
+            return None
+        return float(self._vols[pos])
+
+    def get_many(self, risk_factors, as_of_dates, max_days_back: int = 7) -> np.ndarray:
+        """
+        Batch version of get: arrays of factors and dates in, daily vols out (NaN when missing).
+        """
+        codes = self.factors.get_indexer(pd.Index(np.asarray(risk_factors, dtype=object))).astype(np.int64)
+        stamps = pd.to_datetime(pd.Series(np.asarray(as_of_dates, dtype=object))).to_numpy(dtype='datetime64[D]')
+        days = stamps.astype(np.int64)
+
+        out = np.full(len(codes), np.nan)
+        ok = (codes >= 0) & ~np.isnat(stamps)
+        if not ok.any() or not len(self._keys):
+            return out
+
+        keys = (codes[ok] << 32) + (days[ok] - self._day0)
+        pos = np.searchsorted(self._keys, keys, side='right') - 1
+        safe = np.clip(pos, 0, None)
+        hit = (pos >= 0) & (self._codes[safe] == codes[ok]) & (self._days[safe] >= days[ok] - max_days_back)
+        out[np.flatnonzero(ok)[hit]] = self._vols[safe[hit]]
+        return out
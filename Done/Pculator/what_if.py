@@ -0,0 +1,290 @@
+import os
+import json
+import hashlib
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Callable
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process servers only, thread locks suffice
+    fcntl = None
+
+import numpy as np
+
+from Done.Pculator.correlation import CorrelationMatrix
+from Done.Pculator.diversification import Z_95
+
+logger = logging.getLogger(__name__)
+
+# Committed what-if books live here; shared by every web worker on the host
+WHAT_IF_DIR = os.environ.get('PFE_WHAT_IF_DIR', os.path.join(tempfile.gettempdir(), 'pfe_what_if'))
+
+# factors -> correlation aligned with them
+CorrProvider = Callable[[list], CorrelationMatrix]
+
+
+class PortfolioState:
+    """
+    One counterparty's diversified PFE kept up to date in O(k) per trade change.
+
+    Holds the factor exposure vector s, R s and s^T R s. Moving exposure e onto factor j is a
+    rank-one update:
+
+        s^T R s += 2 e (R s)_j + e^2 R_jj,    R s += e R[:, j],    s_j += e
+
+    Only a trade on a factor the counterparty has never seen refetches R (O(k^2) once), and the
+    state is recomputed from scratch every `rebuild_every` updates to bound rounding drift.
+    """
+
+    def __init__(self, corr_provider: CorrProvider, z: float = Z_95, rebuild_every: int = 1000):
+        self.corr_provider = corr_provider
+        self.z = z
+        self.rebuild_every = rebuild_every
+        self.factors: list = []
+        self.index: dict = {}
+        self.corr = CorrelationMatrix.identity(0)
+        self.s = np.zeros(0)
+        self.rs = np.zeros(0)
+        self.variance = 0.0
+        self.trades: dict = {}  # trade_id -> (factor, exposure)
+        self.updates = 0
+
+    def _extended(self, factors) -> tuple | None:
+        """
+        (factors, corr, s) grown by the factors not yet held, or None when all are known.
+        Nothing on self changes.
+        """
+        new = [f for f in dict.fromkeys(factors) if f not in self.index]
+        if not new:
+            return None
+        factors = self.factors + new
+        return factors, self.corr_provider(factors), np.concatenate([self.s, np.zeros(len(new))])
+
+    def _ensure_factors(self, factors) -> None:
+        extended = self._extended(factors)
+        if extended is None:
+            return
+        self.factors, self.corr, self.s = extended
+        self.index = {f: i for i, f in enumerate(self.factors)}
+        self._recompute()
+
+    def _recompute(self) -> None:
+        self.rs = self.corr.matrix @ self.s
+        self.variance = float(self.s @ self.rs)
+        self.updates = 0
+
+    @staticmethod
+    def _rank_one(corr: CorrelationMatrix, s: np.ndarray, rs: np.ndarray, variance: float, j: int,
+                  delta: float) -> float:
+        col = corr.matrix[:, j]
+        variance += 2 * delta * rs[j] + delta * delta * col[j]
+        rs += delta * col
+        s[j] += delta
+        return variance
+
+    def _deltas(self, changes: list[tuple]) -> list[tuple]:
+        """
+        (action, trade_id, factor, exposure) -> [(factor, delta)], validated against the book.
+        """
+        deltas = []
+        for action, trade_id, factor, exposure in changes:
+            if action in ('remove', 'amend'):
+                if trade_id not in self.trades:
+                    raise KeyError(f"Unknown trade_id: {trade_id}")
+                old_factor, old_exposure = self.trades[trade_id]
+                deltas.append((old_factor, -old_exposure))
+            elif action == 'add':
+                if trade_id in self.trades:
+                    raise KeyError(f"Duplicate trade_id: {trade_id}")
+            else:
+                raise ValueError(f"Unknown action: {action}")
+            if action in ('add', 'amend'):
+                deltas.append((factor, float(exposure)))
+        return deltas
+
+    def load(self, trades: dict) -> None:
+        """
+        Replace the book: trades is trade_id -> (factor, exposure). One O(k^2) build.
+        """
+        self.trades = dict(trades)
+        self._ensure_factors([f for f, _ in self.trades.values()])
+        self.s = np.zeros(len(self.factors))
+        if self.trades:
+            codes = np.array([self.index[f] for f, _ in self.trades.values()])
+            weights = np.array([e for _, e in self.trades.values()], dtype=float)
+            self.s = np.bincount(codes, weights=weights, minlength=len(self.factors))
+        self._recompute()
+
+    def apply(self, changes: list[tuple], commit: bool = True) -> dict:
+        """
+        Apply (action, trade_id, factor, exposure) changes; action is add / remove / amend
+        (factor/exposure are ignored for remove). With commit=False the book is left untouched
+        and only the resulting figures are returned.
+        """
+        deltas = self._deltas(changes)
+        if commit:
+            self._ensure_factors([f for f, _ in deltas])
+        before = self.summary()
+
+        factors, index, corr = self.factors, self.index, self.corr
+        s, rs, variance = (self.s, self.rs, self.variance) if commit else (self.s.copy(), self.rs.copy(), self.variance)
+        extended = None if commit else self._extended([f for f, _ in deltas])
+        if extended is not None:
+            # Preview on new factors: extend local copies only, the book keeps its R and s
+            factors, corr, s = extended
+            index = {f: i for i, f in enumerate(factors)}
+            rs = corr.matrix @ s
+            variance = float(s @ rs)
+        for factor, delta in deltas:
+            variance = self._rank_one(corr, s, rs, variance, index[factor], delta)
+
+        if commit:
+            self.variance = variance
+            for action, trade_id, factor, exposure in changes:
+                if action == 'remove':
+                    del self.trades[trade_id]
+                else:
+                    self.trades[trade_id] = (factor, float(exposure))
+            self.updates += len(deltas)
+            if self.updates >= self.rebuild_every:
+                self._recompute()
+
+        after = self.summary(s, rs, variance, factors)
+        after['previous_pfe'] = before['diversified_pfe']
+        after['delta_pfe'] = after['diversified_pfe'] - before['diversified_pfe']
+        return after
+
+    def summary(self, s: np.ndarray | None = None, rs: np.ndarray | None = None,
+                variance: float | None = None, factors: list | None = None) -> dict:
+        """
+        Diversified PFE z*sqrt(s^T R s) and per-factor contributions s_j * z (R s)_j / sigma.
+        """
+        s = self.s if s is None else s
+        rs = self.rs if rs is None else rs
+        variance = self.variance if variance is None else variance
+        factors = self.factors if factors is None else factors
+
+        sigma = np.sqrt(max(variance, 0.0))
+        marginal = self.z * rs / sigma if sigma > 0 else np.zeros_like(rs)
+        held = np.flatnonzero(s)
+        return {
+            'diversified_pfe': float(self.z * sigma),
+            'undiversified_pfe': float(self.z * np.abs(s).sum()),
+            'contributions': {factors[j]: float(s[j] * marginal[j]) for j in held},
+            'marginal': {factors[j]: float(marginal[j]) for j in range(len(factors))},
+        }
+
+
+class WhatIfBook:
+    """
+    Per-counterparty PortfolioState, shared by request threads.
+
+    With store_dir every committed book is also written there (one JSON file per counterparty
+    with a version counter), so all processes on the host see the same books: a process whose
+    in-memory state is behind the stored version rebuilds it before answering, and commits are
+    serialized with a file lock. Without store_dir books live in this process only. Either way
+    a counterparty must be loaded before apply/summary.
+    """
+
+    def __init__(self, corr_provider: CorrProvider, z: float = Z_95, store_dir: str | None = None):
+        self.corr_provider = corr_provider
+        self.z = z
+        self.store_dir = store_dir
+        if store_dir:
+            os.makedirs(store_dir, exist_ok=True)
+        self._portfolios: dict = {}
+        self._locks: dict = {}
+        self._versions: dict = {}  # counterparty -> version of the in-memory state
+        self._lock = threading.Lock()
+
+    def _get(self, counterparty: str) -> tuple[PortfolioState, threading.Lock]:
+        with self._lock:
+            if counterparty not in self._portfolios:
+                self._portfolios[counterparty] = PortfolioState(self.corr_provider, self.z)
+                self._locks[counterparty] = threading.Lock()
+            return self._portfolios[counterparty], self._locks[counterparty]
+
+    def _path(self, counterparty: str) -> str:
+        return os.path.join(self.store_dir, hashlib.sha1(counterparty.encode()).hexdigest() + '.json')
+
+    @contextmanager
+    def _file_lock(self, counterparty: str):
+        if not self.store_dir or fcntl is None:
+            yield
+            return
+        with open(self._path(counterparty) + '.lock', 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _read(self, counterparty: str) -> tuple[int, dict] | None:
+        try:
+            with open(self._path(counterparty)) as f:
+                stored = json.load(f)
+        except FileNotFoundError:
+            return None
+        return stored['version'], {trade_id: tuple(trade) for trade_id, trade in stored['trades'].items()}
+
+    def _write(self, counterparty: str, trades: dict, version: int) -> None:
+        path = self._path(counterparty)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump({'counterparty': counterparty, 'version': version, 'trades': trades}, f)
+        os.replace(tmp, path)
+
+    def _sync(self, counterparty: str, state: PortfolioState) -> None:
+        if self.store_dir:
+            stored = self._read(counterparty)
+            if stored is not None and self._versions.get(counterparty) != stored[0]:
+                state.load(stored[1])
+                self._versions[counterparty] = stored[0]
+            elif stored is None:
+                self._versions.pop(counterparty, None)
+        if counterparty not in self._versions:
+            raise KeyError(f"No what-if book loaded for counterparty: {counterparty}")
+
+    def _commit(self, counterparty: str, state: PortfolioState) -> None:
+        version = self._versions.get(counterparty, 0) + 1
+        if self.store_dir:
+            stored = self._read(counterparty)
+            version = (stored[0] if stored else 0) + 1
+            self._write(counterparty, state.trades, version)
+        self._versions[counterparty] = version
+
+    def load(self, counterparty: str, trades: dict) -> dict:
+        state, lock = self._get(counterparty)
+        with lock, self._file_lock(counterparty):
+            state.load(trades)
+            self._commit(counterparty, state)
+            logger.info(f"What-if book {counterparty}: {len(trades)} trades over {len(state.factors)} factors")
+            return state.summary()
+
+    def apply(self, counterparty: str, changes: list[tuple], commit: bool = True) -> dict:
+        state, lock = self._get(counterparty)
+        with lock, self._file_lock(counterparty):
+            self._sync(counterparty, state)
+            result = state.apply(changes, commit)
+            if commit:
+                self._commit(counterparty, state)
+            return result
+
+    def summary(self, counterparty: str) -> dict:
+        state, lock = self._get(counterparty)
+        with lock, self._file_lock(counterparty):
+            self._sync(counterparty, state)
+            return state.summary()
+
+    def reset(self) -> None:
+        """
+        Drop all in-memory portfolios (e.g. after a correlation/as-of refresh). Stored books are
+        rebuilt against the new correlation on their next use.
+        """
+        with self._lock:
+            self._portfolios.clear()
+            self._locks.clear()
+            self._versions.clear()
@@ -1,21 +1,9 @@
-from dateutil.relativedelta import relativedelta
+from Done.Pculator.tenor import NAT_ORDINAL, code_to_ordinal, month_table
 import math
 import pandas as pd
 
 def date_trans(start_date, month_length):
-    result = []
-    for i in range(month_length):
-        target_date = start_date + relativedelta(months=i)
-        eomonth = (target_date.replace(day=1) + relativedelta(months=1)) - relativedelta(days=1)
-        month_str = target_date.strftime('%b-%y')
-        short_month = MONTH_CODE_MAP[target_date.strftime('%b')] + target_date.strftime('%y')
-        date_in_number = (eomonth - datetime(year=1899, month=12, day=30)).days
-        result.append({
-            'month_str': month_str,
-            'short_month': short_month,
-            'date_number': date_in_number
-        })
-    return result
+    return month_table(start_date, month_length).to_dict('records')
 
 def replace_space_with_underscore(text: str) -> str:
     return text.replace(" ", "_")
@@ -70,8 +58,13 @@ def find_furthest_date(data_source: pd.DataFrame, risk_factor: str):
 
     copy_set = factor_set.copy()
     copy_set['Month_Code'] = factor_set['RISK_FACTOR'].str[-3:]
+    ordinals = code_to_ordinal(copy_set['Month_Code'])
+    bad = ordinals == NAT_ORDINAL
+    if bad.any():
+        print(f"Skipping unknown month codes for {risk_factor}: {sorted(copy_set.loc[bad, 'Month_Code'].unique())}")
+        copy_set, ordinals = copy_set[~bad], ordinals[~bad]
     copy_set['Month'] = copy_set['Month_Code'].str[0]
-    copy_set['year'] = 2000 + copy_set['Month_Code'].str[1:].astype(int)
-    copy_set['Month_NUM'] = copy_set['Month'].map(trading_code_to_month).astype(int)
+    copy_set['year'] = 1970 + ordinals // 12
+    copy_set['Month_NUM'] = ordinals % 12 + 1
     sort_data = copy_set.sort_values(by=['year', 'Month_NUM'], ascending=[False, False])
     return sort_data
@@ -1,11 +1,423 @@
 import pandas as pd
 import numpy as np
 from collections import defaultdict
+import io
 import os
 import time
 import csv
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 from typing import Dict, List, Tuple, Optional, Union
 
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.compute as pc
+
+NA_VALUES = ['', 'NA', 'N/A', 'null', 'NULL']
+SNIFF_BYTES = 64 * 1024   # 分隔符/编码/表头探测读取的字节数
+SNIFF_ROWS = 10000        # 类型推断使用的样本行数
+ROW_KEY = 'row_number'    # 没有关键列时按行号匹配
+SUFFIXES = ('_file1', '_file2')
+SPILL_BLOCK_SIZE = 16 << 20  # 分区模式下流式读取的块大小 (字节)
+# 最多 18 位的整数一定在 int64 范围内; 更长的数字串按字符串 (关键列) 或浮点 (比较列) 处理
+INTEGER_PATTERN = r'^\s*[+-]?[0-9]{1,18}\s*$'
+# 日期列候选格式, 按顺序取第一个能解析全部样本值的 (月/日有歧义时与 pandas 一样月在前);
+# 都不行时逐值解析 ('mixed'), 结果与分块方式无关
+DATE_FORMATS = [
+    '%Y-%m-%d', '%Y-%m-%d %H:%M:%S', '%Y/%m/%d', '%Y%m%d',
+    '%m/%d/%Y', '%d/%m/%Y', '%m/%d/%Y %H:%M:%S', '%d/%m/%Y %H:%M:%S',
+    '%d-%m-%Y', '%d.%m.%Y', '%d-%b-%Y', '%d-%b-%y', 'ISO8601',
+]
+
+
+def detect_format(file_path: str) -> Tuple[str, str, List[str]]:
+    """探测分隔符、编码和表头 (只读取文件开头 SNIFF_BYTES 字节)"""
+    with open(file_path, 'rb') as f:
+        head = f.read(SNIFF_BYTES)
+    # 截到最后一个完整行，避免切断多字节字符
+    if b'\n' in head:
+        head = head[:head.rfind(b'\n') + 1]
+
+    for encoding in ['utf-8-sig', 'cp1252', 'latin1']:
+        try:
+            text = head.decode(encoding)
+            break
+        except UnicodeDecodeError:
+            continue
+    else:
+        raise ValueError(f"无法确定文件编码: {file_path}")
+
+    try:
+        delimiter = csv.Sniffer().sniff(text[:1024], delimiters=',;\t|').delimiter
+    except csv.Error:
+        delimiter = ','
+    header = next(csv.reader(io.StringIO(text), delimiter=delimiter), [])
+    # pyarrow 自动跳过 UTF-8 BOM
+    return delimiter, 'utf8' if encoding == 'utf-8-sig' else encoding, header
+
+
+def arrow_csv_options(delimiter: str, encoding: str, header: List[str], block_size: Optional[int] = None):
+    """所有列按字符串读取的 pyarrow 读取参数 (类型在样本上推断后再统一转换)"""
+    read_options = pa_csv.ReadOptions(encoding=encoding, **({'block_size': block_size} if block_size else {}))
+    parse_options = pa_csv.ParseOptions(delimiter=delimiter)
+    convert_options = pa_csv.ConvertOptions(
+        column_types={col: pa.string() for col in header},
+        null_values=NA_VALUES,
+        strings_can_be_null=True
+    )
+    return read_options, parse_options, convert_options
+
+
+def normalize_names(names: List[str], case_sensitive: bool) -> List[str]:
+    names = [name.strip() for name in names]
+    return names if case_sensitive else [name.lower() for name in names]
+
+
+def infer_column_types(samples: List[pa.Table], ignore_columns: List[str],
+                       key_columns: Optional[List[str]] = None) -> Dict[str, str]:
+    """
+    在样本上推断列类型: 'date:<格式>' (列名含 date)、'integer' (非空值都是整数)、'numeric'
+    (非空值都能转为数值) 或 'string'。两个文件共用同一套类型，保证对应列按同一种方式比较。
+    关键列一律按原字符串精确匹配: 样本只看前 SNIFF_ROWS 行, 按样本转成整数/浮点/日期时,
+    样本之外的值会被转为空并互相误配 (大整数 ID 转浮点也会丢失精度)。
+    日期格式在两个文件的样本上一次确定, 之后每个块都用同一格式解析。
+    """
+    rank = {'integer': 0, 'numeric': 1, 'string': 2}
+    types = {}
+    date_samples: Dict[str, List[pa.Array]] = {}
+    for sample in samples:
+        for name in sample.column_names:
+            if name in ignore_columns:
+                kind = 'string'
+            elif 'date' in name.lower():
+                date_samples.setdefault(name, []).append(sample[name].drop_null())
+                continue
+            else:
+                values = sample[name].drop_null()
+                if not len(values):
+                    kind = None
+                elif pc.all(pc.match_substring_regex(values, INTEGER_PATTERN)).as_py():
+                    kind = 'integer'
+                else:
+                    try:
+                        pc.cast(values, pa.float64())
+                        kind = 'numeric'
+                    except pa.ArrowInvalid:
+                        kind = 'string'
+            # 两个文件取较宽的类型 (integer < numeric < string); None (全空) 不影响判断
+            if kind is None:
+                continue
+            current = types.get(name)
+            if current is None or (kind in rank and current in rank and rank[kind] > rank[current]):
+                types[name] = kind
+    for name, values in date_samples.items():
+        types[name] = 'date:' + infer_date_format(pa.chunked_array(values, pa.string()))
+    for name in key_columns or []:
+        types[name] = 'string'
+    return types
+
+
+def infer_date_format(values: pa.ChunkedArray) -> str:
+    """样本日期值 (非空) 的格式: DATE_FORMATS 中第一个能解析全部不同值的, 否则 'mixed'"""
+    uniques = pd.Series(pc.unique(values).to_pylist(), dtype=object)
+    if uniques.empty:
+        return 'mixed'
+    for fmt in DATE_FORMATS:
+        if pd.to_datetime(uniques, format=fmt, errors='coerce').notna().all():
+            return fmt
+    return 'mixed'
+
+
+def _to_int64(column) -> np.ndarray | pd.Series:
+    """整数列转 int64; 有空值 (或样本之外出现非整数值, 记为空) 时为可空的 Int64"""
+    if pa.types.is_integer(column.type):
+        integers = column.cast(pa.int64())
+    else:
+        ok = pc.match_substring_regex(column, INTEGER_PATTERN)
+        integers = pc.cast(pc.utf8_trim_whitespace(pc.if_else(ok, column, pa.scalar(None, pa.string()))), pa.int64())
+    if integers.null_count == 0:
+        return integers.to_numpy()
+    return pd.Series(integers.to_pandas(types_mapper={pa.int64(): pd.Int64Dtype()}.get))
+
+
+def _to_datetime(values: pd.Series, date_format: str) -> pd.Series:
+    """按固定格式解析; 样本之外不符合该格式的值逐值解析 ('mixed'), 结果只取决于值本身"""
+    parsed = pd.to_datetime(values, format=date_format, errors='coerce')
+    retry = parsed.isna() & values.notna()
+    if retry.any() and date_format != 'mixed':
+        parsed[retry] = pd.to_datetime(values[retry], format='mixed', errors='coerce')
+    return parsed
+
+
+def typed_frame(table: pa.Table, types: Dict[str, str], case_sensitive: bool) -> pd.DataFrame:
+    """
+    按推断的类型把字符串表转换为 DataFrame: 整数列转 int64, 数值列整列 cast 为 float64,
+    日期列按推断的格式 to_datetime, 只对字符串列做向量化小写; 字符串列保持 Arrow 存储, 不生成 Python 对象。
+    """
+    columns = {}
+    for name, column in zip(table.column_names, table.columns):
+        kind, _, date_format = types.get(name, 'string').partition(':')
+        if kind == 'integer':
+            columns[name] = _to_int64(column)
+        elif kind == 'numeric':
+            try:
+                columns[name] = pc.cast(column, pa.float64()).to_numpy(zero_copy_only=False)
+            except pa.ArrowInvalid:
+                # 样本之外出现非数值: 与原逻辑一致, 无法转换的值记为空
+                columns[name] = pd.to_numeric(column.to_pandas(), errors='coerce').to_numpy(dtype=float)
+        elif kind == 'date':
+            columns[name] = _to_datetime(column.to_pandas(), date_format or 'mixed')
+        else:
+            if not case_sensitive:
+                column = pc.utf8_lower(column)
+            columns[name] = pd.Series(pd.arrays.ArrowStringArray(column.combine_chunks()))
+    return pd.DataFrame(columns)
+
+
+def column_diff(a: pd.Series, b: pd.Series, tolerance: float) -> np.ndarray:
+    """对齐后的两列逐元素比较, 返回差异掩码; 两边同为空视为相同"""
+    na1 = a.isna().to_numpy()
+    na2 = b.isna().to_numpy()
+    if pd.api.types.is_integer_dtype(a) and pd.api.types.is_integer_dtype(b):
+        # 整数列按 int64 精确相减, 不经过 float64
+        diff = np.abs(a.to_numpy(dtype=np.int64, na_value=0) - b.to_numpy(dtype=np.int64, na_value=0)) > tolerance
+    elif pd.api.types.is_numeric_dtype(a) and pd.api.types.is_numeric_dtype(b):
+        with np.errstate(invalid='ignore'):
+            diff = np.abs(a.to_numpy(dtype=float, na_value=np.nan) - b.to_numpy(dtype=float, na_value=np.nan)) > tolerance
+    else:
+        diff = (a.reset_index(drop=True) != b.reset_index(drop=True)).to_numpy(dtype=bool, na_value=True)
+    return np.where(na1 | na2, na1 != na2, diff)
+
+
+# splitmix64 常量
+_MIX1, _MIX2, _GOLDEN = np.uint64(0xBF58476D1CE4E5B9), np.uint64(0x94D049BB133111EB), np.uint64(0x9E3779B97F4A7C15)
+
+
+def _mix64(h: np.ndarray) -> np.ndarray:
+    h = (h ^ (h >> np.uint64(30))) * _MIX1
+    h = (h ^ (h >> np.uint64(27))) * _MIX2
+    return h ^ (h >> np.uint64(31))
+
+
+def _string_hash(values: pd.Series) -> np.ndarray:
+    """
+    直接在 Arrow 的 offsets/data 缓冲区上做多项式哈希 (模 2^64) 再混合,
+    不生成 Python 字符串对象。
+    """
+    arr = pa.array(values.array).cast(pa.large_string())
+    if isinstance(arr, pa.ChunkedArray):
+        arr = arr.combine_chunks()
+    offsets = np.frombuffer(arr.buffers()[1], dtype=np.int64)[arr.offset:arr.offset + len(arr) + 1]
+    lengths = np.diff(offsets)
+    data = np.frombuffer(arr.buffers()[2], dtype=np.uint8)[offsets[0]:offsets[-1]] if arr.buffers()[2] else np.zeros(0, np.uint8)
+    starts = offsets[:-1] - offsets[0]
+
+    sums = np.zeros(len(arr), dtype=np.uint64)
+    filled = lengths > 0
+    if filled.any():
+        powers = np.cumprod(np.full(int(lengths.max()), _GOLDEN | np.uint64(1)))
+        pos = np.arange(len(data)) - np.repeat(starts, lengths)
+        sums[filled] = np.add.reduceat(data.astype(np.uint64) * powers[pos], starts[filled])
+    h = _mix64(sums + lengths.astype(np.uint64) * _GOLDEN)
+    h[values.isna().to_numpy()] = _GOLDEN
+    return h
+
+
+def _column_hash(values: pd.Series, tolerance: float) -> np.ndarray:
+    if pd.api.types.is_float_dtype(values):
+        # 按容差取整; +0.0 把 -0.0 归一, 空值统一为同一个 NaN
+        rounded = np.round(values.to_numpy(dtype=float) / tolerance) if tolerance > 0 else values.to_numpy(dtype=float)
+        rounded = np.where(np.isnan(rounded), np.nan, rounded + 0.0)
+        return _mix64(rounded.view(np.uint64))
+    if pd.api.types.is_integer_dtype(values):
+        # 整数按宽度 floor(tolerance) (不超过容差) 分桶: 同一桶内的差一定小于容差
+        ints = values.to_numpy(dtype=np.int64, na_value=0)
+        if tolerance >= 1:
+            ints = np.floor_divide(ints, int(tolerance))
+        h = _mix64(ints.view(np.uint64))
+        h[values.isna().to_numpy()] = _GOLDEN
+        return h
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return _mix64(values.to_numpy().view(np.int64).view(np.uint64))
+    if isinstance(values.dtype, pd.StringDtype) and values.dtype.storage == 'pyarrow':
+        sample = values.iloc[:SNIFF_ROWS]
+        if len(sample) and sample.nunique(dropna=False) > len(sample) // 2:
+            return _string_hash(values)
+        # 低基数列: 字典编码后只对字典值做哈希
+        encoded = pc.dictionary_encode(pa.array(values.array))
+        if isinstance(encoded, pa.ChunkedArray):
+            encoded = encoded.combine_chunks()
+        codes = encoded.indices.fill_null(len(encoded.dictionary)).to_numpy(zero_copy_only=False)
+        dictionary = pd.Series(pd.arrays.ArrowStringArray(encoded.dictionary.cast(pa.large_string())))
+        return np.append(_string_hash(dictionary), _GOLDEN)[codes]
+    return pd.util.hash_array(values.to_numpy())
+
+
+def row_digest(df: pd.DataFrame, columns: List[str], tolerance: float) -> np.ndarray:
+    """
+    每行可比较列的 64 位摘要。数值列先按容差取整 (round(x / tolerance)), 所以摘要相同的两行
+    在容差内一致 (除极小概率的哈希碰撞); 摘要不同只说明需要逐列比较,
+    例如两个值落在取整边界两侧。
+    """
+    digest = np.zeros(len(df), dtype=np.uint64)
+    for col in columns:
+        digest = _mix64(digest * _GOLDEN + _column_hash(df[col], tolerance))
+    return digest
+
+
+def diff_frames(df1: pd.DataFrame, df2: pd.DataFrame, key_columns: List[str],
+                columns: List[str], tolerance: float, row_hash: bool = True,
+                all_columns: bool = False) -> Dict:
+    """
+    在关键列上做哈希连接并逐列生成差异掩码。
+
+    row_hash 为 True 时先比较两边的行摘要 (row_digest), 只对摘要不一致的公共行做逐列比较;
+    文件大部分相同时成本约为一次哈希。
+
+    返回 {'stats', 'unique_to_df1', 'unique_to_df2', 'differing_rows'}; differing_rows 为宽表:
+    关键列、columns_changed, 以及每个有差异列的 <列>_file1 / <列>_file2 两列。
+    all_columns 为 True 时每个比较列都输出两列 (分区模式: 某列是否有差异要在合并全部分区后才知道)。
+    """
+    left = df1[key_columns].assign(_pos1=np.arange(len(df1)))
+    right = df2[key_columns].assign(_pos2=np.arange(len(df2)))
+    joined = left.merge(right, on=key_columns, how='outer', indicator=True, sort=False)
+    side = joined['_merge'].to_numpy()
+
+    unique1 = df1.iloc[joined['_pos1'].to_numpy()[side == 'left_only'].astype(np.intp)].reset_index(drop=True)
+    unique2 = df2.iloc[joined['_pos2'].to_numpy()[side == 'right_only'].astype(np.intp)].reset_index(drop=True)
+    both = side == 'both'
+    pos1 = joined['_pos1'].to_numpy()[both].astype(np.intp)
+    pos2 = joined['_pos2'].to_numpy()[both].astype(np.intp)
+    n_common = len(pos1)
+
+    if row_hash:
+        # 摘要一致的行视为相同, 跳过逐列比较
+        check = row_digest(df1, columns, tolerance)[pos1] != row_digest(df2, columns, tolerance)[pos2]
+        pos1, pos2 = pos1[check], pos2[check]
+    common1 = df1.iloc[pos1].reset_index(drop=True)
+    common2 = df2.iloc[pos2].reset_index(drop=True)
+
+    masks = {col: column_diff(common1[col], common2[col], tolerance) for col in columns}
+    row_diff = np.zeros(len(common1), dtype=bool)
+    for mask in masks.values():
+        row_diff |= mask
+
+    stats = {
+        'total_rows_df1': len(df1),
+        'total_rows_df2': len(df2),
+        'common_rows': n_common,
+        'unique_to_df1': len(unique1),
+        'unique_to_df2': len(unique2),
+        'differing_rows': int(row_diff.sum()),
+        'differing_cells': int(sum(int(mask.sum()) for mask in masks.values())),
+        'column_diffs': {col: int(mask.sum()) for col, mask in masks.items()},
+    }
+
+    rows = np.flatnonzero(row_diff)
+    differing = common1.loc[rows, key_columns].reset_index(drop=True)
+    changed = np.full(len(rows), '', dtype=object)
+    for col, mask in masks.items():
+        hit = mask[rows]
+        if not hit.any() and not all_columns:
+            continue
+        changed = np.where(hit, changed + col + ', ', changed)
+        differing[col + SUFFIXES[0]] = common1[col].array[rows]
+        differing[col + SUFFIXES[1]] = common2[col].array[rows]
+    differing.insert(len(key_columns), 'columns_changed', pd.Series(changed, dtype=object).str[:-2])
+
+    return {'stats': stats, 'unique_to_df1': unique1, 'unique_to_df2': unique2, 'differing_rows': differing}
+
+
+def merge_results(results: List[Dict], key_columns: List[str], columns: List[str]) -> Dict:
+    """
+    合并各分区的 diff_frames(all_columns=True) 结果: 统计相加, 差异表拼接。
+    差异表只保留整体上有差异的列, 列顺序与内存模式的单次 diff_frames 相同。
+    """
+    stats = {
+        'total_rows_df1': 0, 'total_rows_df2': 0, 'common_rows': 0, 'unique_to_df1': 0,
+        'unique_to_df2': 0, 'differing_rows': 0, 'differing_cells': 0, 'column_diffs': {}
+    }
+    for result in results:
+        for name, value in result['stats'].items():
+            if name == 'column_diffs':
+                for col, count in value.items():
+                    stats['column_diffs'][col] = stats['column_diffs'].get(col, 0) + count
+            else:
+                stats[name] += value
+
+    merged = {'stats': stats}
+    for name in ['unique_to_df1', 'unique_to_df2', 'differing_rows']:
+        frames = [result[name] for result in results if not result[name].empty]
+        merged[name] = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    if not merged['differing_rows'].empty:
+        layout = key_columns + ['columns_changed'] + [
+            col + suffix for col in columns if stats['column_diffs'].get(col) for suffix in SUFFIXES
+        ]
+        merged['differing_rows'] = merged['differing_rows'][layout]
+    return merged
+
+
+def read_sample(file_path: str, case_sensitive: bool, rows: int = SNIFF_ROWS) -> pa.Table:
+    """流式读取文件开头约 rows 行 (用于类型推断, 不读全文件)"""
+    delimiter, encoding, header = detect_format(file_path)
+    reader = pa_csv.open_csv(file_path, *arrow_csv_options(delimiter, encoding, header))
+    batches, count = [], 0
+    for batch in reader:
+        batches.append(batch)
+        count += batch.num_rows
+        if count >= rows:
+            break
+    table = pa.Table.from_batches(batches, schema=reader.schema).slice(0, rows)
+    return table.rename_columns(normalize_names(table.column_names, case_sensitive))
+
+
+def partition_file(file_path: str, out_dir: str, prefix: str, key_columns: List[str],
+                   types: Dict[str, str], n_partitions: int, case_sensitive: bool,
+                   block_size: int = SPILL_BLOCK_SIZE) -> List[str]:
+    """
+    单次流式读取文件, 按关键列 (类型转换后) 的哈希把每个块拆到 n_partitions 个 Arrow IPC 溢出文件。
+    两个文件用同一套类型和哈希, 相同的键一定落在同一编号的分区。没有关键列时追加全局行号作为键。
+    """
+    delimiter, encoding, header = detect_format(file_path)
+    reader = pa_csv.open_csv(file_path, *arrow_csv_options(delimiter, encoding, header, block_size))
+    names = normalize_names(reader.schema.names, case_sensitive)
+    schema = pa.schema([pa.field(name, pa.string()) for name in names])
+    if key_columns == [ROW_KEY]:
+        schema = schema.append(pa.field(ROW_KEY, pa.int64()))
+
+    paths = [os.path.join(out_dir, f"{prefix}_{i:04d}.arrow") for i in range(n_partitions)]
+    writers = [pa.ipc.new_file(path, schema) for path in paths]
+    offset = 0
+    try:
+        for batch in reader:
+            table = pa.Table.from_batches([batch]).rename_columns(names)
+            if key_columns == [ROW_KEY]:
+                table = table.append_column(ROW_KEY, pa.array(np.arange(offset, offset + table.num_rows)))
+            offset += table.num_rows
+
+            keys = typed_frame(table.select(key_columns), types, case_sensitive)
+            part = (pd.util.hash_pandas_object(keys, index=False).to_numpy() % n_partitions).astype(np.intp)
+            order = np.argsort(part, kind='stable')
+            bounds = np.searchsorted(part[order], np.arange(n_partitions + 1))
+            table = table.take(order)
+            for i in range(n_partitions):
+                if bounds[i + 1] > bounds[i]:
+                    writers[i].write_table(table.slice(bounds[i], bounds[i + 1] - bounds[i]))
+    finally:
+        for writer in writers:
+            writer.close()
+    return paths
+
+
+def compare_partition(task: Tuple) -> Dict:
+    """比较一对分区文件 (可在子进程中执行)"""
+    path1, path2, key_columns, columns, types, tolerance, case_sensitive, row_hash = task
+    frames = []
+    for path in (path1, path2):
+        with pa.memory_map(path) as source:
+            frames.append(typed_frame(pa.ipc.open_file(source).read_all(), types, case_sensitive))
+    return diff_frames(frames[0], frames[1], key_columns, columns, tolerance, row_hash, all_columns=True)
+
 
 class CSVComparator:
     def __init__(self, file1: str, file2: str,
@@ -13,9 +425,13 @@ class CSVComparator:
                  ignore_columns: Optional[List[str]] = None,
                  tolerance: float = 1e-6,
                  case_sensitive: bool = False,
-                 output_format: str = 'console'):
+                 output_format: str = 'console',
+                 partitions: int = 0,
+                 workers: int = 0,
+                 spill_dir: Optional[str] = None,
+                 row_hash: bool = True):
         """
-        高级CSV文件比较工具
+        高级CSV文件比较工具 (基于 Arrow 的列式引擎)
 
         参数:
         file1, file2: 要比较的CSV文件路径
@@ -23,7 +439,12 @@ class CSVComparator:
         ignore_columns: 忽略比较的列列表
         tolerance: 数值比较的容差
         case_sensitive: 是否区分大小写
-        output_format: 输出格式 ('console', 'csv', 'excel')
+        output_format: 输出格式 ('console', 'csv', 'excel'; 其他值如 'none' 不输出)
+        partitions: >1 时使用外存分区模式: 按关键列哈希分成 N 个溢出文件逐对比较,
+                    峰值内存由分区大小决定而不是文件大小
+        workers: 分区模式下比较分区的进程数 (0 为当前进程内顺序执行)
+        spill_dir: 溢出文件目录 (默认系统临时目录, 比较结束后删除)
+        row_hash: 先按行摘要跳过完全一致的行, 只对摘要不同的行逐列比较
         """
         self.file1 = file1
         self.file2 = file2
@@ -32,8 +453,13 @@ class CSVComparator:
         self.tolerance = tolerance
         self.case_sensitive = case_sensitive
         self.output_format = output_format
+        self.partitions = partitions
+        self.workers = workers
+        self.spill_dir = spill_dir
+        self.row_hash = row_hash
         self.df1 = None
         self.df2 = None
+        self.column_types = {}
         self.diff_report = defaultdict(list)
         self.stats = {
             'total_rows_df1': 0,
@@ -47,68 +473,25 @@ class CSVComparator:
         }
         self.comparison_time = 0
 
-    def _read_csv(self, file_path: str) -> pd.DataFrame:
-        """智能读取CSV文件，处理常见格式问题"""
+    def _read_csv(self, file_path: str) -> pa.Table:
+        """用 pyarrow 多线程读取CSV (全部为字符串列), 并规范列名"""
         try:
-            # 尝试自动检测分隔符和编码
-            with open(file_path, 'r', encoding='utf-8-sig') as f:
-                dialect = csv.Sniffer().sniff(f.read(1024))
-                f.seek(0)
-                encoding = 'utf-8'
-
-            return pd.read_csv(
-                file_path,
-                sep=dialect.delimiter,
-                encoding=encoding,
-                dtype=str,  # 初始读取为字符串以保留原始格式
-                na_values=['', 'NA', 'N/A', 'null', 'NULL'],
-                keep_default_na=False
-            )
-        except UnicodeDecodeError:
-            # 回退到其他常见编码
-            for encoding in ['latin1', 'ISO-8859-1', 'cp1252']:
-                try:
-                    return pd.read_csv(file_path, encoding=encoding)
-                except:
-                    continue
-            raise ValueError(f"无法确定文件编码: {file_path}")
+            delimiter, encoding, header = detect_format(file_path)
+            table = pa_csv.read_csv(file_path, *arrow_csv_options(delimiter, encoding, header))
+        except ValueError:
+            raise
         except Exception as e:
             raise IOError(f"读取文件失败: {file_path}\n错误: {str(e)}")
+        return table.rename_columns(normalize_names(table.column_names, self.case_sensitive))
 
-    def _preprocess_dataframe(self, df: pd.DataFrame) -> pd.DataFrame:
-        """数据预处理"""
-        # 清理列名
-        df.columns = df.columns.str.strip()
-
-        # 处理大小写敏感性
-        if not self.case_sensitive:
-            df = df.applymap(lambda x: x.lower() if isinstance(x, str) else x)
-            df.columns = [col.lower() for col in df.columns]
-
-        # 转换数值列
-        for col in df.columns:
-            if col in self.ignore_columns:
-                continue
-
-            # 尝试转换为数值
-            numeric_vals = pd.to_numeric(df[col], errors='coerce')
-            if not numeric_vals.isna().all():
-                df[col] = numeric_vals
-
-        # 处理日期列
-        date_cols = [col for col in df.columns if 'date' in col.lower()]
-        for col in date_cols:
-            try:
-                df[col] = pd.to_datetime(df[col], errors='coerce')
-            except:
-                pass
-
-        return df
+    def _preprocess_dataframe(self, table: pa.Table) -> pd.DataFrame:
+        """数据预处理: 按样本推断出的列类型整列转换"""
+        return typed_frame(table, self.column_types, self.case_sensitive)
 
-    def _validate_columns(self):
-        """验证两个数据框的列是否一致"""
-        cols1 = set(self.df1.columns)
-        cols2 = set(self.df2.columns)
+    def _validate_columns(self, columns1: List[str], columns2: List[str]):
+        """验证两个文件的列是否一致"""
+        cols1 = set(columns1)
+        cols2 = set(columns2)
 
         # 检查列差异
         missing_in_df2 = cols1 - cols2
@@ -124,122 +507,102 @@ class CSVComparator:
                 f"文件2有但文件1没有的列: {', '.join(missing_in_df1)}"
             )
 
-        # 更新公共列
-        self.common_columns = list(cols1 & cols2)
+        # 更新公共列 (保持文件1中的列顺序)
+        self.common_columns = [col for col in columns1 if col in cols2]
         self.comparable_columns = [
             col for col in self.common_columns
-            if col not in self.ignore_columns
+            if col not in self.ignore_columns and col not in (self.key_columns or [])
         ]
 
         return len(missing_in_df1) == 0 and len(missing_in_df2) == 0
 
+    def _check_keys(self):
+        """验证关键列是否存在"""
+        missing_keys = [key for key in self.key_columns or [] if key not in self.common_columns]
+        if missing_keys:
+            raise ValueError(f"关键列不存在: {', '.join(missing_keys)}")
+
+    def _store_result(self, result: Dict):
+        self.stats.update(result['stats'])
+        for name in ['unique_to_df1', 'unique_to_df2', 'differing_rows']:
+            if not result[name].empty:
+                self.diff_report[name] = result[name]
+
     def _compare_rows(self):
         """比较行内容"""
-        # 设置索引用于比较
+        self._check_keys()
         if self.key_columns:
-            # 验证关键列是否存在
-            missing_keys = [key for key in self.key_columns if key not in self.common_columns]
-            if missing_keys:
-                raise ValueError(f"关键列不存在: {', '.join(missing_keys)}")
-
-            df1 = self.df1.set_index(self.key_columns)
-            df2 = self.df2.set_index(self.key_columns)
+            keys, df1, df2 = self.key_columns, self.df1, self.df2
         else:
             # 没有关键列时使用行号
-            df1 = self.df1.reset_index(drop=True)
-            df2 = self.df2.reset_index(drop=True)
-
-        # 统计行数
-        self.stats['total_rows_df1'] = len(df1)
-        self.stats['total_rows_df2'] = len(df2)
-
-        # 找出唯一行
-        if self.key_columns:
-            index1 = set(df1.index)
-            index2 = set(df2.index)
-
-            unique_to_df1 = index1 - index2
-            unique_to_df2 = index2 - index1
-
-            self.stats['unique_to_df1'] = len(unique_to_df1)
-            self.stats['unique_to_df2'] = len(unique_to_df2)
-
-            # 记录唯一行
-            if unique_to_df1:
-                self.diff_report['unique_to_df1'] = df1.loc[list(unique_to_df1)].reset_index()
-            if unique_to_df2:
-                self.diff_report['unique_to_df2'] = df2.loc[list(unique_to_df2)].reset_index()
-
-            # 获取公共行
-            common_index = list(index1 & index2)
-            common_df1 = df1.loc[common_index]
-            common_df2 = df2.loc[common_index]
-        else:
-            # 没有关键列时，直接比较所有行
-            common_df1 = df1
-            common_df2 = df2
-            self.stats['unique_to_df1'] = 0
-            self.stats['unique_to_df2'] = 0
-
-        self.stats['common_rows'] = len(common_df1)
-
-        # 比较公共行
-        diff_mask = pd.DataFrame(False, index=common_df1.index, columns=common_df1.columns)
-
-        for col in self.comparable_columns:
-            col_diffs = 0
-
-            if pd.api.types.is_numeric_dtype(common_df1[col]) and pd.api.types.is_numeric_dtype(common_df2[col]):
-                # 数值列比较（带容差）
-                col_diff = np.abs(common_df1[col] - common_df2[col]) > self.tolerance
-                col_diff.fillna(True, inplace=True)  # 处理NaN
-                col_diffs = col_diff.sum()
-                diff_mask[col] = col_diff
+            keys = [ROW_KEY]
+            df1 = self.df1.assign(**{ROW_KEY: np.arange(len(self.df1))})
+            df2 = self.df2.assign(**{ROW_KEY: np.arange(len(self.df2))})
+
+        self._store_result(diff_frames(df1, df2, keys, self.comparable_columns, self.tolerance, self.row_hash))
+
+    def _compare_partitioned(self) -> bool:
+        """外存模式: 流式分区落盘, 逐对比较分区 (可多进程), 最后合并统计和差异"""
+        sample1 = read_sample(self.file1, self.case_sensitive)
+        sample2 = read_sample(self.file2, self.case_sensitive)
+        if not self._validate_columns(sample1.column_names, sample2.column_names):
+            return False
+        self._check_keys()
+
+        keys = self.key_columns or [ROW_KEY]
+        self.column_types = infer_column_types([sample1, sample2], self.ignore_columns, self.key_columns)
+        self.column_types[ROW_KEY] = 'integer'
+        del sample1, sample2
+
+        with tempfile.TemporaryDirectory(prefix='csv_compare_', dir=self.spill_dir) as spill:
+            parts1 = partition_file(self.file1, spill, 'file1', keys, self.column_types,
+                                    self.partitions, self.case_sensitive)
+            parts2 = partition_file(self.file2, spill, 'file2', keys, self.column_types,
+                                    self.partitions, self.case_sensitive)
+            tasks = [
+                (p1, p2, keys, self.comparable_columns, self.column_types, self.tolerance,
+                 self.case_sensitive, self.row_hash)
+                for p1, p2 in zip(parts1, parts2)
+            ]
+            if self.workers > 1:
+                with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                    results = list(pool.map(compare_partition, tasks))
             else:
-                # 非数值列比较
-                col_diff = common_df1[col] != common_df2[col]
-                col_diff.fillna(True, inplace=True)  # 处理NaN
-                col_diffs = col_diff.sum()
-                diff_mask[col] = col_diff
-
-            self.stats['column_diffs'][col] = col_diffs
-
-        # 找出有差异的行
-        row_diff = diff_mask.any(axis=1)
-        self.stats['differing_rows'] = row_diff.sum()
-        self.stats['differing_cells'] = diff_mask.sum().sum()
-
-        if row_diff.sum() > 0:
-            # 创建差异报告
-            diff_df = pd.DataFrame({
-                'row_key': common_df1.index[row_diff] if self.key_columns else row_diff.index[row_diff],
-                'columns_changed': diff_mask[row_diff].apply(lambda x: ', '.join(x.index[x]), axis=1),
-                'file1_values': common_df1[row_diff].apply(lambda x: x.to_dict(), axis=1),
-                'file2_values': common_df2[row_diff].apply(lambda x: x.to_dict(), axis=1)
-            })
-
-            self.diff_report['differing_rows'] = diff_df
+                results = [compare_partition(task) for task in tasks]
+
+        self._store_result(merge_results(results, keys, self.comparable_columns))
+        return True
 
     def compare(self) -> Dict:
         """执行比较并生成报告"""
         start_time = time.time()
 
         try:
-            # 读取文件
-            self.df1 = self._read_csv(self.file1)
-            self.df2 = self._read_csv(self.file2)
+            if self.partitions > 1:
+                # 外存分区模式
+                if not self._compare_partitioned():
+                    self.diff_report['status'] = '失败: 列不匹配'
+                    return self.diff_report
+            else:
+                # 读取文件
+                table1 = self._read_csv(self.file1)
+                table2 = self._read_csv(self.file2)
 
-            # 预处理
-            self.df1 = self._preprocess_dataframe(self.df1)
-            self.df2 = self._preprocess_dataframe(self.df2)
+                # 在样本上一次性推断列类型, 再整列转换
+                self.column_types = infer_column_types(
+                    [table1.slice(0, SNIFF_ROWS), table2.slice(0, SNIFF_ROWS)], self.ignore_columns, self.key_columns
+                )
+                self.df1 = self._preprocess_dataframe(table1)
+                self.df2 = self._preprocess_dataframe(table2)
+                del table1, table2
 
-            # 验证列
-            if not self._validate_columns():
-                self.diff_report['status'] = '失败: 列不匹配'
-                return self.diff_report
+                # 验证列
+                if not self._validate_columns(list(self.df1.columns), list(self.df2.columns)):
+                    self.diff_report['status'] = '失败: 列不匹配'
+                    return self.diff_report
 
-            # 比较行
-            self._compare_rows()
+                # 比较行
+                self._compare_rows()
 
             # 生成摘要
             summary = [
@@ -318,17 +681,17 @@ class CSVComparator:
         # 打印差异行
         if 'differing_rows' in self.diff_report and not self.diff_report['differing_rows'].empty:
             print(f"\n[内容差异行 ({self.stats['differing_rows']} 行)]")
+            keys = self.key_columns or [ROW_KEY]
             for _, row in self.diff_report['differing_rows'].head(3).iterrows():
-                print(f"\n行标识: {row['row_key']}")
+                changed = row['columns_changed'].split(', ')
+                print(f"\n行标识: {tuple(row[k] for k in keys) if len(keys) > 1 else row[keys[0]]}")
                 print(f"差异列: {row['columns_changed']}")
                 print("文件1值:")
-                for k, v in row['file1_values'].items():
-                    if k in row['columns_changed']:
-                        print(f"  {k}: {v}")
+                for k in changed:
+                    print(f"  {k}: {row[k + SUFFIXES[0]]}")
                 print("文件2值:")
-                for k, v in row['file2_values'].items():
-                    if k in row['columns_changed']:
-                        print(f"  {k}: {v}")
+                for k in changed:
+                    print(f"  {k}: {row[k + SUFFIXES[1]]}")
 
             if self.stats['differing_rows'] > 3:
                 print(f"\n... 只显示前3行，共 {self.stats['differing_rows']} 行差异")
@@ -379,7 +742,7 @@ class CSVComparator:
 
         with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
             # 摘要表
-            summary_df = pd.DataFrame([self.diff_report['summary'].split('\n')], columns=['摘要'])
+            summary_df = pd.DataFrame({'摘要': self.diff_report['summary'].split('\n')})
             summary_df.to_excel(writer, sheet_name='摘要', index=False)
 
             # 列差异
@@ -405,7 +768,9 @@ class CSVComparator:
                 )
 
             # 统计数据表
-            stats_df = pd.DataFrame.from_dict(self.stats, orient='index', columns=['值'])
+            stats = {k: v for k, v in self.stats.items() if k != 'column_diffs'}
+            stats.update({f"列差异: {col}": count for col, count in self.stats['column_diffs'].items()})
+            stats_df = pd.DataFrame.from_dict(stats, orient='index', columns=['值'])
             stats_df.index.name = '统计项'
             stats_df.to_excel(writer, sheet_name='统计信息')
 
@@ -433,4 +798,17 @@ if __name__ == "__main__":
         print(f"耗时: {report['comparison_time']}")
 
         if 'differing_rows' in report:
-            print(f"找到 {len(report['differing_rows'])} 行差异")
\ No newline at end of file
+            print(f"找到 {len(report['differing_rows'])} 行差异")
+
+    # 超大文件 - 外存分区模式 (按关键列哈希分成 64 个分区, 4 个进程比较)
+    large = CSVComparator(
+        file1='trades_full_1.csv',
+        file2='trades_full_2.csv',
+        key_columns=['trade_id'],
+        output_format='csv',
+        partitions=64,
+        workers=4
+    )
+    large_report = large.compare()
+    if large_report['status'] == '完成':
+        print(f"分区比较摘要:\n{large_report['summary']}")
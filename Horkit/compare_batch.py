@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+批量CSV比较: 清单文件或两个目录按文件名配对, 多进程运行 CSVComparator,
+汇总每对文件的统计、耗时和峰值内存。
+
+    python -m Horkit.compare_batch --manifest pairs.csv --keys trade_id --workers 8 -o summary.csv
+    python -m Horkit.compare_batch --dir1 prod/ --dir2 uat/ --pattern "*_20250630.csv" --keys id
+"""
+import os
+import time
+import fnmatch
+import argparse
+import resource
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List
+
+import pandas as pd
+
+from Horkit.File_manage import CSVComparator
+
+STAT_COLUMNS = [
+    'total_rows_df1', 'total_rows_df2', 'common_rows', 'unique_to_df1',
+    'unique_to_df2', 'differing_rows', 'differing_cells'
+]
+SUMMARY_COLUMNS = (
+    ['name', 'status', 'seconds', 'peak_rss_mb'] + STAT_COLUMNS
+    + ['columns_with_diffs', 'column_mismatch', 'error', 'file1', 'file2']
+)
+
+
+def load_manifest(path: str) -> List[Dict]:
+    """清单CSV: 必须有 file1, file2 列, 可选 name 列 (默认取 file1 的文件名)"""
+    manifest = pd.read_csv(path, dtype=str)
+    missing = {'file1', 'file2'} - set(manifest.columns)
+    if missing:
+        raise ValueError(f"清单缺少列: {', '.join(sorted(missing))}")
+    if 'name' not in manifest.columns:
+        manifest['name'] = manifest['file1'].map(os.path.basename)
+    return manifest[['name', 'file1', 'file2']].to_dict('records')
+
+
+def pair_directories(dir1: str, dir2: str, pattern: str = '*.csv') -> List[Dict]:
+    """两个目录中文件名相同且匹配 pattern 的文件配对; 只在一边出现的文件 file1/file2 为 None"""
+    names1 = {f for f in os.listdir(dir1) if fnmatch.fnmatch(f, pattern)}
+    names2 = {f for f in os.listdir(dir2) if fnmatch.fnmatch(f, pattern)}
+    return [
+        {
+            'name': name,
+            'file1': os.path.join(dir1, name) if name in names1 else None,
+            'file2': os.path.join(dir2, name) if name in names2 else None,
+        }
+        for name in sorted(names1 | names2)
+    ]
+
+
+def _reset_peak_rss():
+    # Linux: 写 5 到 clear_refs 会重置 VmHWM, 使峰值只反映当前这对文件
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def _peak_rss_mb() -> float:
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # 其他平台: 进程生命周期内的峰值
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def compare_pair(pair: Dict, options: Dict) -> Dict:
+    """比较一对文件 (在工作进程中执行), 返回扁平的一行汇总"""
+    row = {'name': pair['name'], 'file1': pair['file1'], 'file2': pair['file2']}
+    if not pair['file1'] or not pair['file2']:
+        row['status'] = '缺少文件: ' + ('文件1' if not pair['file1'] else '文件2')
+        return row
+
+    _reset_peak_rss()
+    start = time.perf_counter()
+    comparator = CSVComparator(pair['file1'], pair['file2'], **options)
+    report = comparator.compare()
+    row['seconds'] = time.perf_counter() - start
+    row['peak_rss_mb'] = _peak_rss_mb()
+
+    row['status'] = report['status']
+    row.update({name: comparator.stats[name] for name in STAT_COLUMNS})
+    row['columns_with_diffs'] = ', '.join(
+        f"{col}({count})" for col, count in comparator.stats['column_diffs'].items() if count
+    )
+    if report.get('column_diffs'):
+        row['column_mismatch'] = '; '.join(report['column_diffs'])
+    if 'error' in report:
+        row['error'] = report['error']
+    return row
+
+
+def run_batch(pairs: List[Dict], workers: int = 4, **options) -> pd.DataFrame:
+    """
+    多进程比较所有文件对, 返回汇总表 (每对一行, 按耗时降序)。
+    options 原样传给 CSVComparator; 默认 output_format='none', 不逐对打印报告。
+    """
+    options.setdefault('output_format', 'none')
+    if workers > 1:
+        rows = []
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(compare_pair, pair, options): pair for pair in pairs}
+            for future in as_completed(futures):
+                pair = futures[future]
+                try:
+                    rows.append(future.result())
+                except Exception as e:
+                    # 工作进程异常退出 (如内存不足) 时仍保留这一行
+                    rows.append({**pair, 'status': f'错误: {str(e)}', 'error': str(e)})
+    else:
+        rows = [compare_pair(pair, options) for pair in pairs]
+
+    summary = pd.DataFrame(rows).reindex(columns=SUMMARY_COLUMNS)
+    summary[STAT_COLUMNS] = summary[STAT_COLUMNS].astype('Int64')
+    return summary.sort_values('seconds', ascending=False, na_position='last').reset_index(drop=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='批量比较CSV文件对')
+    parser.add_argument('--manifest', help='清单CSV (列 file1, file2, 可选 name)')
+    parser.add_argument('--dir1', help='目录1 (与 --dir2 按文件名配对)')
+    parser.add_argument('--dir2', help='目录2')
+    parser.add_argument('--pattern', default='*.csv', help='目录模式下的文件名匹配模式')
+    parser.add_argument('--keys', nargs='*', help='关键列')
+    parser.add_argument('--ignore', nargs='*', default=[], help='忽略比较的列')
+    parser.add_argument('--tolerance', type=float, default=1e-6, help='数值比较容差')
+    parser.add_argument('--case-sensitive', action='store_true', help='区分大小写')
+    parser.add_argument('--partitions', type=int, default=0, help='每对文件使用外存分区模式的分区数')
+    parser.add_argument('--workers', '-w', type=int, default=4, help='并行比较的进程数')
+    parser.add_argument('--output', '-o', help='汇总表输出路径 (.csv 或 .xlsx)')
+    args = parser.parse_args()
+
+    if args.manifest:
+        pairs = load_manifest(args.manifest)
+    elif args.dir1 and args.dir2:
+        pairs = pair_directories(args.dir1, args.dir2, args.pattern)
+    else:
+        parser.error('需要 --manifest 或 --dir1/--dir2')
+
+    start = time.perf_counter()
+    summary = run_batch(
+        pairs, args.workers, key_columns=args.keys, ignore_columns=args.ignore,
+        tolerance=args.tolerance, case_sensitive=args.case_sensitive, partitions=args.partitions
+    )
+    elapsed = time.perf_counter() - start
+
+    done = summary['status'] == '完成'
+    print(f"{len(summary)} 对文件, {elapsed:.1f} 秒 ({args.workers} 进程): "
+          f"完成 {int(done.sum())}, 有差异 {int((done & (summary['differing_rows'] > 0)).sum())}, "
+          f"失败 {int((~done).sum())}")
+    with pd.option_context('display.max_columns', None, 'display.width', 200):
+        print("\n最慢的 10 对:")
+        print(summary.head(10)[['name', 'status', 'seconds', 'peak_rss_mb', 'differing_rows']])
+
+    if args.output:
+        if args.output.endswith('.xlsx'):
+            summary.to_excel(args.output, index=False)
+        else:
+            summary.to_csv(args.output, index=False)
+        print(f"汇总表已保存到: {args.output}")
@@ -4,6 +4,9 @@ import pandas as pd
 from datetime import datetime, date
 from dateutil.relativedelta import relativedelta
 import math
+import numpy as np
+from Done.Pculator.curve_registry import CurveRegistry
+from Done.Pculator.tenor import NAT_ORDINAL, code_to_ordinal, date_to_ordinal, month_start, ordinal_to_code
 
 
 # 月份代码映射
@@ -72,6 +75,7 @@ curve_mapping_source = [
 ]
 
 curve_mapping = pd.DataFrame(curve_mapping_source)
+curve_registry = CurveRegistry(curve_mapping_source)
 
 # 1. 构造测试DataFrame
 test_data = [
@@ -144,50 +148,30 @@ def convert_deliver_month_to_date(date_str: str) -> date:
 # print(test_r)
 
 def country_mapping(commodity: str) -> list:
-    country_list = curve_mapping.loc[curve_mapping['commodity'] == commodity, 'destination']
-    return list(country_list)
+    return curve_registry.destinations_for(commodity)
 
 
-def risk_curve_mapping(commodity: str, destination: str) -> str:
-    sub_set = curve_mapping.loc[(curve_mapping['commodity'] == commodity) &
-                                (curve_mapping['destination'] == destination),'curve_root'
-    ]
-    return sub_set.values[0]
+def risk_curve_mapping(commodity: str, destination: str) -> str | None:
+    return curve_registry.curve_root(commodity, destination)
 
 
 def get_date_list(data_source, risk_curve_root) -> list:
     pattern = fr'^{risk_curve_root}_[A-Z][0-9]{{2}}$'
-    factor_set = data_source[data_source['RISK_FACTOR'].str.contains(pattern, regex=True, na=False)]
+    factors = data_source.loc[data_source['RISK_FACTOR'].str.contains(pattern, regex=True, na=False), 'RISK_FACTOR']
 
-    if factor_set.empty:
+    if factors.empty:
         print(f"警告: 风险曲线 {risk_curve_root} 不存在或没有有效数据")
         return []
 
-    date_list = []
-    seen = set()
+    # 月份代码整列转换, 只解析不同的代码
+    factors = factors.drop_duplicates()
+    ordinals = code_to_ordinal(factors.str[-3:])
+    bad = ordinals == NAT_ORDINAL
+    if bad.any():
+        print(f"跳过非法风险因子: {', '.join(factors[bad])}")
 
-    code_to_month = {v: k for k, v in MONTH_CODE_MAP.items()}
-
-    for _, row in factor_set.iterrows():
-        risk_factor = row['RISK_FACTOR']
-        if risk_factor in seen:
-            continue
-        seen.add(risk_factor)
-
-        month_code = risk_factor[-3:-2]
-        year_short = risk_factor[-2:]
-        try:
-            month_str = code_to_month[month_code]
-            month_num = datetime.strptime(month_str, "%b").month
-            year_full = 2000 + int(year_short)
-            date_obj = datetime(year_full, month_num, 1)
-            date_list.append(date_obj.date())
-        except Exception as e:
-            print(f"跳过非法风险因子: {risk_factor} 原因: {e}")
-            continue
-
-    date_list.sort(reverse=True)
-    return date_list
+    days = np.unique(month_start(ordinals[~bad]))[::-1]
+    return [d.item() for d in days]
 
 
 # get_date_result = get_date_list(viya_vol,"Prncpl_CNSTNZ_SBMPS_CIF")
@@ -212,10 +196,7 @@ def match_curve(risk_curve_root, deliver_month, data_source):
         match_date = min(date_list, key=lambda d: abs((delivery_date - d).days))
 
     # 构造 risk_factor
-    month_code_map = {v: k for k, v in trading_code_to_month.items()}
-    month_code = month_code_map[match_date.month]
-    year_short = str(match_date.year)[-2:]
-    risk_factor = f"{risk_curve_root}_{month_code}{year_short}"
+    risk_factor = f"{risk_curve_root}_{ordinal_to_code(date_to_ordinal([match_date]))[0]}"
 
     return risk_factor
 
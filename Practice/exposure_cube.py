@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+合并后的 Viterra/Bunge 敞口数据的聚合立方体: 按维度全部组合预先汇总, 下钻查询直接读立方体。
+
+    python -m Practice.exposure_cube build credit_combine_exposure_result.parquet cube.parquet
+    python -m Practice.exposure_cube query cube.parquet --by Subdivision --filter "Customer Supergroup=SG A"
+"""
+import json
+import argparse
+from itertools import combinations
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+DIMENSIONS = ['Customer Supergroup', 'Business Unit Original', 'Subdivision', 'Position Date']
+MEASURES = ['AR (Secured)', 'AR (Unsecured)', 'AR (Total)', 'MTM (+)', 'Total Exposure (AR + MTM)']
+ROWS = 'Rows'
+LEVEL = 'level'
+CUBE_META = 'exposure_cube'
+
+
+def group_sum(codes: np.ndarray, sizes: List[int], values: np.ndarray):
+    """
+    按整数编码分组求和: 多列编码合成一个键 (ravel_multi_index), 排序后 np.add.reduceat。
+    返回 (各组编码, 各组合计)。
+    """
+    n = len(values)
+    if n == 0:
+        return codes[:0], values[:0]
+    key = np.ravel_multi_index(codes.T, sizes) if codes.shape[1] else np.zeros(n, dtype=np.int64)
+    order = np.argsort(key, kind='stable')
+    key = key[order]
+    starts = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+    return codes[order[starts]], np.add.reduceat(values[order], starts, axis=0)
+
+
+# Bunge 为 ISO (YYYY-MM-DD, 可带时间), Viterra 为 DD/MM/YYYY; 按顺序尝试, 每种格式都显式给出
+DATE_FORMATS = ('ISO8601', '%d/%m/%Y')
+
+
+def normalize_dates(values: pd.Series, formats: Iterable[str] = DATE_FORMATS, strict: bool = False) -> pd.Series:
+    """
+    日期统一成 YYYY-MM-DD: 依次用 formats 中的格式解析尚未解析的值 (不做格式推断,
+    避免 2024-03-01 被当成日在前); 都无法识别的保留原值, strict 时直接报错。
+    """
+    values = pd.Series(values, dtype=object)
+    # 一列中日期只有少数几个不同值, 只解析不同值
+    codes, uniques = pd.factorize(values)
+    uniques = pd.Series(uniques, dtype=object)
+    parsed = pd.Series(pd.NaT, index=uniques.index, dtype='datetime64[ns]')
+    for fmt in formats:
+        todo = parsed.isna()
+        if not todo.any():
+            break
+        parsed[todo] = pd.to_datetime(uniques[todo], format=fmt, errors='coerce')
+    if strict and parsed.isna().any():
+        raise ValueError(f"无法按 {list(formats)} 解析的日期: {uniques[parsed.isna()][:5].tolist()}")
+    text = parsed.dt.strftime('%Y-%m-%d').astype(object).where(parsed.notna(), uniques)
+    return pd.Series(np.append(text.to_numpy(), None)[codes], index=values.index, dtype=object)
+
+
+class CubeBuilder:
+    """
+    逐块累积最细粒度 (全部维度) 的汇总: 每块把维度值 factorize 后映射到全局编码,
+    块内先 group_sum, 最后再合并一次。内存只与维度组合数有关。
+    """
+
+    def __init__(self, dimensions: List[str] = DIMENSIONS, measures: List[str] = MEASURES):
+        self.dimensions = dimensions
+        self.measures = measures
+        self.categories: List[Dict] = [{} for _ in dimensions]
+        self._codes: List[np.ndarray] = []
+        self._sums: List[np.ndarray] = []
+
+    def add(self, df: pd.DataFrame) -> None:
+        if df.empty:
+            return
+        codes = np.empty((len(df), len(self.dimensions)), dtype=np.int64)
+        for j, dim in enumerate(self.dimensions):
+            values = df[dim] if dim in df else pd.Series(None, index=df.index, dtype=object)
+            local, uniques = pd.factorize(values.astype(object), use_na_sentinel=False)
+            # 只对块内的不同值做转换 (日期解析、空值统一为 None)
+            uniques = pd.Series(uniques, dtype=object)
+            if dim == 'Position Date':
+                uniques = normalize_dates(uniques)
+            uniques = uniques.where(uniques.notna(), None)
+            lookup = self.categories[j]
+            mapping = np.array([lookup.setdefault(u, len(lookup)) for u in uniques], dtype=np.int64)
+            codes[:, j] = mapping[local]
+
+        values = np.column_stack(
+            [pd.to_numeric(df[m], errors='coerce').fillna(0.0).to_numpy(dtype=float) if m in df else np.zeros(len(df))
+             for m in self.measures] + [np.ones(len(df))]
+        )
+        base_codes, base_sums = group_sum(codes, self._sizes(), values)
+        self._codes.append(base_codes)
+        self._sums.append(base_sums)
+
+    def _sizes(self) -> List[int]:
+        return [max(len(c), 1) for c in self.categories]
+
+    def build(self) -> 'ExposureCube':
+        k = len(self.dimensions)
+        if self._codes:
+            base_codes, base_sums = group_sum(np.vstack(self._codes), self._sizes(), np.vstack(self._sums))
+        else:
+            base_codes, base_sums = np.zeros((0, k), dtype=np.int64), np.zeros((0, len(self.measures) + 1))
+        labels = [np.array(list(c.keys()), dtype=object) for c in self.categories]
+
+        # 每个维度子集一个 cuboid, level 为子集的位掩码 (第 j 位对应 dimensions[j])
+        cuboids = {}
+        for r in range(k + 1):
+            for subset in combinations(range(k), r):
+                sizes = [self._sizes()[j] for j in subset]
+                codes, sums = group_sum(base_codes[:, list(subset)], sizes, base_sums)
+                frame = pd.DataFrame({self.dimensions[j]: labels[j][codes[:, i]] for i, j in enumerate(subset)})
+                frame[self.measures + [ROWS]] = sums
+                frame[ROWS] = frame[ROWS].astype(np.int64)
+                cuboids[sum(1 << j for j in subset)] = frame
+        return ExposureCube(cuboids, self.dimensions, self.measures)
+
+
+class ExposureCube:
+    """
+    预先汇总的立方体: query(by, **filters) 选中恰好包含 by 和过滤维度的 cuboid 并在其上过滤,
+    不再读原始明细。
+    """
+
+    def __init__(self, cuboids: Dict[int, pd.DataFrame], dimensions: List[str], measures: List[str]):
+        self.cuboids = cuboids
+        self.dimensions = dimensions
+        self.measures = measures
+
+    @classmethod
+    def from_frames(cls, frames: Iterable[pd.DataFrame], dimensions: List[str] = DIMENSIONS,
+                    measures: List[str] = MEASURES) -> 'ExposureCube':
+        builder = CubeBuilder(dimensions, measures)
+        for df in frames:
+            builder.add(df)
+        return builder.build()
+
+    @classmethod
+    def from_file(cls, path: str, chunk_rows: int = 200_000, **kwargs) -> 'ExposureCube':
+        """合并结果文件 (.csv / .parquet) 分块读入构建"""
+        from Done.Pculator.streaming import iter_chunks
+        return cls.from_frames(iter_chunks(path, chunk_rows), **kwargs)
+
+    def save(self, path: str) -> None:
+        """所有 cuboid 存成一个小 parquet, level 列区分汇总层级"""
+        frames = [frame.assign(**{LEVEL: level}) for level, frame in self.cuboids.items()]
+        cube = pd.concat(frames, ignore_index=True).reindex(columns=[LEVEL] + self.dimensions + self.measures + [ROWS])
+        for dim in self.dimensions:
+            cube[dim] = cube[dim].astype('string')
+        table = pa.Table.from_pandas(cube, preserve_index=False)
+        meta = {CUBE_META: json.dumps({'dimensions': self.dimensions, 'measures': self.measures})}
+        pq.write_table(table.replace_schema_metadata({**(table.schema.metadata or {}), **meta}), path)
+
+    @classmethod
+    def load(cls, path: str) -> 'ExposureCube':
+        table = pq.read_table(path)
+        meta = json.loads(table.schema.metadata[CUBE_META.encode()])
+        dimensions, measures = meta['dimensions'], meta['measures']
+        cube = table.to_pandas()
+        cuboids = {}
+        for level, frame in cube.groupby(LEVEL, sort=False):
+            dims = [d for j, d in enumerate(dimensions) if level >> j & 1]
+            cuboids[int(level)] = frame[dims + measures + [ROWS]].reset_index(drop=True)
+        return cls(cuboids, dimensions, measures)
+
+    def query(self, by: Optional[List[str]] = None, **filters) -> pd.DataFrame:
+        """
+        按 by 维度汇总, filters 为 维度=值 (或值列表) 的过滤; 维度名中的空格等可用 dict 传入:
+        cube.query(['Subdivision'], **{'Customer Supergroup': 'SG A'})
+        """
+        by = list(by or [])
+        unknown = [d for d in by + list(filters) if d not in self.dimensions]
+        if unknown:
+            raise KeyError(f"未知维度: {', '.join(unknown)}")
+        level = sum(1 << self.dimensions.index(d) for d in set(by) | set(filters))
+        frame = self.cuboids[level]
+
+        mask = np.ones(len(frame), dtype=bool)
+        for dim, value in filters.items():
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            mask &= frame[dim].isin(values).to_numpy()
+        result = frame.loc[mask]
+        if set(filters) - set(by):
+            # 过滤维度不在输出中: 在已过滤的小表上再汇总一次
+            result = result.groupby(by, sort=False, dropna=False)[self.measures + [ROWS]].sum().reset_index() \
+                if by else result[self.measures + [ROWS]].sum().to_frame().T
+        return result[by + self.measures + [ROWS]].sort_values(by).reset_index(drop=True) if by \
+            else result[self.measures + [ROWS]].reset_index(drop=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='敞口聚合立方体')
+    sub = parser.add_subparsers(dest='command', required=True)
+    build = sub.add_parser('build', help='由合并结果文件构建立方体')
+    build.add_argument('source')
+    build.add_argument('cube')
+    query = sub.add_parser('query', help='查询立方体')
+    query.add_argument('cube')
+    query.add_argument('--by', nargs='*', default=[], help='输出维度')
+    query.add_argument('--filter', action='append', default=[], help='维度=值, 可重复')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        ExposureCube.from_file(args.source).save(args.cube)
+        print(f"立方体已保存到: {args.cube}")
+    else:
+        filters = dict(f.split('=', 1) for f in args.filter)
+        with pd.option_context('display.max_rows', 200, 'display.width', 200):
+            print(ExposureCube.load(args.cube).query(args.by, **filters))
@@ -0,0 +1,222 @@
+import os
+import csv
+import time
+from typing import Callable, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.compute as pc
+
+from Done.Pculator.streaming import iter_chunks, ChunkWriter
+from Practice.exposure_cube import CubeBuilder, normalize_dates
+
+CHUNK_ROWS = 200_000
+VITERRA_ENCODING = 'ISO-8859-1'
+BUNGE_SHEET = 'data'
+
+# 列名映射配置
+VITERRA_COLUMN_MAP = {
+    'Supergroup': 'Customer Supergroup',
+    'Legal Entity': 'Business Unit Original',
+    'Subdivision': 'Subdivision',
+    'Position Date': 'Position Date',
+    'Sum of Secured AR': 'AR (Secured)',
+    'Sum of Unsecured AR': 'AR (Unsecured)',
+    'Sum of Total AR': 'AR (Total)',
+    'Sum of MTM': 'MTM Original',
+    'Sum of MTM Positive': 'MTM (+)',
+    'Sum of Current AR': 'AR (Total) (Current)',
+    'Sum of Aging 1-31': 'AR (Total) (1-31)',
+    'Sum of Aging 32+': 'AR (Total) (Over 32)'
+}
+VITERRA_DROP = ['Customer Country']
+
+NUMERIC_COLS = [
+    'AR (Secured)', 'AR (Unsecured)', 'AR (Total)', 'MTM Original', 'MTM (+)',
+    'AR (Total) (Current)', 'AR (Total) (1-31)', 'AR (Total) (Over 32)'
+]
+TOTAL_EXPOSURE = 'Total Exposure (AR + MTM)'
+
+# 各数据源的日期格式: Bunge 为 ISO (Excel 日期或 YYYY-MM-DD[ HH:MM:SS]); Viterra 的格式
+# 每个文件扫描一遍日期列确定 (DATE_FORMAT_CANDIDATES 中唯一能解析全部值的格式)。
+# 合并结果统一写成 YYYY-MM-DD, 无法解析的日期直接报错
+DATE_COLS = ['Position Date']
+SOURCE_DATE_FORMATS = {'Bunge': 'ISO8601'}
+DATE_FORMAT_CANDIDATES = ('ISO8601', '%m/%d/%Y', '%d/%m/%Y')
+
+# 金额格式: 1,234.50 / -1,234.50 / (1,234.50) / 1,234.50- / "-" (零) / 空 (零)
+AMOUNT_PATTERN = (
+    r'^\s*(?P<paren>\()?\s*(?P<lead>-)?\s*(?P<digits>[0-9,]*(?:\.[0-9]*)?)\s*(?P<trail>-)?\s*\)?\s*$'
+)
+
+ProgressCallback = Callable[[str, int], None]
+
+
+def parse_amounts(values) -> np.ndarray:
+    """
+    文本金额一次正则提取 (RE2, 在 Arrow 内执行) 转 float64: 去千分位, 负号/括号/尾随负号记为负数,
+    空值和单独的 "-" 记为 0。无法识别的值直接报错, 不静默置零。
+    """
+    arr = values if isinstance(values, (pa.Array, pa.ChunkedArray)) else pa.array(values, type=pa.string())
+    if isinstance(arr, pa.ChunkedArray):
+        arr = arr.combine_chunks()
+    if not pa.types.is_string(arr.type) and not pa.types.is_large_string(arr.type):
+        return pc.cast(arr, pa.float64()).fill_null(0.0).to_numpy(zero_copy_only=False)
+
+    parts = pc.extract_regex(arr, AMOUNT_PATTERN)
+    bad = pc.and_(pc.is_valid(arr), pc.is_null(parts))
+    if pc.any(bad).as_py():
+        samples = arr.filter(bad)[:5].to_pylist()
+        raise ValueError(f"无法解析的数值: {samples}")
+
+    digits = pc.replace_substring(pc.struct_field(parts, 'digits'), ',', '')
+    digits = pc.if_else(pc.equal(digits, ''), '0', digits).fill_null('0')
+    amount = pc.cast(digits, pa.float64()).to_numpy(zero_copy_only=False)
+    negative = pc.or_(
+        pc.or_(pc.equal(pc.struct_field(parts, 'paren'), '('), pc.equal(pc.struct_field(parts, 'lead'), '-')),
+        pc.equal(pc.struct_field(parts, 'trail'), '-')
+    ).fill_null(False).to_numpy(zero_copy_only=False)
+    return np.where(negative, -amount, amount) + 0.0  # "-" 记为 0 而不是 -0
+
+
+def _viterra_header(path: str) -> List[str]:
+    with open(path, 'r', encoding=VITERRA_ENCODING, newline='') as f:
+        return next(csv.reader(f), [])
+
+
+def viterra_columns(path: str) -> List[str]:
+    """清理/映射后的 Viterra 输出列 (不读数据)"""
+    names = [VITERRA_COLUMN_MAP.get(c.strip(), c.strip()) for c in _viterra_header(path)
+             if c.strip() and not c.strip().startswith('Unnamed')]
+    return [c for c in names if c not in VITERRA_DROP] + [TOTAL_EXPOSURE]
+
+
+def detect_date_format(values, formats=DATE_FORMAT_CANDIDATES) -> Optional[str]:
+    """
+    能解析全部 (非空) 值的格式; 没有任何格式适用, 或日/月先后无法区分 (如所有日都不超过 12) 时报错,
+    此时需显式指定格式。没有日期值时返回 None。
+    """
+    uniques = pd.Series(pd.unique(pd.Series(values, dtype=object).dropna()), dtype=object)
+    if uniques.empty:
+        return None
+    fits = [fmt for fmt in formats if pd.to_datetime(uniques, format=fmt, errors='coerce').notna().all()]
+    if not fits:
+        raise ValueError(f"无法识别的日期格式, 样例: {uniques[:5].tolist()}")
+    if len(fits) > 1:
+        raise ValueError(f"日期格式无法确定 ({' / '.join(fits)}), 请通过 date_formats 显式指定")
+    return fits[0]
+
+
+def viterra_date_format(path: str) -> Optional[str]:
+    """只读 Viterra 的日期列 (一遍 Arrow 流式读取), 确定该文件的日期格式"""
+    header = _viterra_header(path)
+    dates = [c for c in header if VITERRA_COLUMN_MAP.get(c.strip(), c.strip()) in DATE_COLS]
+    if not dates:
+        return None
+    table = pa_csv.read_csv(
+        path, read_options=pa_csv.ReadOptions(encoding=VITERRA_ENCODING),
+        convert_options=pa_csv.ConvertOptions(column_types={c: pa.string() for c in dates}, include_columns=dates,
+                                              null_values=[''], strings_can_be_null=True)
+    )
+    values = pa.chunked_array([pc.unique(column) for column in table.columns], pa.string())
+    return detect_date_format(pc.unique(values).to_pylist())
+
+
+def read_viterra(path: str, chunk_rows: int = CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """
+    流式读取 Viterra CSV: 所有列显式按字符串读入, 数值列用 parse_amounts 一次转换,
+    每块追加 Total Exposure。
+    """
+    header = _viterra_header(path)
+    keep = [c for c in header if c.strip() and not c.strip().startswith('Unnamed')
+            and VITERRA_COLUMN_MAP.get(c.strip(), c.strip()) not in VITERRA_DROP]
+    # 按一行约 200 字节估算块大小
+    read_options = pa_csv.ReadOptions(encoding=VITERRA_ENCODING, block_size=max(chunk_rows * 200, 1 << 20))
+    convert_options = pa_csv.ConvertOptions(
+        column_types={c: pa.string() for c in keep}, include_columns=keep,
+        null_values=[''], strings_can_be_null=True
+    )
+    reader = pa_csv.open_csv(path, read_options=read_options, convert_options=convert_options)
+
+    for batch in reader:
+        chunk = {}
+        for name, column in zip(batch.schema.names, batch.columns):
+            name = VITERRA_COLUMN_MAP.get(name.strip(), name.strip())
+            chunk[name] = parse_amounts(column) if name in NUMERIC_COLS else column.to_pandas()
+        df = pd.DataFrame(chunk)
+        df[TOTAL_EXPOSURE] = df.get('AR (Total)', 0.0) + df.get('MTM (+)', 0.0)
+        yield df
+
+
+def conform(df: pd.DataFrame, columns: List[str], date_format: Optional[str] = None) -> pd.DataFrame:
+    """
+    对齐到固定的输出列和类型 (金额 float64, 其他为字符串), 保证各块 schema 一致;
+    给出 date_format 时日期列按该源格式统一为 YYYY-MM-DD, 无法解析的日期报错。
+    """
+    df = df.reindex(columns=columns)
+    for col in columns:
+        if col in DATE_COLS and date_format is not None:
+            df[col] = normalize_dates(df[col], [date_format], strict=True).astype('string')
+        elif col in NUMERIC_COLS or col == TOTAL_EXPOSURE:
+            if not pd.api.types.is_numeric_dtype(df[col]):
+                df[col] = parse_amounts(df[col].astype('string').to_numpy(dtype=object, na_value=None))
+            df[col] = df[col].astype('float64')
+        else:
+            df[col] = df[col].astype('string')
+    return df
+
+
+def combine_exposure_files(viterra_path: str, bunge_path: str, output_path: str,
+                           chunk_rows: int = CHUNK_ROWS,
+                           progress: Optional[ProgressCallback] = None,
+                           cube_path: Optional[str] = None,
+                           date_formats: Optional[dict] = None) -> dict:
+    """
+    合并 Bunge (sheet 'data') 与 Viterra 数据并逐块写出 (.csv / .parquet / .feather)。
+    行顺序与原 pd.concat([bunge, viterra]) 相同, 列为 Bunge 列加上 Viterra 独有列;
+    内存只与 chunk_rows 有关。progress(source, rows) 在每块写出后调用。
+    给出 cube_path 时同一遍顺带累积聚合立方体 (exposure_cube) 并保存。
+    date_formats ({数据源: 格式}) 覆盖默认/检测到的日期格式。
+    """
+    start = time.time()
+    formats = {**SOURCE_DATE_FORMATS, **(date_formats or {})}
+    if 'Viterra' not in formats:
+        formats['Viterra'] = viterra_date_format(viterra_path)
+    bunge_chunks = iter_chunks(bunge_path, chunk_rows, sheet_name=BUNGE_SHEET)
+    first = next(bunge_chunks, None)
+    bunge_cols = list(first.columns) if first is not None else []
+    columns = bunge_cols + [c for c in viterra_columns(viterra_path) if c not in bunge_cols]
+    if 'Data_Source' not in columns:
+        columns.append('Data_Source')
+
+    rows = {'Bunge': 0, 'Viterra': 0}
+    cube = CubeBuilder() if cube_path else None
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with ChunkWriter(output_path, arrow_csv=True) as writer:
+        def emit(source: str, df: pd.DataFrame):
+            df['Data_Source'] = source
+            df = conform(df, columns, formats[source])
+            writer.write(df)
+            if cube is not None:
+                cube.add(df)
+            rows[source] += len(df)
+            if progress is not None:
+                progress(source, rows[source])
+
+        if first is not None:
+            emit('Bunge', first)
+            for df in bunge_chunks:
+                emit('Bunge', df)
+        for df in read_viterra(viterra_path, chunk_rows):
+            emit('Viterra', df)
+    if cube is not None:
+        cube.build().save(cube_path)
+
+    return {
+        'output_path': output_path,
+        'bunge_rows': rows['Bunge'],
+        'viterra_rows': rows['Viterra'],
+        'run_time': round(time.time() - start, 2),
+    }
@@ -1,4 +1,5 @@
 from Done.Pculator.Controller.pfe_controller import *
+from Done.Pculator.tenor import month_table
 
 month_code_map = {
     'Jan': 'F', 'Feb': 'G', 'Mar': 'H', 'Apr': 'J', 'May': 'K', 'Jun': 'M',
@@ -6,22 +7,11 @@ month_code_map = {
 }
 
 def date_transfer(start_date,num_months):
-    results = []
-    for i in range(num_months):
-        target_date = start_date + relativedelta(months=i)
-        # 得到月末
-        eomonth = (target_date.replace(day=1) + relativedelta(months=1)) - relativedelta(days=1)
-        month_str = target_date.strftime('%b-%y')  # eg: Apr-25
-        short_month = month_code_map[target_date.strftime('%b')] + target_date.strftime('%y')  # eg: J25
-        date_in_number = (eomonth - datetime(1899, 12, 30)).days  # Excel serial date
-
-        results.append({
-            'month-str': month_str,
-            'ShortMonth': short_month,
-            'date in number': date_in_number
-        })
-
-    print(pd.DataFrame(results))
+    # 月份标签 / 期货代码 / 月末 Excel 序列号, 整列计算
+    results = month_table(start_date, num_months).rename(
+        columns={'month_str': 'month-str', 'short_month': 'ShortMonth', 'date_number': 'date in number'}
+    )
+    print(results)
 
 
 def replace_space_with_underscore(text):